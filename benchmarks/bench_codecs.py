@@ -0,0 +1,112 @@
+"""
+Compares the message codecs (payload.codecs): the bytes on the wire and the CPU per message of encoding
+(publisher) and decoding the SNS envelope and the message (consumer), as a dict and as a model.
+
+Run from the project root:
+    python benchmarks/bench_codecs.py --messages 20000
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from consumer.messages import parse_messages
+from payload.codecs import codec_registry, content_type_attributes
+
+
+class BenchmarkInsight(BaseModel):
+    id: str
+    media_id: str
+    insight_engine_id: str
+    name: str
+    status: str
+    created: datetime
+    scores: List[float]
+
+
+def create_models(messages_number: int) -> List[BenchmarkInsight]:
+    start_time = datetime(2024, 1, 1)
+    return [BenchmarkInsight(id=str(uuid4()), media_id=str(uuid4()), insight_engine_id=str(uuid4()), name=f"2024-{i % 12 + 1:02d}",
+                             status="APPROVED", created=start_time + timedelta(seconds=i), scores=[i % 7 / 7, 0.5, 0.25, 1.0])
+            for i in range(messages_number)]
+
+
+def create_envelope(payload: str, attributes: dict | None, index: int) -> SimpleNamespace:
+    envelope = {
+        "Type": "Notification",
+        "MessageId": str(uuid4()),
+        "SequenceNumber": str(10000000000000000000 + index),
+        "TopicArn": "arn:aws:sns:eu-west-1:123456789012:insights.fifo",
+        "Message": payload,
+        "Timestamp": datetime.now().isoformat(),
+        "UnsubscribeURL": "https://sns.eu-west-1.amazonaws.com/?Action=Unsubscribe",
+    }
+    if attributes:
+        envelope["MessageAttributes"] = {key: {"Type": value["DataType"], "Value": value["StringValue"]} for key, value in attributes.items()}
+    return SimpleNamespace(body=json.dumps(envelope))
+
+
+def measure_cpu(function, *args, rounds=3) -> float:
+    best_cpu = float("inf")
+    for _ in range(rounds):
+        cpu_start = time.process_time()
+        function(*args)
+        best_cpu = min(best_cpu, time.process_time() - cpu_start)
+    return best_cpu
+
+
+def encode_all(codec, models):
+    return [codec.encode(model) for model in models]
+
+
+def decode_all(messages):
+    return [body.body for body in parse_messages(messages)]
+
+
+def decode_models(messages):
+    return [body.body_as(BenchmarkInsight) for body in parse_messages(messages)]
+
+
+def legacy_encode(models):
+    return [model.model_dump_json() for model in models]
+
+
+def legacy_decode(messages):
+    return [BenchmarkInsight(**json.loads(json.loads(message.body)["Message"])) for message in messages]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    models = create_models(args.messages)
+    print(f"Encoding and decoding {args.messages} messages (best of {args.rounds}), per message:")
+    legacy_payloads = legacy_encode(models)
+    legacy_messages = [create_envelope(payload, None, index) for index, payload in enumerate(legacy_payloads)]
+    legacy_encode_cpu = measure_cpu(legacy_encode, models, rounds=args.rounds)
+    legacy_decode_cpu = measure_cpu(legacy_decode, legacy_messages, rounds=args.rounds)
+    print(f"{'legacy (json.loads twice)':<26} bytes={sum(map(len, legacy_payloads))/args.messages:7.1f} "
+          f"encode={legacy_encode_cpu/args.messages*1e6:6.2f}us decode model={legacy_decode_cpu/args.messages*1e6:6.2f}us")
+    for codec_name in codec_registry.names():
+        codec = codec_registry.get(codec_name)
+        attributes = content_type_attributes(codec)
+        payloads = encode_all(codec, models)
+        messages = [create_envelope(payload, attributes, index) for index, payload in enumerate(payloads)]
+        attributes_bytes = sum(len(name) + len(value["StringValue"]) for name, value in (attributes or {}).items())
+        wire_bytes = sum(map(len, payloads))/args.messages + attributes_bytes
+        encode_cpu = measure_cpu(encode_all, codec, models, rounds=args.rounds)
+        decode_cpu = measure_cpu(decode_all, messages, rounds=args.rounds)
+        decode_model_cpu = measure_cpu(decode_models, messages, rounds=args.rounds)
+        print(f"{codec_name:<26} bytes={wire_bytes:7.1f} encode={encode_cpu/args.messages*1e6:6.2f}us "
+              f"decode dict={decode_cpu/args.messages*1e6:6.2f}us decode model={decode_model_cpu/args.messages*1e6:6.2f}us")
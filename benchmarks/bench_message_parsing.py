@@ -0,0 +1,89 @@
+"""
+Compares the CPU time of parsing SNS envelopes received from SQS:
+the original path (json.loads + SqsMessageBody(**...) + json.loads/ArnParser on every access)
+against the consumer.messages parsing layer (eager and lazy validation).
+
+Run from the project root:
+    python benchmarks/bench_message_parsing.py --messages 100000
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+
+from botocore.utils import ArnParser
+
+from consumer.messages import SqsMessageBody, parse_messages
+
+
+def create_messages(messages_number: int, topics_number: int = 5):
+    messages = []
+    for i in range(messages_number):
+        inner_message = json.dumps({"media_id": str(uuid4()), "name": f"MediaNumber{i}", "insights": ["a", "b", "c"]})
+        envelope = {
+            "Type": "Notification",
+            "MessageId": str(uuid4()),
+            "SequenceNumber": str(10000000000000000000 + i),
+            "TopicArn": f"arn:aws:sns:eu-west-1:123456789012:test_topic_{i % topics_number}.fifo",
+            "Message": inner_message,
+            "Timestamp": datetime.now().isoformat(),
+            "UnsubscribeURL": "https://sns.eu-west-1.amazonaws.com/?Action=Unsubscribe",
+        }
+        messages.append(SimpleNamespace(body=json.dumps(envelope)))
+    return messages
+
+
+def legacy_parse(messages):
+    bodies = [SqsMessageBody(**json.loads(message.body)) for message in messages]
+    for body in bodies:
+        # The original properties re-ran these on every access
+        for _ in range(2):
+            json.loads(body.Message)
+            ArnParser().parse_arn(body.TopicArn)["resource"]
+    return bodies
+
+
+def parse(messages, lazy_validation):
+    bodies = parse_messages(messages, lazy_validation=lazy_validation)
+    for body in bodies:
+        for _ in range(2):
+            body.body
+            body.topic_name
+    return bodies
+
+
+def parse_lazy_untouched(messages):
+    return parse_messages(messages, lazy_validation=True)
+
+
+def measure(name, function, *args, rounds=3):
+    best_cpu = float("inf")
+    best_wall = float("inf")
+    for _ in range(rounds):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        function(*args)
+        best_cpu = min(best_cpu, time.process_time() - cpu_start)
+        best_wall = min(best_wall, time.perf_counter() - wall_start)
+    print(f"{name:<28} cpu={best_cpu:8.3f}s wall={best_wall:8.3f}s")
+    return best_cpu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = create_messages(args.messages)
+    print(f"Parsing {args.messages} synthetic SNS envelopes (best of {args.rounds})")
+    legacy_cpu = measure("legacy", legacy_parse, messages, rounds=args.rounds)
+    eager_cpu = measure("eager", parse, messages, False, rounds=args.rounds)
+    lazy_cpu = measure("lazy (fields touched)", parse, messages, True, rounds=args.rounds)
+    untouched_cpu = measure("lazy (fields untouched)", parse_lazy_untouched, messages, rounds=args.rounds)
+    print(f"eager speedup: x{legacy_cpu/eager_cpu:.2f}, lazy untouched speedup: x{legacy_cpu/untouched_cpu:.2f}")
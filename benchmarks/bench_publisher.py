@@ -0,0 +1,67 @@
+"""
+Compares the throughput (messages per second) of PublisherService.publish (one Publish call per message)
+against PublisherService.publish_batched (PublishBatch with a linger buffer), on the local SNS stand-in
+with an injected round-trip latency.
+
+Run from the project root:
+    python benchmarks/bench_publisher.py --messages 2000 --latency-ms 5
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import time
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from fakes.broker import FakeBroker, FaultInjector
+from publisher.service import PublisherService
+
+
+class BenchmarkMessage(BaseModel):
+    media_id: str
+    name: str
+
+
+def create_publisher(latency_seconds, **kwargs):
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds=latency_seconds))
+    return PublisherService(topic_names=["bench_topic_1.fifo", "bench_topic_2.fifo"], sns_resource=broker.sns_resource(), **kwargs)
+
+
+def publish_sequential(publisher_service, messages):
+    topic_ids = list(publisher_service.topics.keys())
+    for i, message in enumerate(messages):
+        publisher_service.publish(topic_ids[i % 2], message, message.media_id)
+
+
+def publish_batched(publisher_service, messages):
+    topic_ids = list(publisher_service.topics.keys())
+    futures = [publisher_service.publish_batched(topic_ids[i % 2], message, message.media_id) for i, message in enumerate(messages)]
+    publisher_service.close()
+    for future in futures:
+        future.result()
+
+
+def measure(name, function, publisher_service, messages):
+    start = time.perf_counter()
+    function(publisher_service, messages)
+    duration = time.perf_counter() - start
+    print(f"{name:<12} {len(messages)/duration:10.0f} messages/s ({duration:.2f}s)")
+    return duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--linger-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    latency_seconds = args.latency_ms/1000
+    messages = [BenchmarkMessage(media_id=str(uuid4()), name=f"MediaNumber{i}") for i in range(args.messages)]
+    print(f"Publishing {args.messages} messages with {args.latency_ms}ms of latency per SNS call")
+    sequential_duration = measure("sequential", publish_sequential, create_publisher(latency_seconds), messages)
+    batched_duration = measure("batched", publish_batched, create_publisher(latency_seconds, batch_linger_seconds=args.linger_ms/1000), messages)
+    print(f"batched speedup: x{sequential_duration/batched_duration:.2f}")
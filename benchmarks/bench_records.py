@@ -0,0 +1,105 @@
+"""
+Compares the memory per item and the conversion time of the listen loop's batch data: pydantic models
+(InsightJob/MediaIDs, as the loop used) against the slotted records of logic.records, on top of the parsed
+Media DB response items that both keep.
+
+Uses the project_shkedia_models types when they are installed, otherwise pydantic models with the same fields.
+
+Run from the project root:
+    python benchmarks/bench_records.py --items 100000
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Optional
+from uuid import UUID, uuid4
+
+from pydantic import BaseModel
+
+from logic.records import JobRecord, MediaRecord
+
+try:
+    from project_shkedia_models.jobs import InsightJob
+    from project_shkedia_models.media import MediaIDs
+except ImportError:
+    class InsightJobStatus(Enum):
+        PENDING = "PENDING"
+        DONE = "DONE"
+
+    class InsightJob(BaseModel):
+        id: UUID
+        insight_engine_id: UUID
+        media_id: UUID
+        status: InsightJobStatus = InsightJobStatus.PENDING
+        start_time: Optional[datetime] = None
+        end_time: Optional[datetime] = None
+
+    class MediaIDs(BaseModel):
+        media_id: UUID
+        owner_id: UUID
+        name: str
+        created_on: Optional[datetime] = None
+
+
+def create_items(items_number: int):
+    engine_id = str(uuid4())
+    start_time = datetime(2024, 1, 1)
+    media_items = [{"media_id": str(uuid4()), "owner_id": str(uuid4()), "name": f"IMG_{i:07d}.jpg",
+                    "created_on": (start_time + timedelta(seconds=i)).isoformat()} for i in range(items_number)]
+    job_items = [{"id": str(uuid4()), "insight_engine_id": engine_id, "media_id": media_item["media_id"], "status": "PENDING",
+                  "start_time": start_time.isoformat(), "end_time": None} for media_item in media_items]
+    return job_items, media_items
+
+
+def measure(function, *args):
+    """
+    :return: The result, the bytes it allocated (and kept) and the duration (of a run without tracemalloc).
+    """
+    start = time.perf_counter()
+    function(*args)
+    duration = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    gc.collect()
+    allocated_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated_bytes, duration
+
+
+def load_models(job_items, media_items):
+    return [InsightJob(**item) for item in job_items], [MediaIDs(**item) for item in media_items]
+
+
+def load_records(job_items, media_items):
+    return [JobRecord.from_dict(item) for item in job_items], [MediaRecord.from_dict(item) for item in media_items]
+
+
+def dump_models(job_models):
+    return [job.model_dump(mode="json") for job in job_models]
+
+
+def dump_records(job_records):
+    return [job.to_json() for job in job_records]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    args = parser.parse_args()
+
+    job_items, media_items = create_items(args.items)
+    print(f"{args.items} jobs and media, memory per item (job + media) on top of the response items:")
+    for name, load, dump in (("pydantic models", load_models, dump_models), ("slotted records", load_records, dump_records)):
+        (loaded_jobs, loaded_media), allocated_bytes, load_duration = measure(load, job_items, media_items)
+        _, dump_duration = measure(dump, loaded_jobs)[1:]
+        print(f"{name:<16} {allocated_bytes/args.items:8.1f} bytes/item  load={load_duration/args.items*1e6:6.2f}us/item  "
+              f"dump={dump_duration/args.items*1e6:6.2f}us/item")
+        del loaded_jobs, loaded_media
@@ -0,0 +1,93 @@
+"""
+Measures the cold start of the worker, each in a fresh interpreter:
+  - imports: the cumulative import time of each module of the worker (python -X importtime)
+  - ready: the time from the interpreter start to a ready service (constructed, and its first request served)
+    against the SNS/SQS stand-in, and the time to import main (which builds nothing until main() runs)
+
+A module that can't be imported here (e.g. without the models package) is reported as skipped.
+
+Run from the project root:
+    python benchmarks/bench_startup.py --repeats 5
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+
+SRC_LOCATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+MODULES = ("config", "main", "db.service", "db.spool", "logic.service", "consumer.service", "publisher.service",
+           "publisher.outbox", "metrics.server", "profiling.profiler", "boto3", "requests", "pydantic_settings")
+
+READY_SCRIPTS = {
+    "main": "import main",
+    "consumer": """
+from fakes.broker import FakeBroker
+from consumer.service import ConsumerService
+broker = FakeBroker()
+broker.sqs_resource().create_queue(QueueName="startup_queue")
+ConsumerService(queue_name="startup_queue", listening_time_seconds=0, sqs_resource=broker.sqs_resource()).__receive_messages__()
+""",
+    "publisher": """
+from fakes.broker import FakeBroker
+from publisher.service import PublisherService
+broker = FakeBroker()
+PublisherService(topic_names=["startup_topic.fifo"], sns_resource=broker.sns_resource(), warm_start=True)
+""",
+}
+
+
+def run_python(arguments) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *arguments], capture_output=True, text=True, cwd=SRC_LOCATION)
+
+
+def import_seconds(module: str) -> float:
+    """
+    :return: The cumulative import time of the module, in a fresh interpreter.
+    """
+    completed_process = run_python(["-X", "importtime", "-c", f"import {module}"])
+    if completed_process.returncode != 0:
+        raise ImportError(completed_process.stderr.strip().splitlines()[-1])
+    for line in reversed(completed_process.stderr.splitlines()):
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise ValueError(f"No import time of {module}")
+
+
+def ready_seconds(script: str) -> float:
+    """
+    :return: The wall time of a fresh interpreter that runs the script, interpreter start included.
+    """
+    start = time.perf_counter()
+    completed_process = run_python(["-c", script])
+    duration = time.perf_counter() - start
+    if completed_process.returncode != 0:
+        raise ImportError(completed_process.stderr.strip().splitlines()[-1])
+    return duration
+
+
+def measure(function, argument, repeats: int) -> str:
+    try:
+        durations = [function(argument) for _ in range(repeats)]
+    except (ImportError, ValueError) as err:
+        return f"skipped: {err}"
+    return f"median={statistics.median(durations)*1000:8.1f}ms  max={max(durations)*1000:8.1f}ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=list(MODULES))
+    args = parser.parse_args()
+
+    print(f"interpreter  {measure(ready_seconds, 'pass', args.repeats)}")
+    print("imports:")
+    for module in args.modules:
+        print(f"  {module:<20} {measure(import_seconds, module, args.repeats)}")
+    print("ready (interpreter start included):")
+    for name, script in READY_SCRIPTS.items():
+        print(f"  {name:<20} {measure(ready_seconds, script, args.repeats)}")
@@ -0,0 +1,219 @@
+"""
+End-to-end benchmark of the worker loops, offline:
+  - engine: MonthsEngineLogics.process_batch against the Media DB stand-in (fakes.media_db)
+  - consumer: ConsumerService receive/process/ack against the SNS/SQS stand-in (fakes.broker)
+  - publisher: PublisherService.publish_batched against the SNS/SQS stand-in
+with a controlled latency per request and dataset size. The engine runs on generated media, or on a synthetic
+library file (--dataset, see generate_dataset.py) for the scale tests; it stops after --items jobs.
+
+Each scenario runs in its own process, so its peak RSS is its own. The report has the throughput (items per
+second), the p50/p99 latency of a batch and the peak RSS. Save it as a baseline and compare a later run to it:
+    python benchmarks/bench_worker.py --items 20000 --latency-ms 2 --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_worker.py --items 20000 --latency-ms 2 --baseline benchmarks/baseline.json
+The comparison exits with 1 when a throughput dropped or a p99 latency grew by more than --tolerance.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import json
+import time
+import resource
+import subprocess
+from datetime import datetime, timedelta
+from typing import List
+from uuid import uuid4
+
+SCENARIOS = ("engine", "consumer", "publisher")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered_values = sorted(values)
+    return ordered_values[min(int(fraction * len(ordered_values)), len(ordered_values) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+
+def create_report(items_number: int, duration: float, batch_latencies: List[float]) -> dict:
+    return {"items": items_number,
+            "batches": len(batch_latencies),
+            "duration_seconds": round(duration, 4),
+            "throughput_per_second": round(items_number / duration, 1) if duration > 0 else 0.0,
+            "batch_latency_p50_ms": round(percentile(batch_latencies, 0.5) * 1000, 3),
+            "batch_latency_p99_ms": round(percentile(batch_latencies, 0.99) * 1000, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def create_media_records(items_number: int) -> List[dict]:
+    start_time = datetime(2015, 1, 1)
+    return [{"media_id": str(uuid4()), "owner_id": str(uuid4()), "name": f"IMG_{i:07d}.jpg", "media_type": "IMAGE",
+             "created_on": (start_time + timedelta(hours=7 * i)).isoformat(), "uploaded_status": "UPLOADED"}
+            for i in range(items_number)]
+
+
+def run_engine(args) -> dict:
+    from fakes.broker import FaultInjector
+    from fakes.dataset import MmapDataset
+    from fakes.media_db import FakeMediaDBService, DatasetMediaDBService
+    from logic.service import MonthsEngineLogics
+    from project_shkedia_models import insights
+
+    class BenchmarkEngineLogics(MonthsEngineLogics):
+        def __extract_insights_logics__(self, job_id, media_item):
+            return [insights.Insight(insight_engine_id=self.engine.id, media_id=media_item.media_id, name="benchmark",
+                                     job_id=job_id, status=insights.InsightStatusEnum.APPROVED)]
+
+    engine_details = insights.InsightEngine(name="months-benchmark")
+    fault_injector = FaultInjector(latency_seconds=args.latency_ms / 1000)
+    if args.dataset:
+        media_db = DatasetMediaDBService(engine=engine_details.model_dump(mode="json"), dataset=MmapDataset(args.dataset, str(engine_details.id)),
+                                         fault_injector=fault_injector)
+    else:
+        media_db = FakeMediaDBService(engine=engine_details.model_dump(mode="json"), media_records=create_media_records(args.items),
+                                      fault_injector=fault_injector)
+    engine_logics = BenchmarkEngineLogics(media_db, engine_details, batch_process_size=args.batch_size)
+    batch_latencies = []
+    processed_number = 0
+    start = time.perf_counter()
+    while processed_number < args.items:
+        batch_start = time.perf_counter()
+        batch_processed_number = engine_logics.process_batch()
+        if batch_processed_number == 0:
+            break
+        batch_latencies.append(time.perf_counter() - batch_start)
+        processed_number += batch_processed_number
+    return create_report(processed_number, time.perf_counter() - start, batch_latencies)
+
+
+def run_consumer(args) -> dict:
+    from fakes.broker import FakeBroker, FaultInjector
+    from consumer.service import ConsumerService
+
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds=args.latency_ms / 1000))
+    consumer_service = ConsumerService(queue_name="bench_queue", listening_time_seconds=0, sqs_resource=broker.sqs_resource())
+    queue_state = broker.get_queue("bench_queue")
+    for i in range(args.items):
+        envelope = {"Type": "Notification", "MessageId": str(uuid4()), "SequenceNumber": str(i),
+                    "TopicArn": "arn:aws:sns:us-east-1:000000000000:bench_topic.fifo",
+                    "Message": json.dumps({"media_id": str(uuid4()), "name": f"2024-{i % 12 + 1:02d}"}),
+                    "Timestamp": datetime.now().isoformat(), "UnsubscribeURL": "https://sns.us-east-1.amazonaws.com/"}
+        # Filled directly, without the injected latency of SendMessage
+        with broker.condition:
+            queue_state.append(json.dumps(envelope))
+    consumed_number = 0
+    consumer_service.add_messages_callback(lambda messages_bodies: [message_body.body for message_body in messages_bodies])
+    batch_latencies = []
+    start = time.perf_counter()
+    while True:
+        batch_start = time.perf_counter()
+        messages = consumer_service.__receive_messages__()
+        if not messages:
+            break
+        consumer_service.__process_messages__(messages)
+        batch_latencies.append(time.perf_counter() - batch_start)
+        consumed_number += len(messages)
+    return create_report(consumed_number, time.perf_counter() - start, batch_latencies)
+
+
+def run_publisher(args) -> dict:
+    from fakes.broker import FakeBroker, FaultInjector
+    from publisher.service import PublisherService
+
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds=args.latency_ms / 1000))
+    publisher_service = PublisherService(topic_names=["bench_topic.fifo"], sns_resource=broker.sns_resource(), batch_linger_seconds=0.01)
+    messages = [{"media_id": str(uuid4()), "name": f"2024-{i % 12 + 1:02d}"} for i in range(args.items)]
+    batch_latencies = []
+    start = time.perf_counter()
+    for batch_start_index in range(0, len(messages), 10):
+        batch_start = time.perf_counter()
+        futures = [publisher_service.publish_batched("bench_topic.fifo", message, message["media_id"], grouping_key=message["media_id"])
+                   for message in messages[batch_start_index:batch_start_index + 10]]
+        for future in futures:
+            future.result()
+        batch_latencies.append(time.perf_counter() - batch_start)
+    duration = time.perf_counter() - start
+    publisher_service.close()
+    return create_report(len(messages), duration, batch_latencies)
+
+
+def run_scenario_process(scenario: str, args) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--run-scenario", scenario,
+               "--items", str(args.items), "--batch-size", str(args.batch_size), "--latency-ms", str(args.latency_ms)]
+    if args.dataset:
+        command += ["--dataset", args.dataset]
+    completed_process = subprocess.run(command, capture_output=True, text=True)
+    if completed_process.returncode != 0:
+        error_lines = completed_process.stderr.strip().splitlines()
+        return {"skipped": error_lines[-1] if error_lines else f"exit code {completed_process.returncode}"}
+    return json.loads(completed_process.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    :return: The regressions of the results against the baseline.
+    """
+    regressions = []
+    for scenario, report in results["scenarios"].items():
+        baseline_report = baseline["scenarios"].get(scenario, {})
+        if "skipped" in report or "skipped" in baseline_report or not baseline_report:
+            continue
+        if report["throughput_per_second"] < baseline_report["throughput_per_second"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {report['throughput_per_second']}/s < baseline {baseline_report['throughput_per_second']}/s")
+        if report["batch_latency_p99_ms"] > baseline_report["batch_latency_p99_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p99 {report['batch_latency_p99_ms']}ms > baseline {baseline_report['batch_latency_p99_ms']}ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=2)
+    parser.add_argument("--dataset", help="Run the engine scenario on this synthetic library (see generate_dataset.py)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        scenario_function = {"engine": run_engine, "consumer": run_consumer, "publisher": run_publisher}[args.run_scenario]
+        print(json.dumps(scenario_function(args)))
+        sys.exit(0)
+
+    results = {"commit": git_commit(),
+               "created": datetime.now().isoformat(),
+               "parameters": {"items": args.items, "batch_size": args.batch_size, "latency_ms": args.latency_ms, "dataset": args.dataset},
+               "scenarios": {}}
+    for scenario in args.scenarios:
+        report = run_scenario_process(scenario, args)
+        results["scenarios"][scenario] = report
+        if "skipped" in report:
+            print(f"{scenario:<10} skipped: {report['skipped']}")
+        else:
+            print(f"{scenario:<10} {report['throughput_per_second']:10.1f} items/s  p50={report['batch_latency_p50_ms']:8.2f}ms "
+                  f"p99={report['batch_latency_p99_ms']:8.2f}ms  peak RSS={report['peak_rss_mb']:.1f}MB")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,45 @@
+"""
+Generates a synthetic media library (see fakes.dataset) for the scale tests and the benchmarks, e.g. 1M photos
+of 5000 users:
+    python benchmarks/generate_dataset.py /tmp/library.bin --media 1000000 --users 5000 --user-skew 1.2
+The engine scenario of bench_worker.py runs against it with --dataset /tmp/library.bin.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import argparse
+import time
+from collections import Counter
+
+from fakes.dataset import generate_dataset, MmapDataset, NO_JOB, PENDING_JOB, DONE_JOB
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("location")
+    parser.add_argument("--media", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--user-skew", type=float, default=1.1)
+    parser.add_argument("--start-year", type=int, default=2005)
+    parser.add_argument("--end-year", type=int, default=2024)
+    parser.add_argument("--missing-metadata-rate", type=float, default=0.05)
+    parser.add_argument("--pending-jobs-rate", type=float, default=0.1)
+    parser.add_argument("--done-jobs-rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_dataset(args.location, args.media, users_number=args.users, user_skew=args.user_skew,
+                     start_year=args.start_year, end_year=args.end_year, missing_metadata_rate=args.missing_metadata_rate,
+                     pending_jobs_rate=args.pending_jobs_rate, done_jobs_rate=args.done_jobs_rate, random_seed=args.seed)
+    duration = time.perf_counter() - start
+    dataset = MmapDataset(args.location)
+    job_statuses = dataset.job_statuses()
+    print(f"Wrote {len(dataset)} media of {dataset.users_number} users to {args.location} "
+          f"({os.path.getsize(args.location)/2**20:.1f}MB) in {duration:.1f}s")
+    print(f"Jobs: {job_statuses.count(PENDING_JOB)} pending, {job_statuses.count(DONE_JOB)} done, {job_statuses.count(NO_JOB)} media without a job")
+    sample_owners = Counter(dataset.media_record(index)["owner_id"] for index in range(0, len(dataset), max(len(dataset) // 10000, 1)))
+    top_owners_share = sum(count for _, count in sample_owners.most_common(max(dataset.users_number // 100, 1))) / sum(sample_owners.values())
+    print(f"The top 1% of the users own {top_owners_share:.0%} of the media")
+    dataset.close()
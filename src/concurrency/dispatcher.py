@@ -0,0 +1,115 @@
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Tuple
+
+
+class GroupOrderedDispatcher:
+    """
+    Runs tasks on a worker pool while keeping strict ordering within a group (e.g. the FIFO MessageGroupId).
+    Tasks of different groups run in parallel, tasks of the same group run one after the other.
+
+    When a task fails, the tasks already queued for its group are cancelled (their cancel function is called
+    instead of the task), so a later message of the group is never processed before an earlier one.
+
+    :param max_workers: The number of worker threads.
+    :param max_pending_tasks: The number of submitted tasks that were not finished yet above which
+                              wait_for_capacity blocks. Defaults to twice the number of workers.
+    :param thread_name_prefix: The name prefix of the worker threads.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 max_pending_tasks: int | None = None,
+                 thread_name_prefix: str = "group-dispatcher") -> None:
+        self.max_workers = max_workers
+        self.max_pending_tasks = max_pending_tasks if max_pending_tasks else max_workers*2
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.condition = threading.Condition()
+        self.pending_tasks = 0
+        self.group_queues: Dict[str, Deque[Tuple[Callable, Callable | None]]] = {}
+        self.errors: List[Exception] = []
+
+    def submit(self, group_id: str, task: Callable[[], None], cancel_task: Callable[[], None] | None = None):
+        """
+        Queues a task for a group. Doesn't block; use wait_for_capacity before fetching more work.
+
+        :param group_id: The ordering key of the task.
+        :param task: The function to run.
+        :param cancel_task: The function to run instead of the task if an earlier task of the group failed.
+        """
+        with self.condition:
+            self.pending_tasks += 1
+            group_queue = self.group_queues.get(group_id)
+            if group_queue is not None:
+                group_queue.append((task, cancel_task))
+                return
+            self.group_queues[group_id] = deque()
+        self.executor.submit(self.__run_group_task__, group_id, task)
+
+    def __run_group_task__(self, group_id, task):
+        try:
+            task()
+        except Exception as err:
+            logger.exception(f"Task of group {group_id} failed")
+            self.__cancel_group__(group_id)
+            with self.condition:
+                self.errors.append(err)
+        finally:
+            self.__task_done__()
+        with self.condition:
+            group_queue = self.group_queues[group_id]
+            if not group_queue:
+                del self.group_queues[group_id]
+                return
+            next_task, _ = group_queue.popleft()
+        # Resubmit instead of looping, so a busy group doesn't keep the worker from other groups
+        self.executor.submit(self.__run_group_task__, group_id, next_task)
+
+    def __cancel_group__(self, group_id):
+        with self.condition:
+            cancelled_tasks = list(self.group_queues[group_id])
+            self.group_queues[group_id].clear()
+        for _, cancel_task in cancelled_tasks:
+            try:
+                if cancel_task is not None:
+                    cancel_task()
+            except Exception:
+                logger.exception(f"Failed to cancel a task of group {group_id}")
+            finally:
+                self.__task_done__()
+
+    def __task_done__(self):
+        with self.condition:
+            self.pending_tasks -= 1
+            self.condition.notify_all()
+
+    def wait_for_capacity(self, timeout: float | None = None) -> bool:
+        """
+        Blocks while the workers are saturated (backpressure).
+
+        :return: True if there is capacity, False if the timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending_tasks < self.max_pending_tasks, timeout=timeout)
+
+    def raise_errors(self):
+        """
+        Raises the first error of the failed tasks since the last call, if any.
+        """
+        with self.condition:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise errors[0]
+
+    def shutdown(self, wait: bool = True, timeout: float | None = None):
+        """
+        Stops accepting tasks. When wait is True, waits until the pending tasks are finished.
+        """
+        if wait:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_tasks == 0, timeout=timeout)
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+import time
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from metrics.registry import metrics_registry
+
+limiter_rate = metrics_registry.gauge("shkedia_worker_rate_limit", "The current rate limit (requests per second) of each limiter", ("limiter",))
+limiter_throttled = metrics_registry.counter("shkedia_worker_rate_limit_throttled_total", "Throttling responses (429/503) seen by each limiter", ("limiter",))
+limiter_wait_seconds = metrics_registry.histogram("shkedia_worker_rate_limit_wait_seconds", "Time waited for the rate limit and the concurrency cap", ("limiter",))
+
+THROTTLING_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket: tokens are added at rate per second up to capacity, and each operation takes tokens.
+
+    :param rate: The tokens added per second.
+    :param capacity: The maximal number of tokens (the burst). Defaults to one second of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __refill__(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Takes the tokens if they are available.
+
+        :return: 0 if the tokens were taken, otherwise the seconds until they will be available.
+        """
+        with self.lock:
+            self.__refill__(time.monotonic())
+            # More tokens than the capacity are taken when the bucket is full, otherwise they would never be
+            if self.tokens >= min(tokens, self.capacity):
+                self.tokens -= tokens
+                return 0.0
+            return (min(tokens, self.capacity) - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1, timeout: float | None = None) -> bool:
+        """
+        Waits until the tokens are available and takes them.
+
+        :return: False if they were not available within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_seconds = self.try_acquire(tokens)
+            if wait_seconds == 0:
+                return True
+            if deadline is not None:
+                remaining_seconds = deadline - time.monotonic()
+                if remaining_seconds < wait_seconds:
+                    return False
+            time.sleep(wait_seconds)
+
+    def set_rate(self, rate: float, capacity: float | None = None):
+        with self.lock:
+            self.__refill__(time.monotonic())
+            self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self.tokens = min(self.tokens, capacity)
+
+    def drain(self):
+        with self.lock:
+            self.tokens = 0.0
+            self.updated_at = time.monotonic()
+
+
+def parse_retry_after(retry_after: str | None) -> float | None:
+    """
+    :return: The seconds of a Retry-After header (seconds or an HTTP date), None if missing or invalid.
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Limits the rate and the concurrency of the requests to a service, and adapts the rate to its throttling (AIMD):
+    a throttling response (429/503) halves the rate (at most once per decrease_cooldown_seconds, as the concurrent
+    requests are throttled together) and pauses the requests for its Retry-After. The rate then grows back linearly,
+    to max_rate within recovery_seconds, while the requests succeed. So the replicas settle around the rate the
+    service sustains instead of swinging between overload and backoff.
+
+    :param name: The label of the metrics.
+    :param max_rate: The maximal requests per second.
+    :param max_concurrency: The maximal requests in flight, unlimited if not set.
+    :param min_rate: The minimal rate after decreases, a twentieth of max_rate by default.
+    :param decrease_factor: The rate is multiplied by it on throttling.
+    :param recovery_seconds: The time to grow from min_rate back to max_rate.
+    :param max_retry_after_seconds: The longest pause of a Retry-After.
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_rate: float,
+                 max_concurrency: int | None = None,
+                 min_rate: float | None = None,
+                 decrease_factor: float = 0.5,
+                 recovery_seconds: float = 30,
+                 decrease_cooldown_seconds: float = 1,
+                 max_retry_after_seconds: float = 60) -> None:
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate if min_rate is not None else max_rate / 20
+        self.decrease_factor = decrease_factor
+        self.recovery_seconds = recovery_seconds
+        self.decrease_cooldown_seconds = decrease_cooldown_seconds
+        self.max_retry_after_seconds = max_retry_after_seconds
+        self.rate = max_rate
+        self.bucket = TokenBucket(max_rate)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.last_decrease = float("-inf")
+        self.last_increase = time.monotonic()
+        limiter_rate.labels(name).set(max_rate)
+
+    @contextmanager
+    def limit(self):
+        """
+        Waits for the pause, a token and a concurrency slot, for the duration of a request.
+        """
+        wait_start = time.monotonic()
+        pause_seconds = self.paused_until - wait_start
+        if pause_seconds > 0:
+            time.sleep(pause_seconds)
+        self.bucket.acquire()
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        limiter_wait_seconds.labels(self.name).observe(time.monotonic() - wait_start)
+        try:
+            yield
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def __set_rate__(self, rate: float):
+        self.rate = rate
+        # The burst follows the rate, so a decreased rate isn't exceeded by the burst of the maximal rate
+        self.bucket.set_rate(rate, capacity=max(rate, 1.0))
+        limiter_rate.labels(self.name).set(rate)
+
+    def on_response(self, status_code: int | None, retry_after: str | None = None):
+        """
+        Adapts the rate to the response of a request.
+
+        :param status_code: None if the request failed without a response.
+        :param retry_after: The Retry-After header of the response.
+        """
+        now = time.monotonic()
+        if status_code in THROTTLING_STATUS_CODES:
+            limiter_throttled.labels(self.name).inc()
+            with self.lock:
+                retry_after_seconds = parse_retry_after(retry_after)
+                if retry_after_seconds is not None:
+                    self.paused_until = max(self.paused_until, now + min(retry_after_seconds, self.max_retry_after_seconds))
+                if now - self.last_decrease < self.decrease_cooldown_seconds:
+                    return
+                self.last_decrease = self.last_increase = now
+                self.__set_rate__(max(self.min_rate, self.rate * self.decrease_factor))
+                self.bucket.drain()
+            logger.warning(f"{self.name} is throttled ({status_code}), decreased the rate to {self.rate:.1f}/s")
+        elif status_code is not None and status_code < 500 and self.rate < self.max_rate:
+            with self.lock:
+                increase = (self.max_rate - self.min_rate) * (now - self.last_increase) / self.recovery_seconds
+                self.last_increase = now
+                self.__set_rate__(min(self.max_rate, self.rate + increase))
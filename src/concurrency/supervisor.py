@@ -0,0 +1,155 @@
+import os
+import time
+import signal
+import multiprocessing
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import Callable, Iterable, List
+
+from metrics.registry import metrics_registry
+
+worker_restarts = metrics_registry.counter("shkedia_worker_supervisor_restarts_total", "Restarts of the worker processes that exited", ("worker",))
+
+TERMINATION_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def run_worker(target: Callable[[int], None], index: int, forwarded_signals: tuple):
+    # The forked worker inherits the handlers of the supervisor. SIGINT (e.g. Ctrl+C, sent to the whole process
+    # group) is ignored: the supervisor drains the workers with SIGTERM
+    for signal_number in (signal.SIGTERM,) + forwarded_signals:
+        signal.signal(signal_number, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(index)
+
+
+class WorkerSlot:
+    __slots__ = ("index", "process", "started_at", "failures", "restart_at")
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.process: multiprocessing.Process | None = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at: float | None = None
+
+
+class WorkerSupervisor:
+    """
+    Pre-forks worker processes that run the same loop, restarts the ones that exit (with an exponential backoff, so
+    a worker that fails on start doesn't spin) and forwards the signals to them. On SIGTERM or SIGINT the workers get
+    SIGTERM to drain their loop, and are killed if they didn't exit within stop_timeout_seconds.
+
+    :param target: The loop of a worker, called in the worker process with the index of the worker. It should
+                   install its own SIGTERM handler to drain (the handlers of the supervisor are reset in the workers).
+    :param workers_number: The number of worker processes, the number of CPUs by default.
+    :param restart_backoff_seconds: The delay before the first restart of a worker; doubled on every restart.
+    :param max_restart_backoff_seconds: The maximal delay before a restart.
+    :param stable_seconds: A worker that ran at least this long is restarted without delay.
+    :param stop_timeout_seconds: The time the workers have to drain after SIGTERM.
+    :param forwarded_signals: Other signals sent to all the workers (e.g. the profiling signal).
+    :param start_method: The multiprocessing start method. fork (pre-forking) where available.
+    """
+
+    def __init__(self,
+                 target: Callable[[int], None],
+                 workers_number: int | None = None,
+                 restart_backoff_seconds: float = 1,
+                 max_restart_backoff_seconds: float = 60,
+                 stable_seconds: float = 60,
+                 stop_timeout_seconds: float = 30,
+                 forwarded_signals: Iterable[signal.Signals] = (),
+                 start_method: str | None = None) -> None:
+        self.target = target
+        self.workers_number = workers_number if workers_number else os.cpu_count() or 1
+        self.restart_backoff_seconds = restart_backoff_seconds
+        self.max_restart_backoff_seconds = max_restart_backoff_seconds
+        self.stable_seconds = stable_seconds
+        self.stop_timeout_seconds = stop_timeout_seconds
+        self.forwarded_signals = tuple(forwarded_signals)
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        self.slots: List[WorkerSlot] = [WorkerSlot(index) for index in range(self.workers_number)]
+        self.stopping = False
+
+    def __start_worker__(self, slot: WorkerSlot):
+        slot.process = self.context.Process(target=run_worker, args=(self.target, slot.index, self.forwarded_signals), name=f"worker-{slot.index}")
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+        logger.info(f"Started worker {slot.index} (pid {slot.process.pid})")
+
+    def start(self):
+        for slot in self.slots:
+            self.__start_worker__(slot)
+
+    def __schedule_restart__(self, slot: WorkerSlot, now: float):
+        if now - slot.started_at >= self.stable_seconds:
+            slot.failures = 0
+        delay = 0.0 if slot.failures == 0 else min(self.restart_backoff_seconds * 2 ** (slot.failures - 1), self.max_restart_backoff_seconds)
+        slot.failures += 1
+        slot.restart_at = now + delay
+        logger.warning(f"Worker {slot.index} exited with code {slot.process.exitcode}, restarting in {delay:.1f}s")
+
+    def monitor_once(self):
+        """
+        Restarts the workers that exited, when their backoff elapsed.
+        """
+        now = time.monotonic()
+        for slot in self.slots:
+            if self.stopping or slot.process is None or slot.process.is_alive():
+                continue
+            if slot.restart_at is None:
+                slot.process.join()
+                self.__schedule_restart__(slot, now)
+            if slot.restart_at <= now:
+                worker_restarts.labels(str(slot.index)).inc()
+                self.__start_worker__(slot)
+
+    def alive_workers(self) -> List[multiprocessing.Process]:
+        return [slot.process for slot in self.slots if slot.process is not None and slot.process.is_alive()]
+
+    def send_signal(self, signal_number: int):
+        for process in self.alive_workers():
+            try:
+                os.kill(process.pid, signal_number)
+            except ProcessLookupError:
+                pass
+
+    def __handle_signal__(self, signal_number, frame):
+        if signal_number in TERMINATION_SIGNALS:
+            self.stopping = True
+        else:
+            self.send_signal(signal_number)
+
+    def install_signal_handlers(self):
+        for signal_number in TERMINATION_SIGNALS + self.forwarded_signals:
+            signal.signal(signal_number, self.__handle_signal__)
+
+    def stop(self):
+        """
+        Sends SIGTERM to the workers and waits for them to drain; kills the ones still running after the timeout.
+        """
+        self.stopping = True
+        self.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.stop_timeout_seconds
+        for process in self.alive_workers():
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in self.alive_workers():
+            logger.warning(f"Worker {process.name} didn't stop in {self.stop_timeout_seconds}s, killing it")
+            process.kill()
+            process.join()
+
+    def run(self, poll_interval_seconds: float = 0.5):
+        """
+        Starts the workers and supervises them until SIGTERM or SIGINT.
+        """
+        self.install_signal_handlers()
+        self.start()
+        try:
+            while not self.stopping:
+                self.monitor_once()
+                time.sleep(poll_interval_seconds)
+        finally:
+            self.stop()
@@ -1,4 +1,4 @@
-from typing import ClassVar
+from typing import ClassVar, Dict, List
 import os
 import logging
 logging.basicConfig(format='%(asctime)s.%(msecs)05d | %(levelname)s | %(filename)s:%(lineno)d | %(message)s' , datefmt='%FY%T')
@@ -25,6 +25,12 @@ class ApplicationConfiguration(BaseSettings):
     # DB Configuration values
     MEDIA_DB_HOST: str = "10.0.0.5"
     MEDIA_DB_PORT: str = "4431"
+    # The Media DB requests per second of a replica (shared by the processes of the supervisor), by endpoint class.
+    # The rate adapts to the throttling (429) of the Media DB. Not limited if not set
+    MEDIA_DB_SEARCH_RATE: float | None = None
+    MEDIA_DB_SEARCH_CONCURRENCY: int | None = None # The search requests in flight of a process, with MEDIA_DB_SEARCH_RATE
+    MEDIA_DB_WRITE_RATE: float | None = None
+    MEDIA_DB_WRITE_CONCURRENCY: int | None = None # The bulk write requests in flight of a process, with MEDIA_DB_WRITE_RATE
     MEDIA_REPO_HOST: str = "10.0.0.5"
     MEDIA_REPO_PORT: str = "4432"
     USER_DB_HOST: str = "10.0.0.5"
@@ -36,10 +42,53 @@ class ApplicationConfiguration(BaseSettings):
 
     # Worker Configuration Values
     ENGINE_DETAILS: InsightEngine
+    ENGINES_DETAILS: List[InsightEngine] = [] # The engines of a multi-engine worker (they share the media fetches). ENGINE_DETAILS alone if empty
+    ENGINES_WEIGHTS: Dict[str, float] = {} # The scheduling weight by engine name of a multi-engine worker, 1 if missing
     
     BATCH_SIZE: int = 100
     BATCH_PROCESS_PERIOD_MIN: float = 30
 
+    WRITE_SPOOL_LOCATION: str | None = None # The SQLite file of the Media DB write spool. Writes go directly to the Media DB if not set
+
+    # Supervisor Configuration Values (python main.py supervise)
+    WORKERS_NUMBER: int | None = None # The number of worker processes. The number of CPUs if not set
+    WORKERS_RESTART_BACKOFF_SECONDS: float = 1
+    WORKERS_MAX_RESTART_BACKOFF_SECONDS: float = 60
+    WORKERS_STOP_TIMEOUT_SECONDS: float = 30 # The time the workers have to finish their batch after SIGTERM
+
+    # Priority Scheduling Configuration Values
+    PRIORITY_SCHEDULING: bool = False # Pick the batches by priority class and fairly between users, see logic.scheduling
+    PRIORITY_WEIGHTS: Dict[str, float] = {} # The weight by priority class (fresh_upload, reprocess, backfill), the defaults if missing
+    PRIORITY_FRESH_UPLOAD_HOURS: float = 24
+    PRIORITY_LOOKAHEAD: int = 4 # The window of the backlog the batch is picked from (after the fresh items), in batches
+    PRIORITY_UPLOAD_TIME_FIELD: str = "created_on" # The field of the media with the upload time
+
+    # Sharding Configuration Values
+    SHARD_COUNT: int = 1 # The number of replicas that split the media between them, see logic.sharding. Disabled if 1
+    SHARD_INDEX: int | None = None # The shard of this replica. Discovered from the host name ordinal (worker-3) if not set
+    SHARD_VIRTUAL_NODES: int = 128
+    SHARD_MAX_PAGE_SIZE: int | None = 1000 # The largest page a shard requests. Every shard reads a page of all the shards, see logic.sharding
+
+    # Monitoring Configuration Values
+    METRICS_PORT: int | None = None # The port of the Prometheus metrics endpoint (GET /metrics). Disabled if not set
+    METRICS_HOST: str = "0.0.0.0"
+
+    # Profiling Configuration Values
+    PROFILING_ENABLED: bool = False # Profile from the start. Otherwise send PROFILING_SIGNAL to toggle profiling
+    PROFILING_SIGNAL: str | None = "SIGUSR1"
+    PROFILING_OUTPUT_DIRECTORY: str = "/temp/profiling"
+    PROFILING_SAMPLING_INTERVAL_SECONDS: float = 0.01
+    PROFILING_SNAPSHOT_PERIOD_SECONDS: float = 60
+    PROFILING_TOP_ALLOCATIONS: int = 25 # The allocation sites in each tracemalloc dump. 0 disables tracemalloc
+
+    # Events Configuration Values
+    OUTBOX_LOCATION: str | None = None # The SQLite file of the insight-created events outbox. Disabled if not set
+    INSIGHTS_TOPIC_NAME: str = "insights-created.fifo"
+
+    # Payload Configuration Values
+    PAYLOAD_BLOB_STORE_LOCATION: str | None = None # The directory of the offloaded payloads (shared by all the workers)
+    PAYLOAD_BLOB_TTL_SECONDS: float = 14*24*3600
+
     logger: ClassVar[logging.Logger]= logging.getLogger()
 
 
@@ -0,0 +1,149 @@
+import time
+import sqlite3
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import OrderedDict
+from typing import Iterable, List
+
+from .messages import LazySqsMessageBody
+
+
+class SqliteDeduplicationStore:
+    """
+    Persistent backing for MessageDeduplicationCache, so duplicates are still detected after a restart.
+    """
+
+    def __init__(self, database_location: str) -> None:
+        self.database_location = database_location
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_location, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS processed_messages (message_key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        self.connection.commit()
+
+    def get_expiration(self, message_key: str) -> float | None:
+        with self.lock:
+            row = self.connection.execute("SELECT expires_at FROM processed_messages WHERE message_key=?", (message_key,)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, message_keys: List[str], expires_at: float):
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO processed_messages (message_key, expires_at) VALUES (?, ?)",
+                                        [(message_key, expires_at) for message_key in message_keys])
+            self.connection.commit()
+
+    def delete_expired(self, now: float | None = None):
+        now = now if now else time.time()
+        with self.lock:
+            self.connection.execute("DELETE FROM processed_messages WHERE expires_at<=?", (now,))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MessageDeduplicationCache:
+    """
+    Bounded, TTL-evicted set of the keys of already processed messages.
+
+    :param max_size: The maximum number of keys kept in memory. The oldest keys are evicted first.
+    :param ttl_seconds: How long a processed key is remembered.
+    :param key_field: The SqsMessageBody field used as the key (MessageId or SequenceNumber).
+    :param backing_store: Optional persistent store (e.g. SqliteDeduplicationStore) consulted on memory misses.
+    """
+
+    KEY_FIELDS = ("MessageId", "SequenceNumber")
+
+    def __init__(self,
+                 max_size: int = 100000,
+                 ttl_seconds: float = 3600,
+                 key_field: str = "MessageId",
+                 backing_store: SqliteDeduplicationStore | None = None) -> None:
+        if key_field not in self.KEY_FIELDS:
+            raise ValueError(f"key_field must be one of {self.KEY_FIELDS}")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.key_field = key_field
+        self.backing_store = backing_store
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.backing_store is not None:
+            self.backing_store.delete_expired()
+
+    def message_key(self, message_body) -> str:
+        if isinstance(message_body, LazySqsMessageBody):
+            # Avoid validating the whole envelope just to get the key
+            return str(message_body.raw[self.key_field])
+        return str(getattr(message_body, self.key_field))
+
+    def __evict__(self, now: float):
+        while self.entries:
+            _, expires_at = next(iter(self.entries.items()))
+            if expires_at > now and len(self.entries) <= self.max_size:
+                break
+            self.entries.popitem(last=False)
+
+    def __contains_key__(self, message_key: str, now: float) -> bool:
+        expires_at = self.entries.get(message_key)
+        if expires_at is None and self.backing_store is not None:
+            expires_at = self.backing_store.get_expiration(message_key)
+            if expires_at is not None and expires_at > now:
+                self.entries[message_key] = expires_at
+        return expires_at is not None and expires_at > now
+
+    def is_duplicate(self, message_body) -> bool:
+        return len(self.filter_new([message_body])) == 0
+
+    def filter_new(self, messages_bodies: Iterable) -> List:
+        """
+        Drops the messages that were already processed (or appear twice in the batch).
+
+        :param messages_bodies: The parsed message bodies.
+        :return: The bodies that were not seen before, in their original order.
+        """
+        now = time.time()
+        new_messages = []
+        batch_keys = set()
+        with self.lock:
+            self.__evict__(now)
+            for message_body in messages_bodies:
+                message_key = self.message_key(message_body)
+                if message_key in batch_keys or self.__contains_key__(message_key, now):
+                    self.hits += 1
+                    logger.debug(f"Dropped duplicate message {message_key}")
+                    continue
+                self.misses += 1
+                batch_keys.add(message_key)
+                new_messages.append(message_body)
+        return new_messages
+
+    def mark_processed(self, messages_bodies: Iterable):
+        """
+        Remembers the messages as processed. Call it only after the callbacks succeeded,
+        so nacked messages are processed again when they are redelivered.
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        message_keys = [self.message_key(message_body) for message_body in messages_bodies]
+        with self.lock:
+            for message_key in message_keys:
+                self.entries[message_key] = expires_at
+                self.entries.move_to_end(message_key)
+            self.__evict__(now)
+        if self.backing_store is not None and message_keys:
+            self.backing_store.put_many(message_keys, expires_at)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate}
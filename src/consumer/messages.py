@@ -0,0 +1,125 @@
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+from functools import cached_property, lru_cache
+from typing import Any, Dict, List
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from payload.claim_check import unwrap_payload
+from payload.codecs import codec_registry, CONTENT_TYPE_ATTRIBUTE
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+
+@lru_cache(maxsize=1024)
+def topic_name_from_arn(topic_arn: str) -> str:
+    """
+    Returns the resource part of an SNS topic ARN (arn:partition:sns:region:account:name).
+
+    Same result as botocore's ArnParser, without building a parser per call.
+    """
+    arn_parts = topic_arn.split(":", 5)
+    if len(arn_parts) < 6 or arn_parts[0] != "arn":
+        raise ValueError(f"Provided ARN: {topic_arn} must be of the format: arn:partition:service:region:account:resource")
+    return arn_parts[5]
+
+
+class SqsMessageBody(BaseModel):
+    Type: str
+    MessageId: str
+    SequenceNumber: int
+    TopicArn: str
+    Message: str
+    Timestamp: datetime
+    UnsubscribeURL: str
+    MessageAttributes: Dict[str, Any] | None = None
+
+    @cached_property
+    def topic_name(self):
+        return topic_name_from_arn(self.TopicArn)
+
+    @cached_property
+    def codec(self):
+        """
+        The codec the message was published with, named by its content_type attribute (JSON without it).
+        """
+        content_type = (self.MessageAttributes or {}).get(CONTENT_TYPE_ATTRIBUTE)
+        return codec_registry.get(content_type["Value"] if content_type else None)
+
+    @cached_property
+    def payload(self) -> str:
+        # Compressed or offloaded by the publisher's PayloadCodec
+        return unwrap_payload(self.Message)
+
+    @cached_property
+    def body(self):
+        try:
+            return self.codec.decode(self.payload)
+        except ValueError:
+            return self.payload
+
+    def body_as(self, model_class):
+        """
+        Decodes the message into a pydantic model, without an intermediate dict for the JSON codec.
+        """
+        return self.codec.decode_model(self.payload, model_class)
+
+
+class LazySqsMessageBody:
+    """
+    Holds the decoded SNS envelope and validates it into SqsMessageBody only when
+    a field is first accessed.
+    """
+    __slots__ = ("raw", "_model")
+
+    def __init__(self, raw: dict) -> None:
+        self.raw = raw
+        self._model = None
+
+    @property
+    def model(self) -> SqsMessageBody:
+        if self._model is None:
+            self._model = SqsMessageBody.model_validate(self.raw)
+        return self._model
+
+    def __getattr__(self, name: str) -> Any:
+        # Called only for names that are not slots, so every field goes through validation
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def __repr__(self) -> str:
+        return f"LazySqsMessageBody(MessageId={self.raw.get('MessageId')!r})"
+
+
+def parse_message_body(raw_body: str | bytes, lazy_validation: bool = False) -> SqsMessageBody | LazySqsMessageBody:
+    """
+    Parses the body of an SQS message delivered by an SNS subscription.
+
+    :param raw_body: The SQS message body (the SNS envelope as JSON).
+    :param lazy_validation: When True, only decode the JSON and defer the pydantic
+                            validation until a callback touches a field.
+    :return: The parsed message body.
+    """
+    if lazy_validation:
+        return LazySqsMessageBody(json_loads(raw_body))
+    return SqsMessageBody.model_validate_json(raw_body)
+
+
+def parse_messages(messages, lazy_validation: bool = False) -> List[SqsMessageBody | LazySqsMessageBody]:
+    """
+    Parses a batch of SQS messages into message bodies.
+
+    :param messages: The SQS Message objects received from the queue.
+    :param lazy_validation: See parse_message_body.
+    :return: The list of the parsed bodies, in the same order as the messages.
+    """
+    return [parse_message_body(message.body, lazy_validation) for message in messages]
@@ -1,38 +1,29 @@
 import os
 import time
+import threading
 import traceback
 import logging
 logger = logging.getLogger(__name__)
 
-from pydantic import BaseModel
 from typing import List, Any
-from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import json
 
-import boto3
-from botocore.utils import ArnParser
 from botocore.exceptions import ClientError
 from publisher.sns_wrapper import SnsWrapper
+from concurrency.dispatcher import GroupOrderedDispatcher
+from payload.claim_check import delete_payload, is_offloaded_message
+from metrics.registry import metrics_registry
+from profiling.timers import StageTimers, get_stage_timers
+from .messages import SqsMessageBody, parse_messages, topic_name_from_arn, json_loads
+from .dedup import MessageDeduplicationCache
 
-class SqsMessageBody(BaseModel):
-    Type: str
-    MessageId: str
-    SequenceNumber: int
-    TopicArn: str
-    Message: str
-    Timestamp: datetime
-    UnsubscribeURL: str
+sqs_request_seconds = metrics_registry.histogram("shkedia_worker_sqs_request_seconds", "Latency of the SQS receive, ack and nack requests", ("operation",))
+sqs_messages = metrics_registry.counter("shkedia_worker_sqs_messages_total", "Messages received, acked and nacked", ("operation",))
+sqs_failed_messages = metrics_registry.counter("shkedia_worker_sqs_failed_messages_total", "Messages that SQS failed to ack or nack", ("operation",))
+sqs_idle_sleeps = metrics_registry.counter("shkedia_worker_sqs_idle_sleeps_total", "Sleeps of the listen loop after a partial batch")
 
-    @property
-    def topic_name(self):
-        return ArnParser().parse_arn(self.TopicArn)['resource']
-    
-    @property
-    def body(self):
-        try:
-            return json.loads(self.Message)
-        except json.decoder.JSONDecodeError:
-            return self.Message
 
 class ConsumerService:
     def __init__(self,
@@ -41,97 +32,200 @@ class ConsumerService:
                  message_ownership_time_seconds: int=600,
                  batch_size: int = 10,
                  sns_wrapper: SnsWrapper | None = None,
+                 lazy_validation: bool = False,
+                 deduplication_cache: MessageDeduplicationCache | None = None,
+                 dispatcher: GroupOrderedDispatcher | None = None,
+                 sqs_resource = None,
+                 delete_offloaded_payloads: bool = False,
+                 stage_timers: StageTimers | None = None,
                  ) -> None:
         
-        self.sqs = boto3.resource("sqs")
+        # The SQS resource and the queue are created on first use, so the service is cheap to construct
+        self.sqs_resource = sqs_resource
+        self.queue_name = queue_name
+        self.__queue = None
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
         self.listening_time_seconds = listening_time_seconds
         self.message_ownership_time_seconds = message_ownership_time_seconds
         self.batch_size = batch_size
         self.callbacks = []
-        self.queue = self.__init_queue__(queue_name)
         self.sns_wrapper = sns_wrapper
+        self.lazy_validation = lazy_validation
+        self.deduplication_cache = deduplication_cache
+        self.dispatcher = dispatcher
+        # Enable only when this queue is the single consumer of the offloaded payloads (no other subscriptions)
+        self.delete_offloaded_payloads = delete_offloaded_payloads
+        self.stage_timers = stage_timers if stage_timers is not None else get_stage_timers("consumer")
         
 
+    @property
+    def sqs(self):
+        if self.sqs_resource is None:
+            with self.lock:
+                if self.sqs_resource is None:
+                    import boto3
+                    self.sqs_resource = boto3.resource("sqs")
+        return self.sqs_resource
+
+    @property
+    def queue(self):
+        if self.__queue is None:
+            with self.lock:
+                if self.__queue is None:
+                    self.__queue = self.__init_queue__(self.queue_name)
+        return self.__queue
+
     def add_messages_callback(self, callback):
         self.callbacks.append(callback)
 
     def bind_topics(self,topics_to_bind: List[str]):
-        if self.sns_wrapper is None:
-            raise ValueError("SNS Wrapper was not supplied. Can't bind topic without it")
+        """
+        Binds the queue to the topics, keeping the topics that are already bound.
+        """
+        return self.reconcile_topics(topics_to_bind, prune=False)
 
-        for topic in topics_to_bind:
-            topic_object = self.sns_wrapper.create_topic(topic)
-            self.sns_wrapper.subscribe(topic_object,"sqs",self.queue.attributes["QueueArn"])
-            self.__add_access_policy__(self.queue,topic_object.attributes["TopicArn"])
-        
     def unbind_topics(self, topics_to_unbind: List[str]):
+        """
+        Unbinds the queue from the topics: removes their access policy and unsubscribes the queue.
+        """
         if self.sns_wrapper is None:
             raise ValueError("SNS Wrapper was not supplied. Can't unbind topics without it")
-        for topic in self.sns_wrapper.list_topics():
-            parsed_arn = ArnParser().parse_arn(topic.arn)
-            if parsed_arn["resource"] in topics_to_unbind:
-                self.__delete_access_policy__(self.queue, topic.arn)
-                
-                logger.info(f"Unbinded topic {parsed_arn['resource']}")
-
-    def __add_access_policy__(self,queue, topic_arn):
+        queue_attributes = self.__load_queue_attributes__()
+        queue_arn = queue_attributes["QueueArn"]
+        bound_topic_arns = self.__policy_topic_arns__(queue_attributes)
+        unbound_topic_arns = {topic_arn for topic_arn in bound_topic_arns if topic_name_from_arn(topic_arn) in topics_to_unbind}
+        current_subscriptions = self.__list_subscriptions__(queue_arn, unbound_topic_arns)
+        self.__apply_bindings__(queue_attributes,
+                                bound_topic_arns=bound_topic_arns - unbound_topic_arns,
+                                topic_arns_to_subscribe=[],
+                                subscriptions_to_delete=[subscription_arn for subscription_arns in current_subscriptions.values() for subscription_arn in subscription_arns])
+        for topic_arn in unbound_topic_arns:
+            logger.info(f"Unbinded topic {topic_name_from_arn(topic_arn)}")
+
+    def reconcile_topics(self, desired_topics: List[str], prune: bool = True, max_workers: int = 8) -> dict:
+        """
+        Brings the queue's subscriptions and access policy to the desired set of topics with one policy write
+        and parallel subscription calls.
+
+        Only the desired topics and the topics in the queue policy are inspected, so a subscription that was
+        created without a policy statement (not by this service) is not pruned.
+
+        :param desired_topics: The names of the topics the queue should be bound to. Missing topics are created.
+        :param prune: When True, the topics that are bound to the queue and are not desired are unbound.
+        :param max_workers: The number of parallel SNS calls.
+        :return: The ARNs of the subscribed and unsubscribed topics and whether the policy was written.
+        """
+        if self.sns_wrapper is None:
+            raise ValueError("SNS Wrapper was not supplied. Can't bind topic without it")
+        queue_attributes = self.__load_queue_attributes__()
+        queue_arn = queue_attributes["QueueArn"]
+        policy_topic_arns = self.__policy_topic_arns__(queue_attributes)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            desired_topic_arns = set(executor.map(self.sns_wrapper.create_topic_arn, desired_topics))
+        current_subscriptions = self.__list_subscriptions__(queue_arn, desired_topic_arns | policy_topic_arns, max_workers)
+
+        bound_topic_arns = set(desired_topic_arns)
+        topics_to_unsubscribe = []
+        if prune:
+            topics_to_unsubscribe = [topic_arn for topic_arn in current_subscriptions if topic_arn not in desired_topic_arns]
+        else:
+            bound_topic_arns |= policy_topic_arns | set(current_subscriptions)
+        topics_to_subscribe = [topic_arn for topic_arn in desired_topic_arns if topic_arn not in current_subscriptions]
+
+        policy_updated = self.__apply_bindings__(queue_attributes,
+                                                 bound_topic_arns=bound_topic_arns,
+                                                 topic_arns_to_subscribe=topics_to_subscribe,
+                                                 subscriptions_to_delete=[subscription_arn for topic_arn in topics_to_unsubscribe for subscription_arn in current_subscriptions[topic_arn]],
+                                                 max_workers=max_workers)
+        logger.info(f"Reconciled topics: subscribed {len(topics_to_subscribe)}, unsubscribed {len(topics_to_unsubscribe)}")
+        return {"subscribed": topics_to_subscribe,
+                "unsubscribed": topics_to_unsubscribe,
+                "policy_updated": policy_updated}
+
+    def __load_queue_attributes__(self) -> dict:
+        # Boto3 caches the attributes of the resource, and the policy may have been changed by another worker
+        self.queue.reload()
+        return self.queue.attributes
+
+    def __list_subscriptions__(self, queue_arn, topic_arns, max_workers: int = 8) -> dict:
+        """
+        Lists the subscriptions of the queue to the given topics, without paging through every subscription
+        of the account.
+
+        :return: The ARNs of the subscriptions by topic ARN, only for the subscribed topics.
         """
-        Add the necessary access policy to a queue, so
-        it can receive messages from a topic.
+        topic_arns = list(topic_arns)
+        if not topic_arns:
+            return {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            subscription_arns = executor.map(lambda topic_arn: self.sns_wrapper.list_topic_subscriptions(topic_arn, queue_arn), topic_arns)
+            return {topic_arn: topic_subscription_arns for topic_arn, topic_subscription_arns in zip(topic_arns, subscription_arns) if topic_subscription_arns}
+
+    def __apply_bindings__(self, queue_attributes, bound_topic_arns, topic_arns_to_subscribe, subscriptions_to_delete, max_workers: int = 8) -> bool:
+        # The policy is written before subscribing, so the first messages of a new subscription are not dropped
+        policy_updated = self.__set_access_policy__(self.queue, queue_attributes, bound_topic_arns)
+        queue_arn = queue_attributes["QueueArn"]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            calls = [executor.submit(self.sns_wrapper.subscribe_arn, topic_arn, "sqs", queue_arn) for topic_arn in topic_arns_to_subscribe]
+            calls += [executor.submit(self.sns_wrapper.unsubscribe_arn, subscription_arn) for subscription_arn in subscriptions_to_delete]
+            for call in calls:
+                call.result()
+        return policy_updated
+
+    @staticmethod
+    def __access_statement_id__(queue_arn, topic_arn):
+        return f"{queue_arn}-{topic_arn}"
+
+    def __policy_topic_arns__(self, queue_attributes) -> set:
+        """
+        Returns the ARNs of the topics that have an access statement of this worker in the queue policy.
+        """
+        if not queue_attributes.get("Policy"):
+            return set()
+        statement_prefix = self.__access_statement_id__(queue_attributes["QueueArn"], "")
+        topic_arns = set()
+        for statement in json.loads(queue_attributes["Policy"])["Statement"]:
+            if statement.get("Sid", "").startswith(statement_prefix):
+                topic_arns.add(statement["Condition"]["ArnLike"]["aws:SourceArn"])
+        return topic_arns
+
+    def __set_access_policy__(self, queue, queue_attributes, topic_arns) -> bool:
+        """
+        Sets the access policy of the queue, so it can receive messages from exactly these topics.
+        Statements that were not added by this worker are kept. The policy is written only if it changed.
 
         :param queue: The queue resource.
-        :param topic_arn: The ARN of the topic.
-        :return: None.
+        :param queue_attributes: The current attributes of the queue.
+        :param topic_arns: The ARNs of the topics.
+        :return: Whether the policy was written.
         """
         try:
-            statement_id = f"{queue.attributes['QueueArn']}-{topic_arn}"
-            statement_content = {
-                                    "Sid": statement_id,
+            queue_arn = queue_attributes["QueueArn"]
+            statement_prefix = self.__access_statement_id__(queue_arn, "")
+            if queue_attributes.get("Policy"):
+                current_policy_dict = json.loads(queue_attributes["Policy"])
+            else:
+                current_policy_dict = {
+                                "Version": "2012-10-17",
+                                "Statement": [],
+                            }
+            updated_statements = [statement for statement in current_policy_dict["Statement"] if not statement.get("Sid", "").startswith(statement_prefix)]
+            for topic_arn in sorted(topic_arns):
+                updated_statements.append({
+                                    "Sid": self.__access_statement_id__(queue_arn, topic_arn),
                                     "Effect": "Allow",
                                     "Principal": {"AWS": "*"},
                                     "Action": "SQS:SendMessage",
-                                    "Resource": queue.attributes["QueueArn"],
+                                    "Resource": queue_arn,
                                     "Condition": {
                                         "ArnLike": {"aws:SourceArn": topic_arn}
                                     },
-                }
-            if "Policy" in queue.attributes:
-                current_policy_dict = json.loads(queue.attributes["Policy"])
-            else:
-                current_policy_dict = {
-                                "Version": "2012-10-17",
-                                "Statement": [],
-                            }
-            statement_to_update = [statement for statement in current_policy_dict["Statement"] if statement["Sid"]==statement_id]
-            if statement_to_update:
-                statement_to_update[0] = statement_content
-            else:
-                current_policy_dict["Statement"].append(statement_content)
-            queue.set_attributes(
-                Attributes={
-                    "Policy": json.dumps(current_policy_dict)
-                }
-            )
-            logger.info("Added trust policy to the queue.")
-        except ClientError as error:
-            logger.exception("Couldn't add trust policy to the queue!")
-            raise error
-
-    def __delete_access_policy__(self,queue, topic_arn):
-        """
-        Add the necessary access policy to a queue, so
-        it can receive messages from a topic.
-
-        :param queue: The queue resource.
-        :param topic_arn: The ARN of the topic.
-        :return: None.
-        """
-        try:
-            statement_id = f"{queue.attributes['QueueArn']}-{topic_arn}"
-            current_policy_dict = json.loads(queue.attributes["Policy"])
-            updated_statement = [statement for statement in current_policy_dict["Statement"] if statement["Sid"]!=statement_id]
-            current_policy_dict["Statement"] = updated_statement
-            if len(updated_statement) == 0:
+                })
+            if updated_statements == current_policy_dict["Statement"]:
+                return False
+            current_policy_dict["Statement"] = updated_statements
+            if len(updated_statements) == 0:
                 new_queue_attributes = { "Policy": "" }
             else:
                 new_queue_attributes = {
@@ -140,9 +234,10 @@ class ConsumerService:
             queue.set_attributes(
                 Attributes=new_queue_attributes
             )
-            logger.info("Deleted the topic's access")
+            logger.info("Updated the queue's trust policy.")
+            return True
         except ClientError as error:
-            logger.exception("Couldn't delete policy to the queue!")
+            logger.exception("Couldn't update the queue's trust policy!")
             raise error
 
     def __init_queue__(self,queue_name):
@@ -198,15 +293,27 @@ class ConsumerService:
     
     def listen(self):
         logger.info("Start Listening")
-        while True:
+        while not self.stopping.is_set():
+            messages = []
             try:
-                messages = self.__receive_messages__()
-                messages_bodies = [SqsMessageBody(**json.loads(message.body)) for message in messages]
-                for callback in self.callbacks:
-                    callback(messages_bodies)
-                self.__ack_messages__(messages)
-                if len(messages)<self.batch_size:
-                    time.sleep(5)
+                if self.dispatcher is not None:
+                    with self.stage_timers.stage("wait_for_capacity"):
+                        self.dispatcher.wait_for_capacity()
+                    self.dispatcher.raise_errors()
+                with self.stage_timers.stage("receive"):
+                    messages = self.__receive_messages__()
+                received_number = len(messages)
+                if self.dispatcher is None:
+                    with self.stage_timers.stage("process"):
+                        self.__process_messages__(messages)
+                else:
+                    with self.stage_timers.stage("dispatch"):
+                        self.__dispatch_messages__(messages)
+                    messages = [] # The dispatcher acks or nacks them from now on
+                if received_number<self.batch_size:
+                    sqs_idle_sleeps.inc()
+                    with self.stage_timers.stage("idle"):
+                        self.stopping.wait(5)
             except Exception as err:
                 if messages:
                     self.__nack_messages__(messages)
@@ -215,8 +322,71 @@ class ConsumerService:
                 break
             except KeyboardInterrupt:
                 break
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown(wait=True)
         logger.info("Stopped Listening")
 
+    def stop(self):
+        """
+        Stops the listen loop after the current batch; the dispatched messages are finished before listen returns.
+        """
+        self.stopping.set()
+
+    def __process_messages__(self, messages):
+        messages_bodies = parse_messages(messages, lazy_validation=self.lazy_validation)
+        new_messages_bodies = messages_bodies
+        if self.deduplication_cache is not None:
+            new_messages_bodies = self.__drop_duplicates__(messages_bodies)
+        for callback in self.callbacks:
+            callback(new_messages_bodies)
+        failed_messages = self.__ack_messages__(messages)
+        # A message that wasn't deleted is redelivered, and must be processed again then
+        failed_ids = {id(message) for message in failed_messages}
+        deleted_bodies = [body for message, body in zip(messages, messages_bodies) if id(message) not in failed_ids]
+        if self.deduplication_cache is not None:
+            deleted_ids = {id(body) for body in deleted_bodies}
+            self.deduplication_cache.mark_processed([body for body in new_messages_bodies if id(body) in deleted_ids])
+        if self.delete_offloaded_payloads:
+            self.__delete_payloads__(deleted_bodies)
+
+    def __process_messages_or_nack__(self, messages):
+        try:
+            self.__process_messages__(messages)
+        except Exception:
+            self.__nack_messages__(messages)
+            raise
+
+    def __dispatch_messages__(self, messages):
+        """
+        Splits the messages by their FIFO MessageGroupId and hands each group to the dispatcher.
+        Messages without a group (standard queues) are dispatched together as one unordered group.
+        """
+        messages_groups = {}
+        for message in messages:
+            group_id = (message.attributes or {}).get("MessageGroupId", f"__batch__{id(messages)}")
+            messages_groups.setdefault(group_id, []).append(message)
+        for group_id, group_messages in messages_groups.items():
+            self.dispatcher.submit(group_id,
+                                   task=partial(self.__process_messages_or_nack__, group_messages),
+                                   cancel_task=partial(self.__nack_messages__, group_messages))
+
+    def __delete_payloads__(self, messages_bodies):
+        for message_body in messages_bodies:
+            # Plain and codec encoded (e.g. msgpack) messages aren't references, and aren't parsed
+            if not is_offloaded_message(message_body.Message):
+                continue
+            try:
+                delete_payload(json_loads(message_body.Message))
+            except (ValueError, OSError):
+                logger.warning(f"Failed to delete the offloaded payload of message {message_body.MessageId}")
+
+    def __drop_duplicates__(self, messages_bodies):
+        new_messages_bodies = self.deduplication_cache.filter_new(messages_bodies)
+        duplicates_number = len(messages_bodies) - len(new_messages_bodies)
+        if duplicates_number > 0:
+            logger.info(f"Dropped {duplicates_number} duplicate messages. Deduplication stats: {self.deduplication_cache.stats()}")
+        return new_messages_bodies
+
     def __ack_messages__(self, messages):
         """
         Delete a batch of messages from a queue in a single request.
@@ -233,7 +403,10 @@ class ConsumerService:
                 {"Id": str(ind), "ReceiptHandle": msg.receipt_handle}
                 for ind, msg in enumerate(messages)
             ]
+            request_start = time.perf_counter()
             response = self.queue.delete_messages(Entries=entries)
+            sqs_request_seconds.labels("ack").observe(time.perf_counter() - request_start)
+            sqs_messages.labels("ack").inc(len(messages))
             failed_messages = []
             if "Successful" in response:
                 for msg_meta in response["Successful"]:
@@ -244,10 +417,14 @@ class ConsumerService:
                         "Could not delete %s", messages[int(msg_meta["Id"])].receipt_handle
                     )
                     failed_messages.append(messages[int(msg_meta["Id"])])
+            if failed_messages:
+                sqs_failed_messages.labels("ack").inc(len(failed_messages))
             return failed_messages
         except ClientError:
+            sqs_failed_messages.labels("ack").inc(len(messages))
             logger.exception("Couldn't delete messages from queue %s", self.queue)
-           
+            return list(messages)
+
 
     def __nack_messages__(self,messages):
         try:
@@ -257,7 +434,10 @@ class ConsumerService:
                 {'Id': str(ind), 'ReceiptHandle': msg.receipt_handle, 'VisibilityTimeout': 0 }
                     for ind, msg in enumerate(messages)
             ]
+            request_start = time.perf_counter()
             response = self.queue.change_message_visibility_batch(Entries=entries)
+            sqs_request_seconds.labels("nack").observe(time.perf_counter() - request_start)
+            sqs_messages.labels("nack").inc(len(messages))
             failed_messages = []
             if "Successful" in response:
                 for msg_meta in response["Successful"]:
@@ -268,8 +448,11 @@ class ConsumerService:
                         "Could not delete %s", messages[int(msg_meta["Id"])].receipt_handle
                     )
                     failed_messages.append(messages[int(msg_meta["Id"])])
+            if failed_messages:
+                sqs_failed_messages.labels("nack").inc(len(failed_messages))
             return failed_messages
         except ClientError:
+            sqs_failed_messages.labels("nack").inc(len(messages))
             logger.exception("Couldn't delete messages from queue %s", self.queue)
 
     def __receive_messages__(self) -> List[SqsMessageBody]:
@@ -288,11 +471,15 @@ class ConsumerService:
         try:
             if self.queue is None:
                 raise ConnectionError("Can't get connection to the queue")
+            request_start = time.perf_counter()
             messages = self.queue.receive_messages(
                 MessageAttributeNames=["All"],
+                AttributeNames=["MessageGroupId"],
                 MaxNumberOfMessages=self.batch_size,
                 WaitTimeSeconds=self.listening_time_seconds,
             )
+            sqs_request_seconds.labels("receive").observe(time.perf_counter() - request_start)
+            sqs_messages.labels("receive").inc(len(messages))
             return messages
         except ClientError as error:
             logger.exception("Couldn't receive messages from queue: %s", self.queue)
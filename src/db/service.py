@@ -1,18 +1,93 @@
-import requests
-from requests.adapters import HTTPAdapter, Retry
-from typing import List
+import time
+from typing import Dict, List, TYPE_CHECKING
+
+from metrics.registry import metrics_registry
+from concurrency.rate_limit import AdaptiveRateLimiter, THROTTLING_STATUS_CODES
 
 from project_shkedia_models import media, search, insights,jobs
 
+if TYPE_CHECKING:
+    # requests is imported by the first request, it is not needed to start the worker
+    import requests
+
+media_db_request_seconds = metrics_registry.histogram("shkedia_worker_media_db_request_seconds", "Latency of the Media DB requests by endpoint and status", ("endpoint", "status"))
+
+# The endpoints share the rate limit of their class
+SEARCH_ENDPOINTS = "search"
+BULK_WRITE_ENDPOINTS = "bulk_write"
+ENDPOINT_CLASSES = {"search_engine": SEARCH_ENDPOINTS,
+                    "get_media_to_analyze": SEARCH_ENDPOINTS,
+                    "get_media_by_ids": SEARCH_ENDPOINTS,
+                    "search_media": SEARCH_ENDPOINTS,
+                    "get_pending_jobs": SEARCH_ENDPOINTS,
+                    "put_jobs": BULK_WRITE_ENDPOINTS,
+                    "update_jobs": BULK_WRITE_ENDPOINTS,
+                    "put_insights": BULK_WRITE_ENDPOINTS}
+
+
 class MediaDBService:
+    """
+    :param rate_limiters: The rate limiter of each endpoint class (SEARCH_ENDPOINTS, BULK_WRITE_ENDPOINTS).
+                          The requests of a class without a limiter are not limited.
+    :param throttled_retries: The retries of a throttled (429/503) request, after the limiter slowed down.
+    """
 
     def __init__(self,
                 host: str,
                 port: str | int,
-                default_batch_size: int = 1000
+                default_batch_size: int = 1000,
+                rate_limiters: Dict[str, AdaptiveRateLimiter] | None = None,
+                throttled_retries: int = 5,
                     ) -> None:
         self.default_batch_size = default_batch_size
         self.db_service_url = f"http://{host}:{str(port)}"
+        self.rate_limiters = rate_limiters if rate_limiters is not None else {}
+        self.throttled_retries = throttled_retries
+
+    def __send__(self, endpoint: str, method: str, url: str, throttling_retries: bool, **kwargs) -> "requests.Response":
+        import requests
+        from requests.adapters import HTTPAdapter, Retry
+        s = requests.Session()
+
+        # With a rate limiter the throttling responses are returned, so the limiter adapts to them
+        status_forcelist = [500, 502, 504] if not throttling_retries else [429, 500, 502, 503, 504]
+        retries = Retry(total=5,
+                backoff_factor=1,
+                status_forcelist=status_forcelist)
+
+        s.mount('http://', HTTPAdapter(max_retries=retries))
+
+        request_start = time.perf_counter()
+        status = "error"
+        try:
+            results = s.request(method, url, **kwargs)
+            status = str(results.status_code)
+            return results
+        finally:
+            media_db_request_seconds.labels(endpoint, status).observe(time.perf_counter() - request_start)
+            s.close()
+
+    def __request__(self, endpoint: str, method: str, url: str, **kwargs) -> "requests.Response":
+        """
+        Sends a request (with retries) and records its latency. With a rate limiter for the class of the endpoint,
+        the request waits for the limiter, and a throttled request is retried after the limiter adapted to it.
+
+        :param endpoint: The name of the endpoint, the label of the latency metric.
+        """
+        rate_limiter = self.rate_limiters.get(ENDPOINT_CLASSES.get(endpoint))
+        if rate_limiter is None:
+            return self.__send__(endpoint, method, url, throttling_retries=True, **kwargs)
+        for attempt in range(self.throttled_retries + 1):
+            with rate_limiter.limit():
+                try:
+                    results = self.__send__(endpoint, method, url, throttling_retries=False, **kwargs)
+                except Exception:
+                    rate_limiter.on_response(None)
+                    raise
+            rate_limiter.on_response(results.status_code, results.headers.get("Retry-After"))
+            if results.status_code not in THROTTLING_STATUS_CODES:
+                break
+        return results
 
 
     def search_engine(self, engine_name: str, batch_size: int | None = None) -> search.SearchResult:
@@ -26,23 +101,16 @@ class MediaDBService:
             "page_size": batch_size
         }
 
-        s = requests.Session()
-
-        retries = Retry(total=5,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504])
-
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-
-        results = s.get(get_images_api_url, params=query_params)
-
-        s.close()
+        results = self.__request__("search_engine", "get", get_images_api_url, params=query_params)
 
         if results.status_code == 200:
             return search.SearchResult(**results.json())
         raise Exception(f"{results.json().detail}")        
 
-    def get_media_to_analyze(self, engine_name: str, batch_size: int | None = None) -> search.SearchResult:
+    def get_media_to_analyze(self, engine_name: str, batch_size: int | None = None, created_after: str | None = None) -> search.SearchResult:
+        """
+        :param created_after: ISO timestamp, inclusive. Only the media created from it (e.g. the fresh uploads).
+        """
         batch_size = batch_size if batch_size else self.default_batch_size
         
         get_images_api_url = self.db_service_url + f"/v2/no-jobs/media/{engine_name}"
@@ -51,18 +119,10 @@ class MediaDBService:
             "page_size": batch_size,
             "uploaded_status": "UPLOADED"
         }
+        if created_after is not None:
+            query_params["created_on_start"] = created_after
 
-        s = requests.Session()
-
-        retries = Retry(total=5,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504])
-
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-
-        results = s.get(get_images_api_url, params=query_params)
-
-        s.close()
+        results = self.__request__("get_media_to_analyze", "get", get_images_api_url, params=query_params)
 
         if results.status_code == 200:
             return search.SearchResult(**results.json())
@@ -76,43 +136,63 @@ class MediaDBService:
             "media_id": [media_ids_list]
         }
 
-        s = requests.Session()
+        results = self.__request__("get_media_by_ids", "get", get_images_api_url, params=query_params)
 
-        retries = Retry(total=5,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504])
+        if results.status_code == 200:
+            return search.SearchResult(**results.json())
+        return []
 
-        s.mount('http://', HTTPAdapter(max_retries=retries))
+    def search_media(self,
+                     owner_id: str | None = None,
+                     created_after: str | None = None,
+                     created_before: str | None = None,
+                     page_size: int | None = None,
+                     page_number: int = 0) -> search.SearchResult:
+        """
+        Searches the uploaded media, in a stable order, a page at a time (e.g. to stream a library for a backfill).
 
-        results = s.get(get_images_api_url, params=query_params)
+        :param created_after: ISO timestamp, inclusive.
+        :param created_before: ISO timestamp, exclusive.
+        """
+        page_size = page_size if page_size else self.default_batch_size
 
-        s.close()
+        search_media_api_url = self.db_service_url + f"/v1/media/search"
+
+        query_params = {
+            "uploaded_status": "UPLOADED",
+            "page_size": page_size,
+            "page_number": page_number
+        }
+        if owner_id is not None:
+            query_params["owner_id"] = owner_id
+        if created_after is not None:
+            query_params["created_on_start"] = created_after
+        if created_before is not None:
+            query_params["created_on_end"] = created_before
+
+        results = self.__request__("search_media", "get", search_media_api_url, params=query_params)
 
         if results.status_code == 200:
             return search.SearchResult(**results.json())
-        return []
+        raise Exception(f"{results.status_code}: {results.text}")
 
-    def get_pending_jobs(self, engine_id: str, batch_size: int | None = None) -> search.SearchResult:
+    def get_pending_jobs(self, engine_id: str, batch_size: int | None = None, created_after: str | None = None) -> search.SearchResult:
+        """
+        :param created_after: ISO timestamp, inclusive. Only the jobs created (started) from it.
+        """
         batch_size = batch_size if batch_size else self.default_batch_size
 
         get_jobs_api_url = self.db_service_url + f"/v2/jobs/search"
 
         params = {
             "insight_engine_id": engine_id,
-            "status": jobs.InsightJobStatus.PENDING.value
+            "status": jobs.InsightJobStatus.PENDING.value,
+            "page_size": batch_size
         }
+        if created_after is not None:
+            params["start_time_start"] = created_after
 
-        s = requests.Session()
-
-        retries = Retry(total=5,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504])
-
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-
-        results = s.get(get_jobs_api_url, params=params)
-
-        s.close()
+        results = self.__request__("get_pending_jobs", "get", get_jobs_api_url, params=params)
 
         if results.status_code == 200:
             return search.SearchResult(**results.json())
@@ -123,65 +203,32 @@ class MediaDBService:
 
         put_job_api_url = self.db_service_url + f"/v2/job"
 
-        s = requests.Session()
-
-        retries = Retry(total=5,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504])
-
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-
-        results = s.put(put_job_api_url, json=json)
-
-        s.close()
+        results = self.__request__("put_jobs", "put", put_job_api_url, json=json)
 
         if results.status_code==200:
             return len(results.json())
         raise Exception(f"{results.status_code}: {results.detail}")
         
     def update_jobs(self, job_list: List[jobs.InsightJob]):
-        json = [item.model_dump() for item in job_list]
-
-        update_job_api_url = self.db_service_url + f"/v2/job"
-
-        s = requests.Session()
+        return self.update_jobs_json([item.model_dump() for item in job_list])
 
-        retries = Retry(total=5,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504])
-
-        s.mount('http://', HTTPAdapter(max_retries=retries))
+    def update_jobs_json(self, json: List[dict]):
 
-        results = s.post(update_job_api_url, json=json)
+        update_job_api_url = self.db_service_url + f"/v2/job"
 
-        s.close()
+        results = self.__request__("update_jobs", "post", update_job_api_url, json=json)
 
         if results.status_code==200:
             return len(results.json())
 
     def put_insights(self,insights_list: List[insights.Insight]):
-        
-        json = [item.model_dump() for item in insights_list]
-
-        put_insights_api_url = self.db_service_url + f"/v2/insights"
-
-        s = requests.Session()
-
-        retries = Retry(total=5,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504])
+        return self.put_insights_json([item.model_dump() for item in insights_list])
 
-        s.mount('http://', HTTPAdapter(max_retries=retries))
+    def put_insights_json(self, json: List[dict]):
 
-        results = s.put(put_insights_api_url, json=json)
+        put_insights_api_url = self.db_service_url + f"/v2/insights"
 
-        s.close()
+        results = self.__request__("put_insights", "put", put_insights_api_url, json=json)
 
         if results.status_code==200:
             return len(results.json())
-
-
-
-
-
-
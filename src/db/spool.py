@@ -0,0 +1,219 @@
+import time
+import json
+import sqlite3
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import Callable, Dict, List, NamedTuple, Set
+
+from metrics.registry import metrics_registry
+
+INSIGHTS_KIND = "insights"
+JOBS_KIND = "jobs"
+
+spooled_writes = metrics_registry.gauge("shkedia_worker_spooled_writes", "Media DB writes in the spool that were not acknowledged yet")
+
+
+class SpoolEntry(NamedTuple):
+    sequence: int
+    kind: str
+    items: List[dict]
+    tag: str | None = None
+
+
+class SqliteWriteSpool:
+    """
+    Write-ahead log of the Media DB writes (insights and job statuses), kept in a local SQLite file.
+    A write is appended before it is sent and deleted once the Media DB acknowledged it.
+
+    :param database_location: The SQLite file. Must be on a persistent volume for the writes to survive a restart.
+    """
+
+    def __init__(self, database_location: str) -> None:
+        self.database_location = database_location
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_location, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS spool_entries (
+                                       sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       kind TEXT NOT NULL,
+                                       items TEXT NOT NULL,
+                                       tag TEXT,
+                                       created_at REAL NOT NULL)""")
+        self.connection.commit()
+
+    def append(self, kind: str, items: List[dict], tag: str | None = None) -> int:
+        """
+        :param kind: The kind of the write (insights or jobs).
+        :param items: The JSON-ready items of the write.
+        :param tag: Optional reference of the write (e.g. its outbox batch), returned with the entry.
+        :return: The sequence of the entry.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute("INSERT INTO spool_entries (kind, items, tag, created_at) VALUES (?, ?, ?, ?)",
+                                             (kind, json.dumps(items), tag, time.time()))
+        return cursor.lastrowid
+
+    def pending(self, limit: int | None = None) -> List[SpoolEntry]:
+        """
+        :return: The entries that were not acknowledged yet, oldest first.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT sequence, kind, items, tag FROM spool_entries ORDER BY sequence LIMIT ?",
+                                           (limit if limit else -1,)).fetchall()
+        return [SpoolEntry(sequence, kind, json.loads(items), tag) for sequence, kind, items, tag in rows]
+
+    def ack(self, sequences: List[int]):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM spool_entries WHERE sequence=?", [(sequence,) for sequence in sequences])
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM spool_entries").fetchone()[0]
+
+    def compact(self) -> int:
+        """
+        Merges the pending job-status entries into one, keeping the last status of each job, so a long outage
+        is replayed with one bulk request instead of a request per batch. Tagged entries are kept as they are.
+
+        :return: The number of entries that were merged away.
+        """
+        with self.lock:
+            with self.connection:
+                rows = self.connection.execute("SELECT sequence, items FROM spool_entries WHERE kind=? AND tag IS NULL ORDER BY sequence",
+                                               (JOBS_KIND,)).fetchall()
+                if len(rows) < 2:
+                    return 0
+                latest_jobs: Dict[str, dict] = {}
+                for _, items in rows:
+                    for job in json.loads(items):
+                        latest_jobs[str(job["id"])] = job
+                # The merged entry takes the place of the last one, so it is still replayed after the older writes
+                self.connection.executemany("DELETE FROM spool_entries WHERE sequence=?", [(sequence,) for sequence, _ in rows[:-1]])
+                self.connection.execute("UPDATE spool_entries SET items=? WHERE sequence=?", (json.dumps(list(latest_jobs.values())), rows[-1][0]))
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info(f"Compacted {len(rows)} job entries of the write spool into one")
+        return len(rows) - 1
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SpooledMediaDBWriter:
+    """
+    Sends the insights and job-status writes to the Media DB through a write-ahead spool, so the results of the
+    extraction are kept during a Media DB outage and replayed in bulk when it recovers.
+
+    Every write is appended to the spool and then the pending entries are sent in order (consecutive entries of
+    the same kind in one request). After a failure the writes are only spooled until retry_interval_seconds passed.
+
+    :param media_db_service: The MediaDBService (put_insights_json and update_jobs_json are used).
+    :param spool: The spool of the pending writes.
+    :param max_request_items: The maximum number of items sent in one request when replaying.
+    :param retry_interval_seconds: How long to wait after a failed send before trying the Media DB again.
+    :param on_ack: Called with the entries acknowledged by the Media DB.
+    """
+
+    def __init__(self,
+                 media_db_service,
+                 spool: SqliteWriteSpool,
+                 max_request_items: int = 1000,
+                 retry_interval_seconds: float = 30,
+                 on_ack: Callable[[List[SpoolEntry]], None] | None = None) -> None:
+        self.media_db_service = media_db_service
+        self.spool = spool
+        self.max_request_items = max_request_items
+        self.retry_interval_seconds = retry_interval_seconds
+        self.on_ack = on_ack
+        self.lock = threading.Lock()
+        self.next_attempt_time = 0.0
+        self.pending_job_ids: Set[str] = set()
+        self.__load_pending_job_ids__()
+        # A restart may follow an outage
+        self.compaction_needed = True
+
+    def __load_pending_job_ids__(self):
+        self.pending_job_ids = {str(job["id"]) for entry in self.spool.pending() if entry.kind == JOBS_KIND for job in entry.items}
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.next_attempt_time
+
+    def put_insights(self, insights_list, tag: str | None = None) -> int:
+        """
+        :return: The number of acknowledged entries (0 while the Media DB is unavailable).
+        """
+        self.spool.append(INSIGHTS_KIND, [insight.model_dump(mode="json") for insight in insights_list], tag)
+        return len(self.replay())
+
+    def update_jobs(self, job_list) -> int:
+        """
+        :return: The number of acknowledged entries (0 while the Media DB is unavailable).
+        """
+        return self.update_jobs_json([job.model_dump(mode="json") for job in job_list])
+
+    def update_jobs_json(self, jobs_items: List[dict]) -> int:
+        """
+        :param jobs_items: The JSON-ready jobs.
+        :return: The number of acknowledged entries (0 while the Media DB is unavailable).
+        """
+        with self.lock:
+            self.pending_job_ids.update(str(job["id"]) for job in jobs_items)
+        self.spool.append(JOBS_KIND, jobs_items)
+        return len(self.replay())
+
+    def replay(self, force: bool = False) -> List[SpoolEntry]:
+        """
+        Sends the pending entries in order, until the first failure.
+
+        :param force: Try even if the retry interval after the last failure didn't pass.
+        :return: The acknowledged entries.
+        """
+        if not force and not self.available:
+            return []
+        with self.lock:
+            if self.compaction_needed:
+                self.spool.compact()
+                self.compaction_needed = False
+            acked_entries = []
+            pending_entries = self.spool.pending()
+            while pending_entries:
+                request_entries = self.__next_request__(pending_entries)
+                pending_entries = pending_entries[len(request_entries):]
+                if not self.__send__(request_entries):
+                    self.next_attempt_time = time.monotonic() + self.retry_interval_seconds
+                    self.compaction_needed = True
+                    logger.warning(f"Media DB write failed. {self.spool.pending_count()} writes are spooled")
+                    break
+                self.spool.ack([entry.sequence for entry in request_entries])
+                acked_entries += request_entries
+            if acked_entries:
+                self.__load_pending_job_ids__()
+            spooled_writes.set(self.spool.pending_count())
+        if acked_entries and self.on_ack is not None:
+            self.on_ack(acked_entries)
+        return acked_entries
+
+    def __next_request__(self, pending_entries: List[SpoolEntry]) -> List[SpoolEntry]:
+        request_entries = [pending_entries[0]]
+        items_number = len(pending_entries[0].items)
+        for entry in pending_entries[1:]:
+            if entry.kind != request_entries[0].kind or items_number + len(entry.items) > self.max_request_items:
+                break
+            request_entries.append(entry)
+            items_number += len(entry.items)
+        return request_entries
+
+    def __send__(self, request_entries: List[SpoolEntry]) -> bool:
+        items = [item for entry in request_entries for item in entry.items]
+        try:
+            if request_entries[0].kind == INSIGHTS_KIND:
+                result = self.media_db_service.put_insights_json(items)
+            else:
+                result = self.media_db_service.update_jobs_json(items)
+        except Exception as err:
+            logger.warning(f"Failed to send {len(items)} {request_entries[0].kind}: {str(err)}")
+            return False
+        return result is not None
@@ -0,0 +1,676 @@
+"""
+In-process stand-in for the subset of Amazon SNS and SQS used by ConsumerService, SnsWrapper and PublisherService.
+
+The resources returned by FakeBroker.sqs_resource() and FakeBroker.sns_resource() mimic the Boto3 resources:
+FIFO topics with deduplication, subscriptions of queues to topics (delivery requires a queue policy that allows
+the topic, as in AWS), batch delete and visibility changes, visibility timeouts, FIFO message group locking and
+long polling. Latency and failures can be injected per operation, so the messaging paths can be tested and
+benchmarked offline.
+"""
+import time
+import json
+import random
+import hashlib
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+REGION = "us-east-1"
+ACCOUNT_ID = "000000000000"
+DEDUPLICATION_INTERVAL_SECONDS = 300
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256*1024
+LIST_PAGE_SIZE = 100
+
+
+class FakeCollection:
+
+    def __init__(self, items_getter) -> None:
+        self.items_getter = items_getter
+
+    def all(self):
+        return iter(self.items_getter())
+
+    def __iter__(self):
+        return self.all()
+
+
+class FaultInjector:
+    """
+    Injects latency and failures into the broker operations (named after the AWS APIs, e.g. ReceiveMessage).
+
+    :param latency_seconds: The latency of every operation, or a dictionary of latency per operation.
+    :param failure_rate: The probability of an operation to fail, or a dictionary of probability per operation.
+    :param random_seed: Seed for the failures, to make them reproducible.
+    """
+
+    def __init__(self,
+                 latency_seconds: float | Dict[str, float] = 0.0,
+                 failure_rate: float | Dict[str, float] = 0.0,
+                 random_seed: int | None = None) -> None:
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(random_seed)
+        self.lock = threading.Lock()
+        self.scheduled_failures: Dict[str, List[str]] = {}
+
+    def fail_next(self, operation_name: str, count: int = 1, error_code: str = "ServiceUnavailable"):
+        with self.lock:
+            self.scheduled_failures.setdefault(operation_name, []).extend([error_code]*count)
+
+    def __value_for__(self, value, operation_name):
+        if isinstance(value, dict):
+            return value.get(operation_name, 0.0)
+        return value
+
+    def before_operation(self, operation_name: str):
+        latency = self.__value_for__(self.latency_seconds, operation_name)
+        if latency > 0:
+            time.sleep(latency)
+        with self.lock:
+            scheduled_failures = self.scheduled_failures.get(operation_name)
+            if scheduled_failures:
+                raise create_client_error(scheduled_failures.pop(0), "Injected failure", operation_name)
+            failure_rate = self.__value_for__(self.failure_rate, operation_name)
+            if failure_rate > 0 and self.random.random() < failure_rate:
+                raise create_client_error("ServiceUnavailable", "Injected failure", operation_name)
+
+
+def create_client_error(code: str, message: str, operation_name: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+
+class FakeBroker:
+    """
+    Holds the state of the fake SNS topics and SQS queues.
+
+    :param fault_injector: Optional latency and failure injection.
+    """
+
+    def __init__(self, fault_injector: FaultInjector | None = None) -> None:
+        self.fault_injector = fault_injector if fault_injector else FaultInjector()
+        self.condition = threading.Condition()
+        self.queues: Dict[str, FakeQueueState] = {}
+        self.topics: Dict[str, FakeTopicState] = {}
+        self.subscriptions: Dict[str, dict] = {}
+        self.calls = Counter()
+
+    def sqs_resource(self):
+        return FakeSqsResource(self)
+
+    def sns_resource(self):
+        return FakeSnsResource(self)
+
+    def operation(self, operation_name: str):
+        with self.condition:
+            self.calls[operation_name] += 1
+        self.fault_injector.before_operation(operation_name)
+
+    # SQS
+
+    def create_queue(self, name: str, attributes: dict | None) -> "FakeQueueState":
+        attributes = {key: str(value) for key, value in (attributes or {}).items()}
+        with self.condition:
+            queue = self.queues.get(name)
+            if queue is not None:
+                if any(queue.attributes.get(key) != value for key, value in attributes.items()):
+                    raise create_client_error("QueueAlreadyExists", "A queue already exists with the same name and a different value for attribute(s)", "CreateQueue")
+                return queue
+            if attributes.get("FifoQueue") == "True" and not name.endswith(".fifo"):
+                raise create_client_error("InvalidParameterValue", "The name of a FIFO queue can only include alphanumeric characters, hyphens, or underscores, must end with .fifo suffix", "CreateQueue")
+            queue = FakeQueueState(self, name, attributes)
+            self.queues[name] = queue
+            return queue
+
+    def get_queue(self, name: str) -> "FakeQueueState":
+        with self.condition:
+            queue = self.queues.get(name)
+        if queue is None:
+            raise create_client_error("AWS.SimpleQueueService.NonExistentQueue", "The specified queue does not exist.", "GetQueueUrl")
+        return queue
+
+    def get_queue_by_url(self, url: str) -> "FakeQueueState":
+        return self.get_queue(url.rsplit("/", 1)[-1])
+
+    def get_queue_by_arn(self, arn: str) -> "FakeQueueState | None":
+        with self.condition:
+            return self.queues.get(arn.rsplit(":", 1)[-1])
+
+    # SNS
+
+    def create_topic(self, name: str, attributes: dict | None) -> "FakeTopicState":
+        attributes = {key: str(value) for key, value in (attributes or {}).items()}
+        with self.condition:
+            topic = self.topics.get(name)
+            if topic is not None:
+                return topic
+            if attributes.get("FifoTopic") == "True" and not name.endswith(".fifo"):
+                raise create_client_error("InvalidParameter", "Fifo Topic names must end with .fifo and must be made up of only uppercase and lowercase ASCII letters, numbers, underscores, and hyphens, and must be between 1 and 256 characters long.", "CreateTopic")
+            topic = FakeTopicState(self, name, attributes)
+            self.topics[name] = topic
+            return topic
+
+    def get_topic_by_arn(self, arn: str) -> "FakeTopicState":
+        with self.condition:
+            topic = self.topics.get(arn.rsplit(":", 1)[-1])
+        if topic is None:
+            raise create_client_error("NotFound", "Topic does not exist", "Publish")
+        return topic
+
+    def subscribe(self, topic: "FakeTopicState", protocol: str, endpoint: str) -> str:
+        with self.condition:
+            for subscription_arn, subscription in self.subscriptions.items():
+                if subscription["TopicArn"] == topic.arn and subscription["Protocol"] == protocol and subscription["Endpoint"] == endpoint:
+                    return subscription_arn
+            subscription_arn = f"{topic.arn}:{uuid4()}"
+            self.subscriptions[subscription_arn] = {"SubscriptionArn": subscription_arn,
+                                                    "TopicArn": topic.arn,
+                                                    "Protocol": protocol,
+                                                    "Endpoint": endpoint,
+                                                    "Owner": ACCOUNT_ID}
+            return subscription_arn
+
+    def publish(self, topic_arn: str, message: str,
+                message_group_id: str | None = None,
+                message_deduplication_id: str | None = None,
+                message_attributes: dict | None = None) -> dict:
+        topic = self.get_topic_by_arn(topic_arn)
+        with self.condition:
+            message_id, sequence_number, is_duplicate = topic.accept(message, message_group_id, message_deduplication_id)
+            if is_duplicate:
+                return {"MessageId": message_id, "SequenceNumber": sequence_number}
+            envelope = {
+                "Type": "Notification",
+                "MessageId": message_id,
+                "TopicArn": topic.arn,
+                "Message": message,
+                "Timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                "UnsubscribeURL": f"https://sns.{REGION}.amazonaws.com/?Action=Unsubscribe&SubscriptionArn={topic.arn}",
+            }
+            if sequence_number is not None:
+                envelope["SequenceNumber"] = sequence_number
+            if message_attributes:
+                envelope["MessageAttributes"] = {key: {"Type": value["DataType"], "Value": value.get("StringValue")}
+                                                 for key, value in message_attributes.items()}
+            for subscription in list(self.subscriptions.values()):
+                if subscription["TopicArn"] != topic.arn or subscription["Protocol"] != "sqs":
+                    continue
+                if not filter_policy_matches(subscription.get("FilterPolicy"), message_attributes):
+                    continue
+                queue = self.get_queue_by_arn(subscription["Endpoint"])
+                if queue is None or not queue.allows(topic.arn):
+                    logger.debug(f"Dropped delivery of {message_id} to {subscription['Endpoint']}")
+                    continue
+                queue.append(json.dumps(envelope), message_group_id, message_deduplication_id)
+            self.condition.notify_all()
+        response = {"MessageId": message_id}
+        if sequence_number is not None:
+            response["SequenceNumber"] = sequence_number
+        return response
+
+
+def filter_policy_matches(filter_policy: str | None, message_attributes: dict | None) -> bool:
+    if not filter_policy:
+        return True
+    message_attributes = message_attributes or {}
+    for key, allowed_values in json.loads(filter_policy).items():
+        if key not in message_attributes or message_attributes[key].get("StringValue") not in allowed_values:
+            return False
+    return True
+
+
+class FakeTopicState:
+
+    def __init__(self, broker: FakeBroker, name: str, attributes: dict) -> None:
+        self.broker = broker
+        self.name = name
+        self.arn = f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:{name}"
+        self.attributes = {"TopicArn": self.arn, "Owner": ACCOUNT_ID, **attributes}
+        self.sequence_number = 10000000000000000000
+        self.published_messages = 0
+        self.deduplication_ids: Dict[str, tuple] = {}
+
+    @property
+    def is_fifo(self) -> bool:
+        return self.attributes.get("FifoTopic") == "True"
+
+    def accept(self, message: str, message_group_id: str | None, message_deduplication_id: str | None):
+        """
+        Validates a publish to the topic. Must be called with the broker's lock held.
+
+        :return: The message id, the sequence number and whether it is a duplicate in the deduplication interval.
+        """
+        if not self.is_fifo:
+            self.published_messages += 1
+            return str(uuid4()), None, False
+        if message_group_id is None:
+            raise create_client_error("InvalidParameter", "Invalid parameter: The MessageGroupId parameter is required for FIFO topics", "Publish")
+        if message_deduplication_id is None:
+            if self.attributes.get("ContentBasedDeduplication") != "True":
+                raise create_client_error("InvalidParameter", "Invalid parameter: The topic should either have ContentBasedDeduplication enabled or MessageDeduplicationId provided explicitly", "Publish")
+            message_deduplication_id = hashlib.sha256(message.encode()).hexdigest()
+        now = time.time()
+        previous = self.deduplication_ids.get(message_deduplication_id)
+        if previous is not None and now - previous[2] < DEDUPLICATION_INTERVAL_SECONDS:
+            return previous[0], previous[1], True
+        self.sequence_number += 1
+        self.published_messages += 1
+        message_id = str(uuid4())
+        self.deduplication_ids[message_deduplication_id] = (message_id, str(self.sequence_number), now)
+        return message_id, str(self.sequence_number), False
+
+
+class FakeQueueState:
+
+    def __init__(self, broker: FakeBroker, name: str, attributes: dict) -> None:
+        self.broker = broker
+        self.name = name
+        self.arn = f"arn:aws:sqs:{REGION}:{ACCOUNT_ID}:{name}"
+        self.url = f"https://sqs.{REGION}.amazonaws.com/{ACCOUNT_ID}/{name}"
+        self.attributes = {"VisibilityTimeout": "30", "ReceiveMessageWaitTimeSeconds": "0", **attributes}
+        self.messages: List[dict] = []
+        self.deduplication_ids: Dict[str, float] = {}
+        self.sequence_number = 10000000000000000000
+
+    @property
+    def is_fifo(self) -> bool:
+        return self.attributes.get("FifoQueue") == "True"
+
+    def get_attributes(self) -> dict:
+        now = time.time()
+        with self.broker.condition:
+            visible_messages = len([message for message in self.messages if message["visible_at"] <= now])
+            attributes = {**self.attributes,
+                          "QueueArn": self.arn,
+                          "ApproximateNumberOfMessages": str(visible_messages),
+                          "ApproximateNumberOfMessagesNotVisible": str(len(self.messages)-visible_messages)}
+        return attributes
+
+    def set_attributes(self, attributes: dict):
+        with self.broker.condition:
+            for key, value in attributes.items():
+                if key == "Policy" and value == "":
+                    self.attributes.pop("Policy", None)
+                else:
+                    self.attributes[key] = str(value)
+
+    def allows(self, topic_arn: str) -> bool:
+        if "Policy" not in self.attributes:
+            return False
+        for statement in json.loads(self.attributes["Policy"]).get("Statement", []):
+            source_arn = statement.get("Condition", {}).get("ArnLike", {}).get("aws:SourceArn")
+            if statement.get("Effect") == "Allow" and source_arn == topic_arn:
+                return True
+        return False
+
+    def append(self, body: str, message_group_id: str | None = None, message_deduplication_id: str | None = None,
+               message_attributes: dict | None = None) -> dict:
+        """
+        Adds a message to the queue. Must be called with the broker's lock held.
+        """
+        message = {"MessageId": str(uuid4()),
+                   "Body": body,
+                   "MessageAttributes": message_attributes,
+                   "visible_at": time.time() + int(self.attributes.get("DelaySeconds", 0)),
+                   "receipt_handle": None,
+                   "Attributes": {"SentTimestamp": str(int(time.time()*1000)),
+                                  "ApproximateReceiveCount": "0"}}
+        if self.is_fifo:
+            if message_group_id is None:
+                raise create_client_error("MissingParameter", "The request must contain the parameter MessageGroupId.", "SendMessage")
+            if message_deduplication_id is None:
+                message_deduplication_id = hashlib.sha256(body.encode()).hexdigest()
+            now = time.time()
+            if now - self.deduplication_ids.get(message_deduplication_id, 0) < DEDUPLICATION_INTERVAL_SECONDS:
+                return message
+            self.deduplication_ids[message_deduplication_id] = now
+            self.sequence_number += 1
+            message["Attributes"].update({"MessageGroupId": message_group_id,
+                                          "MessageDeduplicationId": message_deduplication_id,
+                                          "SequenceNumber": str(self.sequence_number)})
+        self.messages.append(message)
+        self.broker.condition.notify_all()
+        return message
+
+    def __take_visible__(self, max_number: int, now: float) -> List[dict]:
+        taken = []
+        blocked_groups = set()
+        if self.is_fifo:
+            blocked_groups = {message["Attributes"]["MessageGroupId"] for message in self.messages if message["visible_at"] > now}
+        visibility_timeout = int(self.attributes["VisibilityTimeout"])
+        for message in self.messages:
+            if len(taken) >= max_number:
+                break
+            group_id = message["Attributes"].get("MessageGroupId")
+            if message["visible_at"] > now or group_id in blocked_groups:
+                continue
+            message["visible_at"] = now + visibility_timeout
+            message["receipt_handle"] = str(uuid4())
+            message["Attributes"]["ApproximateReceiveCount"] = str(int(message["Attributes"]["ApproximateReceiveCount"]) + 1)
+            taken.append(message)
+        return taken
+
+    def receive(self, max_number: int, wait_time_seconds: float | None) -> List[dict]:
+        if not 1 <= max_number <= MAX_BATCH_ENTRIES:
+            raise create_client_error("InvalidParameterValue", "Value for parameter MaxNumberOfMessages is invalid. Reason: Must be between 1 and 10.", "ReceiveMessage")
+        if wait_time_seconds is None:
+            wait_time_seconds = float(self.attributes["ReceiveMessageWaitTimeSeconds"])
+        deadline = time.time() + wait_time_seconds
+        with self.broker.condition:
+            while True:
+                now = time.time()
+                taken = self.__take_visible__(max_number, now)
+                if taken or now >= deadline:
+                    return [dict(message, Attributes=dict(message["Attributes"])) for message in taken]
+                # Visibility timeouts expire without a notification, so wake up periodically
+                self.broker.condition.wait(min(deadline-now, 0.05))
+
+    def __find_by_receipt_handle__(self, receipt_handle: str) -> dict | None:
+        for message in self.messages:
+            if message["receipt_handle"] == receipt_handle:
+                return message
+        return None
+
+    def __run_batch__(self, entries: List[dict], operation_name: str, action) -> dict:
+        if len(entries) > MAX_BATCH_ENTRIES:
+            raise create_client_error("AWS.SimpleQueueService.TooManyEntriesInBatchRequest", f"Maximum number of entries per request are {MAX_BATCH_ENTRIES}.", operation_name)
+        if len(entries) == 0:
+            raise create_client_error("AWS.SimpleQueueService.EmptyBatchRequest", "There should be at least one entry in the request.", operation_name)
+        response = {"Successful": [], "Failed": []}
+        with self.broker.condition:
+            for entry in entries:
+                message = self.__find_by_receipt_handle__(entry["ReceiptHandle"])
+                if message is None:
+                    response["Failed"].append({"Id": entry["Id"], "SenderFault": True, "Code": "ReceiptHandleIsInvalid",
+                                               "Message": "The input receipt handle is invalid."})
+                    continue
+                action(message, entry)
+                response["Successful"].append({"Id": entry["Id"]})
+            self.broker.condition.notify_all()
+        if not response["Failed"]:
+            response.pop("Failed")
+        return response
+
+    def delete_messages(self, entries: List[dict]) -> dict:
+        return self.__run_batch__(entries, "DeleteMessageBatch", lambda message, entry: self.messages.remove(message))
+
+    def change_visibility(self, entries: List[dict]) -> dict:
+        def set_visibility(message, entry):
+            message["visible_at"] = time.time() + int(entry["VisibilityTimeout"])
+        return self.__run_batch__(entries, "ChangeMessageVisibilityBatch", set_visibility)
+
+
+# Boto3-like resources
+
+class FakeMessage:
+
+    def __init__(self, queue: "FakeQueue", message: dict, attribute_names: List[str], message_attribute_names: List[str]) -> None:
+        self.queue = queue
+        self.queue_url = queue.url
+        self.message_id = message["MessageId"]
+        self.body = message["Body"]
+        self.receipt_handle = message["receipt_handle"]
+        if "All" in attribute_names:
+            self.attributes = message["Attributes"]
+        else:
+            self.attributes = {key: value for key, value in message["Attributes"].items() if key in attribute_names}
+        message_attributes = message["MessageAttributes"] or {}
+        if "All" not in message_attribute_names:
+            message_attributes = {key: value for key, value in message_attributes.items() if key in message_attribute_names}
+        self.message_attributes = message_attributes if message_attributes else None
+
+    def delete(self):
+        self.queue.delete_messages(Entries=[{"Id": "0", "ReceiptHandle": self.receipt_handle}])
+
+    def change_visibility(self, VisibilityTimeout: int):
+        self.queue.change_message_visibility_batch(Entries=[{"Id": "0", "ReceiptHandle": self.receipt_handle, "VisibilityTimeout": VisibilityTimeout}])
+
+
+class FakeQueue:
+
+    def __init__(self, broker: FakeBroker, state: FakeQueueState) -> None:
+        self.broker = broker
+        self.state = state
+        self.url = state.url
+        self.loaded_attributes = None
+
+    @property
+    def attributes(self) -> dict:
+        # Like boto3, loaded on first access and cached until reload()
+        if self.loaded_attributes is None:
+            self.reload()
+        return self.loaded_attributes
+
+    def reload(self):
+        self.broker.operation("GetQueueAttributes")
+        self.loaded_attributes = self.state.get_attributes()
+
+    def set_attributes(self, Attributes: dict):
+        self.broker.operation("SetQueueAttributes")
+        self.state.set_attributes(Attributes)
+
+    def send_message(self, MessageBody: str, MessageGroupId: str | None = None, MessageDeduplicationId: str | None = None,
+                     MessageAttributes: dict | None = None, **kwargs) -> dict:
+        self.broker.operation("SendMessage")
+        with self.broker.condition:
+            message = self.state.append(MessageBody, MessageGroupId, MessageDeduplicationId, MessageAttributes)
+        return {"MessageId": message["MessageId"]}
+
+    def receive_messages(self, MessageAttributeNames: List[str] | None = None, AttributeNames: List[str] | None = None,
+                         MaxNumberOfMessages: int = 1, WaitTimeSeconds: float | None = None, **kwargs) -> List[FakeMessage]:
+        self.broker.operation("ReceiveMessage")
+        attribute_names = (AttributeNames or []) + kwargs.get("MessageSystemAttributeNames", [])
+        return [FakeMessage(self, message, attribute_names, MessageAttributeNames or [])
+                for message in self.state.receive(MaxNumberOfMessages, WaitTimeSeconds)]
+
+    def delete_messages(self, Entries: List[dict]) -> dict:
+        self.broker.operation("DeleteMessageBatch")
+        return self.state.delete_messages(Entries)
+
+    def change_message_visibility_batch(self, Entries: List[dict]) -> dict:
+        self.broker.operation("ChangeMessageVisibilityBatch")
+        return self.state.change_visibility(Entries)
+
+    def delete(self):
+        self.broker.operation("DeleteQueue")
+        with self.broker.condition:
+            self.broker.queues.pop(self.state.name, None)
+
+
+class FakeSqsResource:
+
+    def __init__(self, broker: FakeBroker) -> None:
+        self.broker = broker
+        self.queues = FakeCollection(lambda: [FakeQueue(broker, state) for state in list(broker.queues.values())])
+
+    def create_queue(self, QueueName: str, Attributes: dict | None = None) -> FakeQueue:
+        self.broker.operation("CreateQueue")
+        return FakeQueue(self.broker, self.broker.create_queue(QueueName, Attributes))
+
+    def get_queue_by_name(self, QueueName: str) -> FakeQueue:
+        self.broker.operation("GetQueueUrl")
+        return FakeQueue(self.broker, self.broker.get_queue(QueueName))
+
+    def Queue(self, url: str) -> FakeQueue:
+        return FakeQueue(self.broker, self.broker.get_queue_by_url(url))
+
+
+class FakeSubscription:
+
+    def __init__(self, broker: FakeBroker, arn: str) -> None:
+        self.broker = broker
+        self.arn = arn
+
+    @property
+    def attributes(self) -> dict:
+        self.broker.operation("GetSubscriptionAttributes")
+        with self.broker.condition:
+            return dict(self.broker.subscriptions[self.arn])
+
+    def set_attributes(self, AttributeName: str, AttributeValue: str):
+        self.broker.operation("SetSubscriptionAttributes")
+        with self.broker.condition:
+            self.broker.subscriptions[self.arn][AttributeName] = AttributeValue
+
+    def delete(self):
+        self.broker.operation("Unsubscribe")
+        with self.broker.condition:
+            self.broker.subscriptions.pop(self.arn, None)
+
+
+class FakeTopic:
+
+    def __init__(self, broker: FakeBroker, state: FakeTopicState) -> None:
+        self.broker = broker
+        self.state = state
+        self.arn = state.arn
+        self.subscriptions = FakeCollection(lambda: [FakeSubscription(broker, subscription_arn)
+                                                     for subscription_arn, subscription in list(broker.subscriptions.items())
+                                                     if subscription["TopicArn"] == self.arn])
+
+    @property
+    def attributes(self) -> dict:
+        self.broker.operation("GetTopicAttributes")
+        return dict(self.state.attributes)
+
+    def subscribe(self, Protocol: str, Endpoint: str, ReturnSubscriptionArn: bool = False) -> FakeSubscription:
+        self.broker.operation("Subscribe")
+        return FakeSubscription(self.broker, self.broker.subscribe(self.state, Protocol, Endpoint))
+
+    def publish(self, Message: str, MessageGroupId: str | None = None, MessageDeduplicationId: str | None = None,
+                MessageAttributes: dict | None = None, **kwargs) -> dict:
+        self.broker.operation("Publish")
+        return self.broker.publish(self.arn, Message, MessageGroupId, MessageDeduplicationId, MessageAttributes)
+
+    def delete(self):
+        self.broker.operation("DeleteTopic")
+        with self.broker.condition:
+            self.broker.topics.pop(self.state.name, None)
+            for subscription_arn in [arn for arn, subscription in self.broker.subscriptions.items() if subscription["TopicArn"] == self.arn]:
+                self.broker.subscriptions.pop(subscription_arn)
+
+
+class FakePaginator:
+
+    def __init__(self, list_function) -> None:
+        self.list_function = list_function
+
+    def paginate(self, **kwargs):
+        next_token = None
+        while True:
+            page = self.list_function(NextToken=next_token, **kwargs)
+            yield page
+            next_token = page.get("NextToken")
+            if next_token is None:
+                return
+
+
+class FakeSnsClient:
+
+    def __init__(self, broker: FakeBroker) -> None:
+        self.broker = broker
+
+    def publish(self, Message: str, TopicArn: str | None = None, PhoneNumber: str | None = None,
+                MessageGroupId: str | None = None, MessageDeduplicationId: str | None = None,
+                MessageAttributes: dict | None = None, **kwargs) -> dict:
+        self.broker.operation("Publish")
+        if TopicArn is None:
+            return {"MessageId": str(uuid4())}
+        return self.broker.publish(TopicArn, Message, MessageGroupId, MessageDeduplicationId, MessageAttributes)
+
+    def publish_batch(self, TopicArn: str, PublishBatchRequestEntries: List[dict]) -> dict:
+        self.broker.operation("PublishBatch")
+        if len(PublishBatchRequestEntries) > MAX_BATCH_ENTRIES:
+            raise create_client_error("TooManyEntriesInBatchRequest", f"The batch request contains more entries than permissible ({MAX_BATCH_ENTRIES}).", "PublishBatch")
+        if len({entry["Id"] for entry in PublishBatchRequestEntries}) != len(PublishBatchRequestEntries):
+            raise create_client_error("BatchEntryIdsNotDistinct", "Two or more batch entries in the request have the same Id.", "PublishBatch")
+        if sum(len(entry["Message"].encode()) for entry in PublishBatchRequestEntries) > MAX_BATCH_BYTES:
+            raise create_client_error("BatchRequestTooLong", f"The length of all the messages put together is more than the limit ({MAX_BATCH_BYTES} bytes).", "PublishBatch")
+        response = {"Successful": [], "Failed": []}
+        for entry in PublishBatchRequestEntries:
+            try:
+                result = self.broker.publish(TopicArn, entry["Message"], entry.get("MessageGroupId"),
+                                             entry.get("MessageDeduplicationId"), entry.get("MessageAttributes"))
+                response["Successful"].append({"Id": entry["Id"], **result})
+            except ClientError as error:
+                if error.response["Error"]["Code"] == "NotFound":
+                    raise
+                response["Failed"].append({"Id": entry["Id"], "Code": error.response["Error"]["Code"],
+                                           "Message": error.response["Error"]["Message"], "SenderFault": True})
+        return response
+
+    def create_topic(self, Name: str, Attributes: dict | None = None) -> dict:
+        self.broker.operation("CreateTopic")
+        return {"TopicArn": self.broker.create_topic(Name, Attributes).arn}
+
+    def subscribe(self, TopicArn: str, Protocol: str, Endpoint: str, ReturnSubscriptionArn: bool = False) -> dict:
+        self.broker.operation("Subscribe")
+        return {"SubscriptionArn": self.broker.subscribe(self.broker.get_topic_by_arn(TopicArn), Protocol, Endpoint)}
+
+    def unsubscribe(self, SubscriptionArn: str):
+        self.broker.operation("Unsubscribe")
+        with self.broker.condition:
+            self.broker.subscriptions.pop(SubscriptionArn, None)
+
+    @staticmethod
+    def __page__(subscriptions: List[dict], next_token: str | None) -> dict:
+        start = int(next_token) if next_token else 0
+        response = {"Subscriptions": subscriptions[start:start+LIST_PAGE_SIZE]}
+        if start+LIST_PAGE_SIZE < len(subscriptions):
+            response["NextToken"] = str(start+LIST_PAGE_SIZE)
+        return response
+
+    def list_subscriptions(self, NextToken: str | None = None) -> dict:
+        self.broker.operation("ListSubscriptions")
+        with self.broker.condition:
+            subscriptions = [dict(subscription) for subscription in self.broker.subscriptions.values()]
+        return self.__page__(subscriptions, NextToken)
+
+    def list_subscriptions_by_topic(self, TopicArn: str, NextToken: str | None = None) -> dict:
+        self.broker.operation("ListSubscriptionsByTopic")
+        with self.broker.condition:
+            self.broker.get_topic_by_arn(TopicArn)
+            subscriptions = [dict(subscription) for subscription in self.broker.subscriptions.values() if subscription["TopicArn"] == TopicArn]
+        return self.__page__(subscriptions, NextToken)
+
+    def get_paginator(self, operation_name: str):
+        if operation_name == "list_subscriptions":
+            return FakePaginator(self.list_subscriptions)
+        if operation_name == "list_subscriptions_by_topic":
+            return FakePaginator(self.list_subscriptions_by_topic)
+        raise NotImplementedError(operation_name)
+
+
+class FakeSnsResource:
+
+    def __init__(self, broker: FakeBroker) -> None:
+        self.broker = broker
+        self.meta = SimpleNamespace(client=FakeSnsClient(broker))
+        self.topics = FakeCollection(self.__list_topics__)
+        self.subscriptions = FakeCollection(self.__list_subscriptions__)
+
+    def __list_topics__(self):
+        self.broker.operation("ListTopics")
+        return [FakeTopic(self.broker, state) for state in list(self.broker.topics.values())]
+
+    def __list_subscriptions__(self):
+        self.broker.operation("ListSubscriptions")
+        return [FakeSubscription(self.broker, subscription_arn) for subscription_arn in list(self.broker.subscriptions)]
+
+    def create_topic(self, Name: str, Attributes: dict | None = None) -> FakeTopic:
+        self.broker.operation("CreateTopic")
+        return FakeTopic(self.broker, self.broker.create_topic(Name, Attributes))
+
+    def Topic(self, arn: str) -> FakeTopic:
+        return FakeTopic(self.broker, self.broker.get_topic_by_arn(arn))
+
+    def Subscription(self, arn: str) -> FakeSubscription:
+        return FakeSubscription(self.broker, arn)
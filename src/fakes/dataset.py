@@ -0,0 +1,219 @@
+"""
+Synthetic media libraries for scale testing, in a compact fixed-width binary file that is memory-mapped instead
+of loaded into Python objects.
+
+The file is a 64 bytes header followed by one 48 bytes record per media item:
+    media_id (16) | owner_id (16) | created_on (int64 epoch seconds, -1 when missing) | width (uint16) |
+    height (uint16, 0 when missing) | media_type (uint8) | metadata flags (uint8) | job status (uint8) | reserved
+The media ID and the job ID of a record are the dataset's prefix followed by the index of the record, so a record
+is found by its ID without an index in memory. A record is decoded to a dict (like the Media DB responses) only
+when it is read.
+"""
+import mmap
+import random
+import struct
+from datetime import datetime, timezone
+from typing import Iterator
+from uuid import UUID
+
+HEADER_MAGIC = b"SHKMEDIA"
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct("<8sHHIQ8s8s24x") # magic, version, record size, users, records, media ID prefix, job ID prefix
+RECORD_STRUCT = struct.Struct("<16s16sqHHBBBx")
+JOB_STATUS_OFFSET = 16 + 16 + 8 + 2 + 2 + 1 + 1
+MISSING_TIMESTAMP = -1
+
+# Job statuses of the records
+NO_JOB = 0
+PENDING_JOB = 1
+DONE_JOB = 2
+JOB_STATUS_NAMES = {PENDING_JOB: "PENDING", DONE_JOB: "DONE"}
+
+MEDIA_TYPES = ("IMAGE", "VIDEO")
+
+# Metadata flags
+HAS_LOCATION = 1
+HAS_CAMERA = 2
+
+# The relative number of photos taken at each hour of the day
+HOURS_WEIGHTS = (1, 0.5, 0.3, 0.2, 0.2, 0.3, 0.8, 1.5, 2.5, 3, 3.5, 4, 4.5, 4.5, 4.5, 5, 5.5, 6, 6.5, 6.5, 5.5, 4, 3, 2)
+
+
+def create_id(prefix: bytes, index: int) -> UUID:
+    return UUID(bytes=prefix + index.to_bytes(8, "big"))
+
+
+def generate_dataset(location: str,
+                     media_number: int,
+                     users_number: int = 1000,
+                     user_skew: float = 1.1,
+                     start_year: int = 2005,
+                     end_year: int = 2024,
+                     yearly_growth: float = 1.25,
+                     burst_probability: float = 0.6,
+                     burst_gap_seconds: float = 90,
+                     missing_metadata_rate: float = 0.05,
+                     video_rate: float = 0.1,
+                     pending_jobs_rate: float = 0.1,
+                     done_jobs_rate: float = 0.5,
+                     random_seed: int | None = None,
+                     chunk_size: int = 65536):
+    """
+    Writes a synthetic library:
+      - the owners follow a Zipf distribution: the user of rank r owns a share proportional to 1/r**user_skew
+      - the photos per year grow by yearly_growth, the hours of the day follow HOURS_WEIGHTS, and a photo
+        continues the burst (same owner, seconds to minutes later) of the previous one with burst_probability
+      - the creation time and the dimensions are missing with missing_metadata_rate
+      - a record has a pending job with pending_jobs_rate, a done job with done_jobs_rate, or no job
+
+    :param chunk_size: The number of records packed in memory before they are written.
+    """
+    if pending_jobs_rate + done_jobs_rate > 1:
+        raise ValueError("pending_jobs_rate + done_jobs_rate must be at most 1")
+    generator = random.Random(random_seed)
+    media_id_prefix, job_id_prefix = generator.randbytes(8), generator.randbytes(8)
+    owner_ids = [generator.randbytes(16) for _ in range(users_number)]
+    owner_cumulative_weights = []
+    total_weight = 0.0
+    for rank in range(1, users_number + 1):
+        total_weight += 1 / rank ** user_skew
+        owner_cumulative_weights.append(total_weight)
+    years = list(range(start_year, end_year + 1))
+    years_cumulative_weights = []
+    total_weight = 0.0
+    for year_index in range(len(years)):
+        total_weight += yearly_growth ** year_index
+        years_cumulative_weights.append(total_weight)
+    years_start = {year: int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()) for year in years}
+    hours_cumulative_weights = []
+    total_weight = 0.0
+    for hour_weight in HOURS_WEIGHTS:
+        total_weight += hour_weight
+        hours_cumulative_weights.append(total_weight)
+
+    with open(location, "wb") as dataset_file:
+        dataset_file.write(HEADER_STRUCT.pack(HEADER_MAGIC, FORMAT_VERSION, RECORD_STRUCT.size, users_number, media_number,
+                                              media_id_prefix, job_id_prefix))
+        owner_id, created_on = owner_ids[0], years_start[start_year]
+        for chunk_start in range(0, media_number, chunk_size):
+            chunk = bytearray(RECORD_STRUCT.size * min(chunk_size, media_number - chunk_start))
+            for offset, index in enumerate(range(chunk_start, min(chunk_start + chunk_size, media_number))):
+                if index > 0 and generator.random() < burst_probability:
+                    created_on += int(generator.expovariate(1 / burst_gap_seconds)) + 1
+                else:
+                    owner_id = generator.choices(owner_ids, cum_weights=owner_cumulative_weights)[0]
+                    year = generator.choices(years, cum_weights=years_cumulative_weights)[0]
+                    hour = generator.choices(range(24), cum_weights=hours_cumulative_weights)[0]
+                    created_on = years_start[year] + generator.randrange(365) * 86400 + hour * 3600 + generator.randrange(3600)
+                metadata_missing = generator.random() < missing_metadata_rate
+                is_video = generator.random() < video_rate
+                width, height = (0, 0) if metadata_missing else ((1920, 1080) if is_video else generator.choice(((4032, 3024), (3024, 4032), (1600, 1200))))
+                metadata_flags = 0
+                if not metadata_missing:
+                    metadata_flags |= HAS_LOCATION if generator.random() < 0.6 else 0
+                    metadata_flags |= HAS_CAMERA if generator.random() < 0.9 else 0
+                job_draw = generator.random()
+                job_status = PENDING_JOB if job_draw < pending_jobs_rate else (DONE_JOB if job_draw < pending_jobs_rate + done_jobs_rate else NO_JOB)
+                RECORD_STRUCT.pack_into(chunk, offset * RECORD_STRUCT.size,
+                                        media_id_prefix + index.to_bytes(8, "big"), owner_id,
+                                        MISSING_TIMESTAMP if metadata_missing else created_on,
+                                        width, height, int(is_video), metadata_flags, job_status)
+            dataset_file.write(chunk)
+
+
+class MmapDataset:
+    """
+    Reads a dataset written by generate_dataset, through a read-only memory map.
+
+    :param location: The dataset file.
+    :param insight_engine_id: The engine ID set on the job records.
+    """
+
+    def __init__(self, location: str, insight_engine_id: str | None = None) -> None:
+        self.location = location
+        self.insight_engine_id = insight_engine_id
+        with open(location, "rb") as dataset_file:
+            self.buffer = mmap.mmap(dataset_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.users_number, self.records_number, self.media_id_prefix, self.job_id_prefix = HEADER_STRUCT.unpack_from(self.buffer, 0)
+        if magic != HEADER_MAGIC or version != FORMAT_VERSION or record_size != RECORD_STRUCT.size:
+            raise ValueError(f"{location} is not a version {FORMAT_VERSION} media dataset")
+        if len(self.buffer) != HEADER_STRUCT.size + self.records_number * RECORD_STRUCT.size:
+            raise ValueError(f"{location} is truncated")
+
+    def __len__(self) -> int:
+        return self.records_number
+
+    def __unpack__(self, index: int):
+        if not 0 <= index < self.records_number:
+            raise IndexError(index)
+        return RECORD_STRUCT.unpack_from(self.buffer, HEADER_STRUCT.size + index * RECORD_STRUCT.size)
+
+    def __index_of__(self, record_id, prefix: bytes) -> int | None:
+        try:
+            id_bytes = UUID(str(record_id)).bytes
+        except ValueError:
+            return None
+        if id_bytes[:8] != prefix:
+            return None
+        index = int.from_bytes(id_bytes[8:], "big")
+        return index if index < self.records_number else None
+
+    def media_index(self, media_id) -> int | None:
+        """
+        :return: The index of the record of the media ID, None if it is not of this dataset.
+        """
+        return self.__index_of__(media_id, self.media_id_prefix)
+
+    def job_index(self, job_id) -> int | None:
+        """
+        :return: The index of the record of the job ID, None if it is not a job of this dataset.
+        """
+        return self.__index_of__(job_id, self.job_id_prefix)
+
+    def media_id(self, index: int) -> str:
+        return str(create_id(self.media_id_prefix, index))
+
+    def job_id(self, index: int) -> str:
+        return str(create_id(self.job_id_prefix, index))
+
+    def media_record(self, index: int) -> dict:
+        """
+        :return: The media item as a Media DB media record.
+        """
+        media_id, owner_id, created_on, width, height, media_type, metadata_flags, _ = self.__unpack__(index)
+        return {"media_id": str(UUID(bytes=media_id)),
+                "owner_id": str(UUID(bytes=owner_id)),
+                "name": f"IMG_{index:08d}.{'mp4' if media_type else 'jpg'}",
+                "media_type": MEDIA_TYPES[media_type],
+                "created_on": None if created_on == MISSING_TIMESTAMP else datetime.fromtimestamp(created_on, timezone.utc).isoformat(),
+                "width": width or None,
+                "height": height or None,
+                "has_location": bool(metadata_flags & HAS_LOCATION),
+                "has_camera_details": bool(metadata_flags & HAS_CAMERA),
+                "uploaded_status": "UPLOADED"}
+
+    def job_record(self, index: int) -> dict | None:
+        """
+        :return: The job of the media item as a Media DB job record, None if it has no job.
+        """
+        job_status = self.__unpack__(index)[-1]
+        if job_status == NO_JOB:
+            return None
+        return {"id": self.job_id(index),
+                "media_id": self.media_id(index),
+                "insight_engine_id": self.insight_engine_id,
+                "status": JOB_STATUS_NAMES[job_status]}
+
+    def job_statuses(self) -> bytearray:
+        """
+        :return: A (mutable) copy of the job status of every record, copied from the map without decoding the records.
+        """
+        with memoryview(self.buffer) as buffer_view, buffer_view[HEADER_STRUCT.size + JOB_STATUS_OFFSET::RECORD_STRUCT.size] as statuses_view:
+            return bytearray(statuses_view)
+
+    def iter_media_records(self, start: int = 0) -> Iterator[dict]:
+        for index in range(start, self.records_number):
+            yield self.media_record(index)
+
+    def close(self):
+        self.buffer.close()
@@ -0,0 +1,233 @@
+"""
+In-process stand-in for the Media DB service, duck-typed after db.service.MediaDBService.
+
+The media are held in memory; jobs are created by put_jobs and the pending ones stay pending until update_jobs updates them.
+The search results mimic search.SearchResult (results and total_results_number), with the items as dicts, so
+the stand-in doesn't depend on the models package. DatasetMediaDBService serves a memory-mapped synthetic dataset
+instead (see fakes.dataset). Latency and failures are injected per endpoint with the broker's FaultInjector
+(a failure is raised as a ConnectionError, like a Media DB outage).
+"""
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple
+
+from botocore.exceptions import ClientError
+
+from .broker import FaultInjector
+from .dataset import MmapDataset, NO_JOB, PENDING_JOB, DONE_JOB, JOB_STATUS_NAMES
+
+CREATED_JOB = 3 # The job status of a dataset record whose job was created during the run
+
+
+class FakeSearchResult(NamedTuple):
+    results: List[dict]
+    total_results_number: int
+
+
+class FakeMediaDBService:
+    """
+    :param engine: The insight engine record returned by search_engine.
+    :param media_records: The media records (dicts with a media_id).
+    :param default_batch_size: The page size when a request doesn't set one.
+    :param fault_injector: Injects latency and failures by endpoint name (e.g. get_pending_jobs).
+    """
+
+    def __init__(self,
+                 engine: dict,
+                 media_records: Iterable[dict] = (),
+                 default_batch_size: int = 1000,
+                 fault_injector: FaultInjector | None = None) -> None:
+        self.engine = engine
+        self.default_batch_size = default_batch_size
+        self.fault_injector = fault_injector if fault_injector is not None else FaultInjector()
+        self.available = True
+        self.lock = threading.Lock()
+        self.media: Dict[str, dict] = {}
+        # Ordered, so the media are returned in the order they were added
+        self.media_without_jobs: Dict[str, None] = {}
+        self.jobs: Dict[str, dict] = {}
+        self.pending_jobs: Dict[str, None] = {}
+        self.insights: List[dict] = []
+        self.add_media(media_records)
+
+    def add_media(self, media_records: Iterable[dict]):
+        with self.lock:
+            for media_record in media_records:
+                media_id = str(media_record["media_id"])
+                self.media[media_id] = media_record
+                self.media_without_jobs[media_id] = None
+
+    def __request__(self, endpoint: str):
+        if not self.available:
+            raise ConnectionError(f"Media DB is unavailable ({endpoint})")
+        try:
+            self.fault_injector.before_operation(endpoint)
+        except ClientError as err:
+            raise ConnectionError(f"Media DB request failed ({endpoint})") from err
+
+    def search_engine(self, engine_name: str, batch_size: int | None = None) -> FakeSearchResult:
+        self.__request__("search_engine")
+        results = [self.engine] if self.engine["name"] == engine_name else []
+        return FakeSearchResult(results, len(results))
+
+    def get_media_to_analyze(self, engine_name: str, batch_size: int | None = None, created_after: str | None = None) -> FakeSearchResult:
+        self.__request__("get_media_to_analyze")
+        with self.lock:
+            media_ids = self.media_without_jobs
+            if created_after is not None:
+                # The ISO timestamps (of the same format) compare as strings
+                media_ids = [media_id for media_id in media_ids if (self.media[media_id].get("created_on") or "") >= created_after]
+            results = [self.media[media_id] for media_id in islice(media_ids, batch_size or self.default_batch_size)]
+            return FakeSearchResult(results, len(media_ids))
+
+    def get_media_by_ids(self, media_ids_list: List[str]) -> FakeSearchResult:
+        self.__request__("get_media_by_ids")
+        with self.lock:
+            results = [self.media[str(media_id)] for media_id in media_ids_list if str(media_id) in self.media]
+        return FakeSearchResult(results, len(results))
+
+    def search_media(self,
+                     owner_id: str | None = None,
+                     created_after: str | None = None,
+                     created_before: str | None = None,
+                     page_size: int | None = None,
+                     page_number: int = 0) -> FakeSearchResult:
+        self.__request__("search_media")
+        page_size = page_size or self.default_batch_size
+        with self.lock:
+            # The ISO timestamps (of the same format) compare as strings
+            results = [media_record for media_record in self.media.values()
+                       if (owner_id is None or str(media_record.get("owner_id")) == owner_id)
+                       and (created_after is None or (media_record.get("created_on") or "") >= created_after)
+                       and (created_before is None or (media_record.get("created_on") or "") < created_before)]
+        return FakeSearchResult(results[page_number * page_size:(page_number + 1) * page_size], len(results))
+
+    def get_pending_jobs(self, engine_id: str, batch_size: int | None = None, created_after: str | None = None) -> FakeSearchResult:
+        self.__request__("get_pending_jobs")
+        with self.lock:
+            job_ids = self.pending_jobs
+            if created_after is not None:
+                job_ids = [job_id for job_id in job_ids if (self.jobs[job_id].get("start_time") or "") >= created_after]
+            results = [self.jobs[job_id] for job_id in islice(job_ids, batch_size or self.default_batch_size)]
+            return FakeSearchResult(results, len(job_ids))
+
+    def put_jobs(self, job_list) -> int:
+        self.__request__("put_jobs")
+        with self.lock:
+            for job in job_list:
+                job_dict = job.model_dump(mode="json")
+                job_id = str(job_dict["id"])
+                self.jobs[job_id] = job_dict
+                # Jobs created already done (e.g. by a backfill) are not pending
+                if job_dict.get("status") in (None, JOB_STATUS_NAMES[PENDING_JOB]):
+                    self.pending_jobs[job_id] = None
+                self.media_without_jobs.pop(str(job_dict["media_id"]), None)
+        return len(job_list)
+
+    def update_jobs(self, job_list) -> int:
+        return self.update_jobs_json([job.model_dump(mode="json") for job in job_list])
+
+    def update_jobs_json(self, json: List[dict]) -> int:
+        self.__request__("update_jobs")
+        with self.lock:
+            for job_dict in json:
+                job_id = str(job_dict["id"])
+                self.jobs[job_id] = job_dict
+                self.pending_jobs.pop(job_id, None)
+        return len(json)
+
+    def put_insights(self, insights_list) -> int:
+        return self.put_insights_json([insight.model_dump(mode="json") for insight in insights_list])
+
+    def put_insights_json(self, json: List[dict]) -> int:
+        self.__request__("put_insights")
+        with self.lock:
+            self.insights.extend(json)
+        return len(json)
+
+
+class DatasetMediaDBService(FakeMediaDBService):
+    """
+    The Media DB stand-in over a memory-mapped synthetic dataset (see fakes.dataset), for libraries of millions
+    of media items. The records are decoded only when they are returned; the state kept in memory is one byte
+    of job status per record and the jobs created or updated during the run.
+
+    :param dataset: The dataset. Its pending jobs are the initial backlog.
+    """
+
+    def __init__(self,
+                 engine: dict,
+                 dataset: MmapDataset,
+                 default_batch_size: int = 1000,
+                 fault_injector: FaultInjector | None = None) -> None:
+        super().__init__(engine, (), default_batch_size, fault_injector)
+        self.dataset = dataset
+        self.job_statuses = dataset.job_statuses()
+        # The records before the cursors have a job (media cursor) or no pending job of the dataset (jobs cursor)
+        self.media_cursor = 0
+        self.jobs_cursor = 0
+
+    def __scan__(self, cursor: int, status: int, limit: int):
+        indexes = []
+        index = self.job_statuses.find(status, cursor)
+        next_cursor = len(self.job_statuses) if index < 0 else index
+        while 0 <= index and len(indexes) < limit:
+            indexes.append(index)
+            index = self.job_statuses.find(status, index + 1)
+        return indexes, next_cursor
+
+    def get_media_to_analyze(self, engine_name: str, batch_size: int | None = None, created_after: str | None = None) -> FakeSearchResult:
+        self.__request__("get_media_to_analyze")
+        if created_after is not None:
+            # Decodes all the records without a job, for tests of small datasets
+            with self.lock:
+                indexes, _ = self.__scan__(self.media_cursor, NO_JOB, len(self.job_statuses))
+            media_records = [media_record for media_record in map(self.dataset.media_record, indexes) if (media_record["created_on"] or "") >= created_after]
+            return FakeSearchResult(media_records[:batch_size or self.default_batch_size], len(media_records))
+        with self.lock:
+            indexes, self.media_cursor = self.__scan__(self.media_cursor, NO_JOB, batch_size or self.default_batch_size)
+            total_results_number = self.job_statuses.count(NO_JOB)
+        return FakeSearchResult([self.dataset.media_record(index) for index in indexes], total_results_number)
+
+    def get_media_by_ids(self, media_ids_list: List[str]) -> FakeSearchResult:
+        self.__request__("get_media_by_ids")
+        indexes = [self.dataset.media_index(media_id) for media_id in media_ids_list]
+        results = [self.dataset.media_record(index) for index in indexes if index is not None]
+        return FakeSearchResult(results, len(results))
+
+    def get_pending_jobs(self, engine_id: str, batch_size: int | None = None, created_after: str | None = None) -> FakeSearchResult:
+        if created_after is not None:
+            # The jobs of the dataset were created before the run
+            return super().get_pending_jobs(engine_id, batch_size, created_after)
+        self.__request__("get_pending_jobs")
+        batch_size = batch_size or self.default_batch_size
+        with self.lock:
+            indexes, self.jobs_cursor = self.__scan__(self.jobs_cursor, PENDING_JOB, batch_size)
+            results = [self.dataset.job_record(index) for index in indexes]
+            results += [self.jobs[job_id] for job_id in islice(self.pending_jobs, batch_size - len(results))]
+            return FakeSearchResult(results, self.job_statuses.count(PENDING_JOB) + len(self.pending_jobs))
+
+    def put_jobs(self, job_list) -> int:
+        created_number = super().put_jobs(job_list)
+        with self.lock:
+            for job in job_list:
+                index = self.dataset.media_index(job.media_id)
+                if index is not None:
+                    self.job_statuses[index] = CREATED_JOB
+        return created_number
+
+    def update_jobs_json(self, json: List[dict]) -> int:
+        self.__request__("update_jobs")
+        with self.lock:
+            for job_dict in json:
+                job_id = str(job_dict["id"])
+                index = self.dataset.job_index(job_id)
+                if index is not None:
+                    self.job_statuses[index] = DONE_JOB
+                else:
+                    self.jobs[job_id] = job_dict
+                    self.pending_jobs.pop(job_id, None)
+        return len(json)
@@ -0,0 +1,180 @@
+"""
+Backfill (reprocessing) of a library, e.g. after an engine change: the media are streamed from a source in chunks,
+and each chunk is processed with MonthsEngineLogics.process_media (parallel extraction, bulk writes, no pending jobs
+to poll). The processed media per second are rate limited to protect the Media DB, and the progress is checkpointed
+after each chunk, so an interrupted backfill resumes after the last written chunk.
+"""
+import os
+import json
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Tuple, TYPE_CHECKING
+
+from concurrency.rate_limit import TokenBucket
+from metrics.registry import metrics_registry
+from .records import MediaRecord
+
+if TYPE_CHECKING:
+    from db.service import MediaDBService
+    from .service import MonthsEngineLogics
+
+backfill_media = metrics_registry.counter("shkedia_worker_backfill_media_total", "Media processed by the backfill")
+backfill_missing_media = metrics_registry.counter("shkedia_worker_backfill_missing_media_total", "Media IDs of the backfill that were not found")
+
+
+class MediaIdsFileSource:
+    """
+    Streams the media IDs of a file, one per line. The cursor is the line index.
+    """
+
+    def __init__(self, location: str) -> None:
+        self.location = location
+
+    def description(self) -> str:
+        return f"file:{os.path.abspath(self.location)}"
+
+    def items(self, after_cursor: int | None = None) -> Iterator[Tuple[int, str]]:
+        with open(self.location) as media_ids_file:
+            for line_index, line in enumerate(media_ids_file):
+                media_id = line.strip()
+                if media_id and (after_cursor is None or line_index > after_cursor):
+                    yield line_index, media_id
+
+
+class MediaSearchSource:
+    """
+    Streams the media of a Media DB search (all the media, or of a user or a creation time range), a page at a time.
+    The cursor is the index of the media in the search results.
+    """
+
+    def __init__(self,
+                 media_db_service: "MediaDBService",
+                 owner_id: str | None = None,
+                 created_after: str | None = None,
+                 created_before: str | None = None,
+                 page_size: int = 1000) -> None:
+        self.media_db_service = media_db_service
+        self.owner_id = owner_id
+        self.created_after = created_after
+        self.created_before = created_before
+        self.page_size = page_size
+
+    def description(self) -> str:
+        return f"search:owner_id={self.owner_id},created_after={self.created_after},created_before={self.created_before},page_size={self.page_size}"
+
+    def items(self, after_cursor: int | None = None) -> Iterator[Tuple[int, dict]]:
+        start_index = 0 if after_cursor is None else after_cursor + 1
+        page_number = start_index // self.page_size
+        while True:
+            search_result = self.media_db_service.search_media(owner_id=self.owner_id, created_after=self.created_after, created_before=self.created_before,
+                                                               page_size=self.page_size, page_number=page_number)
+            for offset, media_item in enumerate(search_result.results):
+                index = page_number * self.page_size + offset
+                if index >= start_index:
+                    yield index, media_item
+            if len(search_result.results) < self.page_size:
+                return
+            page_number += 1
+
+
+class BackfillCheckpoint:
+    """
+    The progress of a backfill in a JSON file: the cursor of the last processed item of the source, replaced atomically.
+    """
+
+    def __init__(self, location: str) -> None:
+        self.location = location
+
+    def load(self, source_description: str) -> dict | None:
+        """
+        :return: The saved progress, None if the backfill didn't start.
+        """
+        if not os.path.exists(self.location):
+            return None
+        with open(self.location) as checkpoint_file:
+            progress = json.load(checkpoint_file)
+        if progress["source"] != source_description:
+            raise ValueError(f"The checkpoint {self.location} is of another backfill ({progress['source']})")
+        return progress
+
+    def save(self, source_description: str, cursor: int, processed_number: int):
+        temporary_location = f"{self.location}.tmp"
+        with open(temporary_location, "w") as checkpoint_file:
+            json.dump({"source": source_description, "cursor": cursor, "processed": processed_number}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_location, self.location)
+
+
+class BackfillRunner:
+    """
+    :param engine_logics: Processes the chunks, see MonthsEngineLogics.process_media.
+    :param source: MediaIdsFileSource or MediaSearchSource. The media IDs are fetched from the Media DB a chunk at a time.
+    :param checkpoint: Where the progress is saved. The backfill starts over without it.
+    :param chunk_size: The media of a bulk write.
+    :param max_workers: The threads of the extraction.
+    :param max_media_per_second: The rate limit of the processed media, unlimited if not set.
+    """
+
+    def __init__(self,
+                 engine_logics: "MonthsEngineLogics",
+                 source: MediaIdsFileSource | MediaSearchSource,
+                 checkpoint: BackfillCheckpoint | None = None,
+                 chunk_size: int = 500,
+                 max_workers: int = 8,
+                 max_media_per_second: float | None = None) -> None:
+        self.engine_logics = engine_logics
+        self.source = source
+        self.checkpoint = checkpoint
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(max_media_per_second, capacity=max(max_media_per_second, chunk_size)) if max_media_per_second else None
+        self.stopping = threading.Event()
+
+    def __hydrate__(self, chunk: List[Tuple[int, str | dict]]) -> List[MediaRecord]:
+        media_ids = [item for _, item in chunk if isinstance(item, str)]
+        media_by_id = {}
+        if media_ids:
+            media_by_id = self.engine_logics.fetch_media(media_ids)
+            backfill_missing_media.inc(len(set(media_ids) - set(media_by_id)))
+        return [MediaRecord.from_dict(item) if isinstance(item, dict) else media_by_id[item]
+                for _, item in chunk if isinstance(item, dict) or item in media_by_id]
+
+    def run(self) -> int:
+        """
+        Processes the source from the checkpoint to its end (or until stop). A chunk that failed (e.g. its writes
+        were rejected) stops the backfill before it is checkpointed, so the next run starts with it.
+
+        :return: The number of processed media, of this run and the runs before it.
+        """
+        source_description = self.source.description()
+        progress = self.checkpoint.load(source_description) if self.checkpoint is not None else None
+        cursor, processed_number = (progress["cursor"], progress["processed"]) if progress is not None else (None, 0)
+        if progress is not None:
+            logger.info(f"Resume backfill after {cursor} ({processed_number} media were processed)")
+        items = self.source.items(after_cursor=cursor)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="backfill") as executor:
+            while not self.stopping.is_set():
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    break
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(len(chunk))
+                media_records = self.__hydrate__(chunk)
+                chunk_processed_number = self.engine_logics.process_media(media_records, executor=executor)
+                processed_number += chunk_processed_number
+                backfill_media.inc(chunk_processed_number)
+                if self.checkpoint is not None:
+                    self.checkpoint.save(source_description, chunk[-1][0], processed_number)
+                logger.info(f"Backfill processed {processed_number} media")
+        return processed_number
+
+    def stop(self):
+        """
+        Stops after the current chunk; it is checkpointed, so the next run continues after it.
+        """
+        self.stopping.set()
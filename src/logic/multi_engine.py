@@ -0,0 +1,119 @@
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import Dict, List, TYPE_CHECKING
+
+from metrics.registry import metrics_registry
+from profiling.timers import StageTimers, get_stage_timers
+from .records import MediaRecord
+
+if TYPE_CHECKING:
+    from db.service import MediaDBService
+    from .service import MonthsEngineLogics
+
+shared_media = metrics_registry.counter("shkedia_worker_shared_media_total", "Media fetches saved by fetching the media of several engines' jobs once")
+engine_batch_size = metrics_registry.gauge("shkedia_worker_engine_batch_size", "The share of the batch of each hosted engine", ("engine",))
+engine_errors = metrics_registry.counter("shkedia_worker_engine_errors_total", "Iterations of a hosted engine that failed", ("engine",))
+
+
+class MultiEngineLogics:
+    """
+    Hosts several engines in one process. Each iteration every engine creates and fetches its own jobs (its own job
+    bookkeeping, spool and stage timers), the media of all the jobs are fetched from the Media DB once, and each
+    engine extracts the insights of its jobs from the shared media records.
+
+    :param engines_logics: The logics of the hosted engines, e.g. MonthsEngineLogics.
+    :param weights: The scheduling weight by engine name (1 if missing). The batch of an iteration is shared
+                    between the engines by their weights.
+    :param batch_process_size: The number of jobs of an iteration, of all the engines together.
+    """
+
+    def __init__(self,
+                 media_db_service: "MediaDBService",
+                 engines_logics: List["MonthsEngineLogics"],
+                 weights: Dict[str, float] | None = None,
+                 batch_process_size: int = 200,
+                 batch_processing_period_minutes: float = 120,
+                 stage_timers: StageTimers | None = None,) -> None:
+        if not engines_logics:
+            raise ValueError("At least one engine must be hosted")
+        self.media_db_service = media_db_service
+        self.engines_logics = engines_logics
+        self.weights = weights if weights is not None else {}
+        for engine_name, weight in self.weights.items():
+            if weight <= 0:
+                raise ValueError(f"The weight of {engine_name} must be positive")
+        self.batch_process_size = batch_process_size
+        self.batch_processing_period_minutes = batch_processing_period_minutes
+        self.stage_timers = stage_timers if stage_timers is not None else get_stage_timers("multi_engine")
+        self.stopping = threading.Event()
+
+    @staticmethod
+    def engine_name(engine_logics: "MonthsEngineLogics") -> str:
+        return engine_logics.engine_details.name
+
+    def batch_sizes(self) -> Dict[str, int]:
+        """
+        :return: The number of jobs each engine fetches in an iteration, at least one.
+        """
+        engines_weights = {self.engine_name(engine_logics): self.weights.get(self.engine_name(engine_logics), 1.0)
+                           for engine_logics in self.engines_logics}
+        total_weight = sum(engines_weights.values())
+        return {engine_name: max(1, round(self.batch_process_size * weight / total_weight))
+                for engine_name, weight in engines_weights.items()}
+
+    def resolve_engine(self):
+        """
+        Looks all the hosted engines up in the Media DB, like MonthsEngineLogics.resolve_engine.
+        """
+        for engine_logics in self.engines_logics:
+            engine_logics.resolve_engine()
+
+    def process_batch(self) -> int:
+        """
+        Runs one iteration of every hosted engine. A failing engine is skipped until the next iteration.
+
+        :return: The number of processed jobs, of all the engines.
+        """
+        batch_sizes = self.batch_sizes()
+        prepared_batches: List[tuple] = []
+        for engine_logics in self.engines_logics:
+            engine_name = self.engine_name(engine_logics)
+            engine_batch_size.labels(engine_name).set(batch_sizes[engine_name])
+            try:
+                prepared_batches.append((engine_logics, engine_logics.prepare_batch(batch_sizes[engine_name])))
+            except Exception as err:
+                engine_errors.labels(engine_name).inc()
+                logger.warning(f"Failed to fetch the jobs of engine {engine_name}: {str(err)}")
+
+        media_ids = [job.media_id for _, jobs_to_process in prepared_batches for job in jobs_to_process]
+        if not media_ids:
+            return 0
+        unique_media_ids = list(dict.fromkeys(media_ids))
+        with self.stage_timers.stage("fetch_media"):
+            media_to_process = self.media_db_service.get_media_by_ids(media_ids_list=unique_media_ids)
+            media_by_id = {media_record.media_id: media_record for media_record in map(MediaRecord.from_dict, media_to_process.results)}
+        shared_media.inc(len(media_ids) - len(unique_media_ids))
+
+        processed_number = 0
+        for engine_logics, jobs_to_process in prepared_batches:
+            try:
+                jobs_to_process = engine_logics.schedule_batch(jobs_to_process, media_by_id, batch_sizes[self.engine_name(engine_logics)])
+                processed_number += engine_logics.complete_batch(jobs_to_process, media_by_id)
+            except Exception as err:
+                engine_errors.labels(self.engine_name(engine_logics)).inc()
+                logger.warning(f"Failed to process the jobs of engine {self.engine_name(engine_logics)}: {str(err)}")
+        return processed_number
+
+    def listen(self):
+        while not self.stopping.is_set():
+            if self.process_batch()==0:
+                with self.stage_timers.stage("idle"):
+                    self.stopping.wait(self.batch_processing_period_minutes*60)
+
+    def stop(self):
+        """
+        Stops the listen loop after the current iteration, like MonthsEngineLogics.stop.
+        """
+        self.stopping.set()
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+
+class JobRecord:
+    """
+    The fields of a job that the listen loop uses, read from the Media DB item without validating a whole
+    InsightJob. The item is kept, so the job is sent back with the fields the loop doesn't use.
+    """
+    __slots__ = ("job_id", "media_id", "status", "start_time", "end_time", "item")
+
+    def __init__(self, job_id: str, media_id: str, status, start_time, end_time, item: dict) -> None:
+        self.job_id = job_id
+        self.media_id = media_id
+        self.status = status
+        self.start_time = start_time
+        self.end_time = end_time
+        self.item = item
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "JobRecord":
+        return cls(str(item["id"]), str(item["media_id"]), item.get("status"), item.get("start_time"), item.get("end_time"), item)
+
+    def to_json(self) -> dict:
+        """
+        :return: The job as a JSON-ready Media DB item, with the status and timestamps of the record.
+        """
+        return dict(self.item,
+                    status=getattr(self.status, "value", self.status),
+                    start_time=self.start_time.isoformat() if isinstance(self.start_time, datetime) else self.start_time,
+                    end_time=self.end_time.isoformat() if isinstance(self.end_time, datetime) else self.end_time)
+
+    def __repr__(self) -> str:
+        return f"JobRecord({self.job_id})"
+
+
+class MediaRecord:
+    """
+    A media item of the Media DB, with the fields that the loop uses as slots.
+    The other fields of the item are read as attributes too, so extraction code written for MediaIDs keeps working.
+    """
+    __slots__ = ("media_id", "name", "created_on", "item")
+
+    def __init__(self, media_id: str, name: str | None, created_on, item: dict) -> None:
+        self.media_id = media_id
+        self.name = name
+        self.created_on = created_on
+        self.item = item
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "MediaRecord":
+        return cls(str(item["media_id"]), item.get("name"), item.get("created_on"), item)
+
+    def __getattr__(self, name: str):
+        # Called only for the fields that are not slots
+        if name == "item":
+            raise AttributeError(name)
+        try:
+            return self.item[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __repr__(self) -> str:
+        return f"MediaRecord({self.media_id})"
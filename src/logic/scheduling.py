@@ -0,0 +1,157 @@
+"""
+Priority scheduling of the listen loop. The Media DB returns the media without jobs and the pending jobs in its own
+order, so a bulk historical import can starve the fresh uploads. The fresh items are therefore searched separately
+(the media created and the jobs created since fresh_after, see MonthsEngineLogics), and the window is the fresh items
+followed by lookahead times the batch of the backlog, in the Media DB order. The scheduler picks the batch from it:
+  - by priority class: fresh uploads, reprocessing requested by a user, and the rest (backfill). The classes share
+    the batch by their weights (a class with weight 6 gets 6 items for each item of a class with weight 1, while
+    they both have items), so the backfill is slowed down but never starved
+  - fairly between the users within a class: the users are served round-robin, so one user's import doesn't
+    hold back the uploads of the others
+The reprocessing requests are not searched separately: they are prioritised once their jobs are in the window.
+"""
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, Iterable, List, TypeVar
+
+from metrics.registry import metrics_registry, DEFAULT_SIZE_BUCKETS
+
+FRESH_UPLOAD = "fresh_upload"
+REQUESTED_REPROCESS = "reprocess"
+BACKFILL = "backfill"
+PRIORITY_CLASSES = (FRESH_UPLOAD, REQUESTED_REPROCESS, BACKFILL)
+DEFAULT_PRIORITY_WEIGHTS = {FRESH_UPLOAD: 6.0, REQUESTED_REPROCESS: 3.0, BACKFILL: 1.0}
+
+QUEUE_LATENCY_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 2*3600, 6*3600, 12*3600, 24*3600, 3*24*3600, 7*24*3600)
+
+priority_backlog = metrics_registry.gauge("shkedia_worker_priority_backlog", "Items of each priority class in the last scheduling window", ("priority", "kind"))
+priority_scheduled = metrics_registry.histogram("shkedia_worker_priority_scheduled", "Items of each priority class scheduled in a batch", ("priority", "kind"), buckets=DEFAULT_SIZE_BUCKETS)
+priority_queue_seconds = metrics_registry.histogram("shkedia_worker_priority_queue_seconds", "Time from the creation of a job to its processing, by priority class", ("priority",), buckets=QUEUE_LATENCY_BUCKETS)
+
+Item = TypeVar("Item")
+
+
+def to_datetime(value) -> datetime | None:
+    """
+    :return: The (timezone aware) datetime of a Media DB timestamp (a datetime or an ISO string), None if missing or invalid.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class PriorityScheduler:
+    """
+    :param weights: The weight of each priority class, see DEFAULT_PRIORITY_WEIGHTS.
+    :param fresh_upload_hours: Media uploaded within this time are fresh uploads.
+    :param lookahead: The window of the backlog the batch is picked from (after the fresh items), in batches.
+    :param upload_time_field: The field of the media item with its upload time.
+    :param owner_field: The field of the media item with its user, for the fair sharing between users.
+    """
+
+    def __init__(self,
+                 weights: Dict[str, float] | None = None,
+                 fresh_upload_hours: float = 24,
+                 lookahead: int = 4,
+                 upload_time_field: str = "created_on",
+                 owner_field: str = "owner_id") -> None:
+        self.weights = dict(DEFAULT_PRIORITY_WEIGHTS, **(weights or {}))
+        for priority_class, weight in self.weights.items():
+            if priority_class not in PRIORITY_CLASSES:
+                raise ValueError(f"Unknown priority class {priority_class}")
+            if weight <= 0:
+                raise ValueError(f"The weight of {priority_class} must be positive")
+        self.fresh_upload_age = timedelta(hours=fresh_upload_hours)
+        self.lookahead = lookahead
+        self.upload_time_field = upload_time_field
+        self.owner_field = owner_field
+        self.lock = threading.Lock()
+        self.reprocess_requests: set = set()
+
+    def request_reprocessing(self, media_ids: Iterable[str]):
+        """
+        Gives the priority of a user request to the jobs of these media, until they are processed.
+        """
+        with self.lock:
+            self.reprocess_requests.update(str(media_id) for media_id in media_ids)
+
+    def window_size(self, batch_size: int) -> int:
+        return batch_size * self.lookahead
+
+    def fresh_after(self, now: datetime | None = None) -> str:
+        """
+        :return: The ISO timestamp from which the media are fresh uploads, to search the fresh items.
+        """
+        now = now if now is not None else datetime.now(timezone.utc)
+        return (now - self.fresh_upload_age).isoformat()
+
+    def classify(self, media_item: dict | None, now: datetime | None = None) -> str:
+        if media_item is None:
+            return BACKFILL
+        if str(media_item.get("media_id")) in self.reprocess_requests:
+            return REQUESTED_REPROCESS
+        upload_time = to_datetime(media_item.get(self.upload_time_field))
+        now = now if now is not None else datetime.now(timezone.utc)
+        if upload_time is not None and now - upload_time <= self.fresh_upload_age:
+            return FRESH_UPLOAD
+        return BACKFILL
+
+    def select(self, items: List[Item], batch_size: int, media_of: Callable[[Item], dict | None], kind: str) -> List[Item]:
+        """
+        Picks the batch from the window, by weighted priority and round-robin between the users.
+
+        :param items: The window, in the Media DB order.
+        :param media_of: The media item of an item (e.g. of a job).
+        :param kind: The kind of the items, the label of the metrics (e.g. pending_jobs).
+        :return: At most batch_size items, in their processing order.
+        """
+        now = datetime.now(timezone.utc)
+        # The queue of each user, by class. The users are served in the order they first appear in the window
+        classes_users: Dict[str, OrderedDict[str, Deque[Item]]] = {priority_class: OrderedDict() for priority_class in PRIORITY_CLASSES}
+        for item in items:
+            media_item = media_of(item)
+            owner_id = str(media_item.get(self.owner_field)) if media_item is not None else None
+            classes_users[self.classify(media_item, now)].setdefault(owner_id, deque()).append(item)
+        for priority_class, users_queues in classes_users.items():
+            priority_backlog.labels(priority_class, kind).set(sum(len(user_queue) for user_queue in users_queues.values()))
+
+        selected_items = []
+        served = {priority_class: 0 for priority_class in PRIORITY_CLASSES}
+        while len(selected_items) < batch_size:
+            # The class that got the least of its share so far (stride scheduling)
+            active_classes = [priority_class for priority_class in PRIORITY_CLASSES if classes_users[priority_class]]
+            if not active_classes:
+                break
+            priority_class = min(active_classes, key=lambda active_class: served[active_class] / self.weights[active_class])
+            users_queues = classes_users[priority_class]
+            owner_id, user_queue = next(iter(users_queues.items()))
+            selected_items.append(user_queue.popleft())
+            served[priority_class] += 1
+            # The user goes to the end of the line of its class
+            del users_queues[owner_id]
+            if user_queue:
+                users_queues[owner_id] = user_queue
+        for priority_class, served_number in served.items():
+            priority_scheduled.labels(priority_class, kind).observe(served_number)
+        return selected_items
+
+    def job_processed(self, media_item: dict | None, job_created_time) -> str:
+        """
+        Records the time the job waited, and ends the reprocessing request of its media.
+
+        :return: The priority class of the job.
+        """
+        priority_class = self.classify(media_item)
+        created_time = to_datetime(job_created_time)
+        if created_time is not None:
+            priority_queue_seconds.labels(priority_class).observe(max(0.0, (datetime.now(timezone.utc) - created_time).total_seconds()))
+        if priority_class == REQUESTED_REPROCESS:
+            with self.lock:
+                self.reprocess_requests.discard(str(media_item.get("media_id")))
+        return priority_class
@@ -1,12 +1,28 @@
 import time
+import threading
+from concurrent.futures import Executor
 from datetime import datetime
 import logging
 logger = logging.getLogger(__name__)
 
-from typing import List
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Set
 
 from project_shkedia_models import search, media, insights, jobs
 from db.service import MediaDBService
+from db.spool import SqliteWriteSpool, SpooledMediaDBWriter, SpoolEntry, INSIGHTS_KIND
+from publisher.outbox import SqliteOutbox, OutboxEvent
+from metrics.registry import metrics_registry, DEFAULT_SIZE_BUCKETS
+from profiling.timers import StageTimers, get_stage_timers
+from .records import JobRecord, MediaRecord
+from .sharding import ShardFilter
+from .scheduling import PriorityScheduler
+
+jobs_created = metrics_registry.counter("shkedia_worker_jobs_created_total", "Jobs created for media without a job")
+jobs_processed = metrics_registry.counter("shkedia_worker_jobs_processed_total", "Jobs processed, by the result of their status update", ("result",))
+extraction_seconds = metrics_registry.histogram("shkedia_worker_extraction_seconds", "Latency of the insights extraction of one media item")
+jobs_batch_size = metrics_registry.histogram("shkedia_worker_batch_size", "Number of jobs in each processed batch", buckets=DEFAULT_SIZE_BUCKETS)
+idle_sleeps = metrics_registry.counter("shkedia_worker_idle_sleeps_total", "Sleeps of the listen loop when there were no pending jobs")
 
 class MonthsEngineLogics:
 
@@ -14,12 +30,49 @@ class MonthsEngineLogics:
                  media_db_service: MediaDBService,
                  engine_details: insights.InsightEngine,
                  batch_process_size: int = 200,
-                 batch_processing_period_minutes: float = 120,) -> None:
+                 batch_processing_period_minutes: float = 120,
+                 outbox: SqliteOutbox | None = None,
+                 insights_topic_id: str | None = None,
+                 write_spool: SqliteWriteSpool | None = None,
+                 stage_timers: StageTimers | None = None,
+                 shard_filter: ShardFilter | None = None,
+                 scheduler: PriorityScheduler | None = None,) -> None:
+        if outbox is not None and insights_topic_id is None:
+            raise ValueError("insights_topic_id must be supplied with the outbox")
         self.media_db_service = media_db_service
         self.batch_process_size = batch_process_size
         self.batch_processing_period_minutes = batch_processing_period_minutes
-        self.engine = self.__init_engine__(engine_details)
+        self.outbox = outbox
+        self.insights_topic_id = insights_topic_id
+        self.stage_timers = stage_timers if stage_timers is not None else get_stage_timers("engine")
+        # With a shard filter only the media of the shard of this replica are processed, see logic.sharding
+        self.shard_filter = shard_filter
+        # With a scheduler the batches are picked by priority from a larger window, see logic.scheduling
+        self.scheduler = scheduler
+        self.db_writer = None
+        if write_spool is not None:
+            self.db_writer = SpooledMediaDBWriter(media_db_service, write_spool, on_ack=self.__on_spool_ack__)
+        self.engine_details = engine_details
+        # Resolved from the Media DB on first use (see resolve_engine), so constructing the logics doesn't block
+        self.__engine = None
+        self.engine_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    @property
+    def engine(self) -> insights.InsightEngine:
+        if self.__engine is None:
+            self.resolve_engine()
+        return self.__engine
 
+    def resolve_engine(self) -> insights.InsightEngine:
+        """
+        Looks the engine up in the Media DB, once. Call it ahead (e.g. concurrently with the rest of the startup)
+        to take the request off the first batch.
+        """
+        with self.engine_lock:
+            if self.__engine is None:
+                self.__engine = self.__init_engine__(self.engine_details)
+        return self.__engine
 
     def __init_engine__(self,local_engine_details):
         search_results = self.media_db_service.search_engine(engine_name=local_engine_details.name)
@@ -29,10 +82,44 @@ class MonthsEngineLogics:
         #TODO: Updates the engine details if needed
 
 
+    def __window_size__(self, batch_size: int) -> int:
+        return self.scheduler.window_size(batch_size) if self.scheduler is not None else batch_size
+
+    def __page_size__(self, batch_size: int) -> int:
+        return self.shard_filter.page_size(batch_size) if self.shard_filter is not None else batch_size
+
+    def __shard_items__(self, search_result: search.SearchResult, kind: str, batch_size: int) -> List[dict]:
+        """
+        :return: The items of the search result of the shard of this replica, at most batch_size.
+        """
+        if self.shard_filter is None:
+            return search_result.results
+        return self.shard_filter.filter(search_result.results, kind, search_result.total_results_number)[:batch_size]
+
+    def __search_window__(self, search_items: Callable[..., search.SearchResult], kind: str, id_field: str, window_size: int) -> List[dict]:
+        """
+        Searches the items to pick the batch from. With a scheduler the fresh items are searched first, as the
+        backlog may hide them from a window in the Media DB order (see logic.scheduling).
+
+        :param search_items: Searches a page of the items, with the page size and the created_after arguments.
+        :return: The items of this shard, the fresh ones first, each once.
+        """
+        searches = [None] if self.scheduler is None else [self.scheduler.fresh_after(), None]
+        window_items: Dict[str, dict] = {}
+        for created_after in searches:
+            search_result = search_items(batch_size=self.__page_size__(window_size), created_after=created_after)
+            for item in self.__shard_items__(search_result, kind, window_size):
+                window_items.setdefault(str(item[id_field]), item)
+        return list(window_items.values())
+
     def create_jobs(self):
-        media_to_process: search.SearchResult = self.media_db_service.get_media_to_analyze(engine_name=self.engine.name, batch_size=self.batch_process_size)
+        window_size = self.__window_size__(self.batch_process_size)
+        media_items = self.__search_window__(partial(self.media_db_service.get_media_to_analyze, engine_name=self.engine.name),
+                                             "media_without_jobs", "media_id", window_size)
+        if self.scheduler is not None:
+            media_items = self.scheduler.select(media_items, self.batch_process_size, lambda media_item: media_item, "media_without_jobs")
         job_list: List[jobs.InsightJob] = []
-        for result in media_to_process.results:
+        for result in media_items:
             media_item = media.MediaStorage(**result)
             temp_job = jobs.InsightJob(insight_engine_id=self.engine.id,
                                         media_id=media_item.media_id)
@@ -40,8 +127,9 @@ class MonthsEngineLogics:
             job_list.append(temp_job)
         if len(job_list)>0:
             self.media_db_service.put_jobs(job_list)
+            jobs_created.inc(len(job_list))
 
-    def __extract_insights_logics__(self, job_id, media_item) -> List[insights.Insight]:
+    def __extract_insights_logics__(self, job_id, media_item: MediaRecord) -> List[insights.Insight]:
         insights_list = []
         # TODO: Implement the insight extraction here.
         
@@ -54,34 +142,219 @@ class MonthsEngineLogics:
                                                       status=insights.InsightStatusEnum.APPROVED))
         return insights_list
 
-    def listen(self):
-        while True:
+    def __insights_events__(self, insights_list: List[insights.Insight]) -> List[OutboxEvent]:
+        return [OutboxEvent(event_id=str(insight.id),
+                            topic_id=self.insights_topic_id,
+                            payload=insight.model_dump_json(),
+                            grouping_key=str(insight.media_id)) for insight in insights_list]
+
+    def __on_spool_ack__(self, acked_entries: List[SpoolEntry]):
+        if self.outbox is None:
+            return
+        for entry in acked_entries:
+            if entry.kind == INSIGHTS_KIND and entry.tag is not None:
+                self.outbox.commit(entry.tag)
+
+    def __put_insights__(self, insights_list: List[insights.Insight]):
+        """
+        Writes the insights and, with an outbox, queues their insight-created events.
+        The events are staged before the write and committed only if it succeeded.
+        With a write spool the insights are spooled and the events are committed when the spool entry is acknowledged.
+        """
+        if self.db_writer is not None:
+            batch_id = self.outbox.stage(self.__insights_events__(insights_list)) if self.outbox is not None else None
+            return self.db_writer.put_insights(insights_list, tag=batch_id)
+        if self.outbox is None:
+            return self.media_db_service.put_insights(insights_list)
+        batch_id = self.outbox.stage(self.__insights_events__(insights_list))
+        # On an exception the write may still have succeeded, so the batch stays staged for __recover_outbox__
+        inserted_number = self.media_db_service.put_insights(insights_list)
+        if inserted_number is None:
+            self.outbox.discard(batch_id)
+            logger.error(f"Failed to put {len(insights_list)} insights")
+        else:
+            self.outbox.commit(batch_id)
+        return inserted_number
+
+    def __recover_outbox__(self):
+        """
+        Resolves the batches that were staged and not committed (the worker failed during the write):
+        the insights are written again (the write is idempotent) and the events are committed.
+        Only the batches of this engine are resolved, as the engines of a MultiEngineLogics share the outbox
+        and the batches of another engine may be pending in its own spool.
+        """
+        spooled_batches: Set[str] = set()
+        if self.db_writer is not None:
+            # These are committed when their spool entry is acknowledged
+            spooled_batches = {entry.tag for entry in self.db_writer.spool.pending() if entry.tag is not None}
+        for batch_id, events in self.outbox.staged_batches().items():
+            if batch_id in spooled_batches:
+                continue
+            insights_list = [insights.Insight.model_validate_json(event.payload) for event in events]
+            if str(insights_list[0].insight_engine_id) != str(self.engine.id):
+                continue
             try:
-                self.create_jobs()
+                inserted_number = self.media_db_service.put_insights(insights_list)
             except Exception as err:
-                logger.warning(f"Failed to create jobs: {str(err)}")
-            logger.info("Search jobs")
-            jobs_to_process: search.SearchResult = self.media_db_service.get_pending_jobs(engine_id=self.engine.id, batch_size=self.batch_process_size)
-            jobs_to_process: List[jobs.InsightJob] = [jobs.InsightJob(**item) for item in jobs_to_process.results]
-            media_to_process: search.SearchResult = self.media_db_service.get_media_by_ids(media_ids_list=[item.media_id for item in jobs_to_process])
-            media_to_process: List[media.MediaIDs] = [media.MediaIDs(**media_item) for media_item in media_to_process.results]
-            analyzing_dictionary = {}
+                logger.warning(f"Failed to recover outbox batch {batch_id}: {str(err)}")
+                continue
+            if inserted_number is None:
+                # The jobs of these insights are still pending, so they are processed again
+                self.outbox.discard(batch_id)
+            else:
+                self.outbox.commit(batch_id)
+            logger.info(f"Recovered outbox batch {batch_id} of {len(events)} events")
+
+    def __update_jobs__(self, job_records: List[JobRecord]):
+        jobs_items = [job_record.to_json() for job_record in job_records]
+        if self.db_writer is not None:
+            return self.db_writer.update_jobs_json(jobs_items)
+        return self.media_db_service.update_jobs_json(jobs_items)
+
+    def prepare_batch(self, batch_size: int | None = None) -> List[JobRecord]:
+        """
+        The first part of an iteration: replays the spool, recovers the outbox, creates the missing jobs and
+        fetches a batch of pending jobs (with a scheduler, the window to pick the batch from, see schedule_batch).
+
+        :param batch_size: The number of pending jobs to process, batch_process_size by default.
+        :return: The jobs to process.
+        """
+        timers = self.stage_timers
+        if self.db_writer is not None:
+            with timers.stage("replay_spool"):
+                self.db_writer.replay()
+        if self.outbox is not None:
+            with timers.stage("recover_outbox"):
+                self.__recover_outbox__()
+        try:
+            with timers.stage("create_jobs"):
+                self.create_jobs()
+        except Exception as err:
+            logger.warning(f"Failed to create jobs: {str(err)}")
+        logger.info("Search jobs")
+        # The jobs and media are read into slotted records, the models are built only for the API calls
+        with timers.stage("fetch_jobs"):
+            window_size = self.__window_size__(batch_size or self.batch_process_size)
+            # The jobs of the fresh uploads are created (by create_jobs) since the fresh_after of the scheduler
+            jobs_items = self.__search_window__(partial(self.media_db_service.get_pending_jobs, engine_id=self.engine.id),
+                                                "pending_jobs", "id", window_size)
+            jobs_to_process: List[JobRecord] = [JobRecord.from_dict(item) for item in jobs_items]
+        if self.db_writer is not None:
+            # Their results are already spooled, extracting them again would waste the work
+            jobs_to_process = [job for job in jobs_to_process if job.job_id not in self.db_writer.pending_job_ids]
+        return jobs_to_process
+
+    def fetch_media(self, media_ids: Iterable[str]) -> Dict[str, MediaRecord]:
+        """
+        :return: The media records by media ID. Each media is fetched once, even if its ID repeats.
+        """
+        media_to_process: search.SearchResult = self.media_db_service.get_media_by_ids(media_ids_list=list(dict.fromkeys(media_ids)))
+        return {media_record.media_id: media_record for media_record in map(MediaRecord.from_dict, media_to_process.results)}
+
+    def schedule_batch(self, jobs_to_process: List[JobRecord], media_by_id: Dict[str, MediaRecord], batch_size: int | None = None) -> List[JobRecord]:
+        """
+        Picks the batch from the window of prepare_batch by priority. Without a scheduler, the jobs are kept as they are.
+        """
+        if self.scheduler is None:
+            return jobs_to_process
+        def media_of(job: JobRecord):
+            media_item = media_by_id.get(job.media_id)
+            return media_item.item if media_item is not None else None
+        return self.scheduler.select(jobs_to_process, batch_size or self.batch_process_size, media_of, "pending_jobs")
+
+    def complete_batch(self, jobs_to_process: List[JobRecord], media_by_id: Dict[str, MediaRecord]) -> int:
+        """
+        The second part of an iteration: extracts the insights of the jobs, writes them and marks the jobs as done.
+
+        :param media_by_id: The media of the jobs (see fetch_media).
+        :return: The number of processed jobs.
+        """
+        timers = self.stage_timers
+        insights_list = []
+        with timers.stage("extract"):
             for job in jobs_to_process:
-                analyzing_dictionary[job.id] = (job,[media_item for media_item in media_to_process if media_item.media_id==job.media_id][0])
-            
-            insights_list = []
-            for job_id,value in analyzing_dictionary.items():
-                temp_job,media_item = value
-                insights_list += self.__extract_insights_logics__(temp_job.id,media_item)
-            if len(insights_list)>0:
-                self.media_db_service.put_insights(insights_list)
-            if len(jobs_to_process)>0:
-                for job in jobs_to_process:
-                    job.status = jobs.InsightJobStatus.DONE
-                    job.end_time = datetime.now()
-                if not self.media_db_service.update_jobs(jobs_to_process)>0:
-                    logger.error(f"Could not update job {jobs_to_process}")
-            if len(jobs_to_process)==0:
-                time.sleep(self.batch_processing_period_minutes*60)
+                media_item = media_by_id.get(job.media_id)
+                if media_item is None:
+                    logger.warning(f"Media {job.media_id} of job {job.job_id} was not found")
+                    continue
+                extraction_start = time.perf_counter()
+                insights_list += self.__extract_insights_logics__(job.job_id,media_item)
+                extraction_seconds.observe(time.perf_counter() - extraction_start)
+                if self.scheduler is not None:
+                    self.scheduler.job_processed(media_item.item, job.start_time)
+        if len(insights_list)>0:
+            with timers.stage("put_insights"):
+                self.__put_insights__(insights_list)
+        if len(jobs_to_process)>0:
+            for job in jobs_to_process:
+                job.status = jobs.InsightJobStatus.DONE
+                job.end_time = datetime.now()
+            with timers.stage("update_jobs"):
+                updated_number = self.__update_jobs__(jobs_to_process)
+            if not updated_number:
+                logger.error(f"Could not update job {jobs_to_process}")
+            jobs_processed.labels("updated" if updated_number else "not_updated").inc(len(jobs_to_process))
+            jobs_batch_size.observe(len(jobs_to_process))
+        return len(jobs_to_process)
+
+    def process_batch(self) -> int:
+        """
+        Runs one iteration of the worker: creates the missing jobs, then processes a batch of pending jobs.
+
+        :return: The number of processed jobs.
+        """
+        jobs_to_process = self.prepare_batch()
+        with self.stage_timers.stage("fetch_media"):
+            media_by_id = self.fetch_media(job.media_id for job in jobs_to_process)
+        jobs_to_process = self.schedule_batch(jobs_to_process, media_by_id)
+        return self.complete_batch(jobs_to_process, media_by_id)
+
+    def process_media(self, media_records: List[MediaRecord], executor: Executor | None = None) -> int:
+        """
+        Processes media without pending jobs (e.g. a backfill): the insights are extracted (in the executor, in
+        parallel), written in one request, and the jobs are created already done in one request, so there are no
+        per-job round trips.
 
+        :return: The number of processed media.
+        :raises RuntimeError: When the Media DB rejected the insights. The jobs are not written, so the media are
+                              processed again.
+        """
+        if not media_records:
+            return 0
+        end_time = datetime.now()
+        job_list = [jobs.InsightJob(insight_engine_id=self.engine.id,
+                                    media_id=media_record.media_id,
+                                    status=jobs.InsightJobStatus.DONE,
+                                    end_time=end_time) for media_record in media_records]
+        def extract(job: jobs.InsightJob, media_record: MediaRecord) -> List[insights.Insight]:
+            extraction_start = time.perf_counter()
+            insights_list = self.__extract_insights_logics__(job.id, media_record)
+            extraction_seconds.observe(time.perf_counter() - extraction_start)
+            return insights_list
+        with self.stage_timers.stage("extract"):
+            map_function = executor.map if executor is not None else map
+            insights_list = [insight for media_insights in map_function(extract, job_list, media_records) for insight in media_insights]
+        if len(insights_list)>0:
+            with self.stage_timers.stage("put_insights"):
+                inserted_number = self.__put_insights__(insights_list)
+            # The done jobs would hide the media from the next runs. A spooled write returns 0, and is replayed
+            if inserted_number is None:
+                raise RuntimeError(f"The Media DB rejected {len(insights_list)} insights, the jobs were not written")
+        with self.stage_timers.stage("put_jobs"):
+            self.media_db_service.put_jobs(job_list)
+        jobs_created.inc(len(job_list))
+        jobs_processed.labels("updated").inc(len(job_list))
+        return len(job_list)
+
+    def listen(self):
+        while not self.stopping.is_set():
+            if self.process_batch()==0:
+                idle_sleeps.inc()
+                with self.stage_timers.stage("idle"):
+                    self.stopping.wait(self.batch_processing_period_minutes*60)
 
+    def stop(self):
+        """
+        Stops the listen loop after the current batch (e.g. from a SIGTERM handler, to drain the worker).
+        """
+        self.stopping.set()
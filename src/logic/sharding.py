@@ -0,0 +1,146 @@
+"""
+Splits the media space between the worker replicas with consistent hashing, without coordination between them:
+each replica knows its shard index out of the shard count, and only creates and processes the jobs of the media IDs
+that hash into its shard. The shards are points on a hash ring (virtual nodes), so when the shard count changes
+only about 1/N of the media move to another shard.
+
+The Media DB doesn't know the shards, so every replica reads a page of all the shards and keeps its part: the page
+is shard_count times the batch, and the Media DB serves shard_count such pages per poll, which grows as the square
+of the shard count. max_page_size caps the page (the reads per poll to shard_count * max_page_size), at the cost of
+batches of about max_page_size / shard_count items once it is reached.
+"""
+import os
+import re
+import bisect
+import hashlib
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import Counter
+from typing import Callable, Iterable, List, Tuple
+
+from metrics.registry import metrics_registry
+
+shard_backlog = metrics_registry.gauge("shkedia_worker_shard_backlog", "Estimated backlog of each shard (from the share of the shard in the last page)", ("shard", "kind"))
+shard_skipped = metrics_registry.counter("shkedia_worker_shard_skipped_total", "Items of other shards skipped by this replica", ("kind",))
+shard_rebalances = metrics_registry.counter("shkedia_worker_shard_rebalances_total", "Changes of the shard index or count of this replica")
+
+HOSTNAME_ORDINAL_PATTERN = re.compile(r"-(\d+)$")
+
+
+def stable_hash(key: str) -> int:
+    # hash() is randomized per process, the replicas must agree on the hashes
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def shard_index_from_hostname(hostname: str | None = None) -> int:
+    """
+    Discovers the shard index from the ordinal of the host name (worker-3 is shard 3), e.g. of a StatefulSet pod.
+    """
+    hostname = hostname if hostname is not None else os.environ.get("HOSTNAME", "")
+    match = HOSTNAME_ORDINAL_PATTERN.search(hostname)
+    if match is None:
+        raise ValueError(f"No shard ordinal in host name {hostname!r}, set the shard index explicitly")
+    return int(match.group(1))
+
+
+class ConsistentHashRing:
+    """
+    :param shard_count: The number of shards.
+    :param virtual_nodes: The points of each shard on the ring. More points spread the media more evenly.
+    """
+
+    def __init__(self, shard_count: int, virtual_nodes: int = 128) -> None:
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.shard_count = shard_count
+        self.virtual_nodes = virtual_nodes
+        points = sorted((stable_hash(f"shard-{shard}-{node}"), shard) for shard in range(shard_count) for node in range(virtual_nodes))
+        self.points = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_of(self, key: str) -> int:
+        """
+        :return: The shard of the first point clockwise from the hash of the key.
+        """
+        index = bisect.bisect(self.points, stable_hash(key))
+        return self.shards[index % len(self.points)]
+
+
+class ShardFilter:
+    """
+    Keeps the items of the shard of this replica.
+
+    :param shard_index: The shard of this replica, between 0 and shard_count - 1.
+    :param shard_count: The number of shards (replicas).
+    :param virtual_nodes: See ConsistentHashRing.
+    :param max_page_size: The largest page to request, unlimited if not set (see the cost above).
+    """
+
+    def __init__(self, shard_index: int, shard_count: int, virtual_nodes: int = 128, max_page_size: int | None = 1000) -> None:
+        self.lock = threading.Lock()
+        self.virtual_nodes = virtual_nodes
+        self.max_page_size = max_page_size
+        self.rebalance_hooks: List[Callable[[Tuple[int, int], Tuple[int, int]], None]] = []
+        self.__set_shard__(shard_index, shard_count)
+
+    def __set_shard__(self, shard_index: int, shard_count: int):
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index must be between 0 and {shard_count - 1}")
+        self.ring = ConsistentHashRing(shard_count, self.virtual_nodes)
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def add_rebalance_hook(self, hook: Callable[[Tuple[int, int], Tuple[int, int]], None]):
+        """
+        :param hook: Called with the (shard index, shard count) before and after each rebalance.
+        """
+        self.rebalance_hooks.append(hook)
+
+    def rebalance(self, shard_index: int, shard_count: int):
+        """
+        Moves this replica to another shard or shard count, e.g. when replicas were added.
+        """
+        with self.lock:
+            previous_shard = (self.shard_index, self.shard_count)
+            if previous_shard == (shard_index, shard_count):
+                return
+            self.__set_shard__(shard_index, shard_count)
+        shard_rebalances.inc()
+        logger.info(f"Rebalanced from shard {previous_shard[0]}/{previous_shard[1]} to {shard_index}/{shard_count}")
+        for hook in self.rebalance_hooks:
+            hook(previous_shard, (shard_index, shard_count))
+
+    def owns(self, media_id) -> bool:
+        with self.lock:
+            ring, shard_index = self.ring, self.shard_index
+        return ring.shard_of(str(media_id)) == shard_index
+
+    def page_size(self, batch_size: int) -> int:
+        """
+        :return: The page to request for a batch of this shard, as about 1/shard_count of a page belongs to it.
+                 At most max_page_size, but at least the batch.
+        """
+        page_size = batch_size * self.shard_count
+        if self.max_page_size is not None:
+            page_size = min(page_size, max(batch_size, self.max_page_size))
+        return page_size
+
+    def filter(self, items: Iterable[dict], kind: str, total_results_number: int | None = None) -> List[dict]:
+        """
+        :param items: Media DB items with a media_id.
+        :param kind: The kind of the items, the label of the metrics (e.g. pending_jobs).
+        :param total_results_number: The number of items of all the shards, for the backlog estimate.
+        :return: The items of this shard.
+        """
+        with self.lock:
+            ring, shard_index = self.ring, self.shard_index
+        items_shards = [(item, ring.shard_of(str(item["media_id"]))) for item in items]
+        owned_items = [item for item, shard in items_shards if shard == shard_index]
+        shard_skipped.labels(kind).inc(len(items_shards) - len(owned_items))
+        if total_results_number is not None:
+            shards_counts = Counter(shard for _, shard in items_shards)
+            for shard in range(ring.shard_count):
+                shard_backlog.labels(str(shard), kind).set(round(total_results_number * shards_counts[shard] / len(items_shards)) if items_shards else 0)
+        return owned_items
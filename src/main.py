@@ -1,28 +1,264 @@
+import os
+import signal
+import argparse
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, partial
 
 import logging
 logger = logging.getLogger(__name__)
 
-from config import app_config
-from db.service import MediaDBService
-from logic.service import MonthsEngineLogics
+# The services (and their heavy imports) are built on first use, not when this module is imported,
+# so a new replica is ready as soon as the configuration is loaded
 
-from project_shkedia_models.insights import InsightEngine
 
-media_service = MediaDBService(host=app_config.MEDIA_DB_HOST, 
-                               port=app_config.MEDIA_DB_PORT,
-                               default_batch_size=app_config.BATCH_SIZE)
+class Worker:
+    """
+    The services of the worker, built from the configuration on first use.
 
-month_engine_logics = MonthsEngineLogics(media_db_service=media_service,
-                                         engine_details=app_config.ENGINE_DETAILS,
-                                         batch_process_size=app_config.BATCH_SIZE,
-                                         batch_processing_period_minutes=app_config.BATCH_PROCESS_PERIOD_MIN)
+    :param worker_index: The index of this process among the processes of the supervisor (see supervise).
+    :param workers_number: The number of processes of the supervisor. The processes split the shard of the replica
+                           between them, and have their own spool and outbox files.
+    """
 
+    def __init__(self, app_config, worker_index: int = 0, workers_number: int = 1) -> None:
+        self.app_config = app_config
+        self.worker_index = worker_index
+        self.workers_number = workers_number
+        self.stopped = False
+
+    def process_location(self, location: str) -> str:
+        return location if self.workers_number == 1 else f"{location}.{self.worker_index}"
+
+    @cached_property
+    def media_service(self):
+        from db.service import MediaDBService, SEARCH_ENDPOINTS, BULK_WRITE_ENDPOINTS
+        from concurrency.rate_limit import AdaptiveRateLimiter
+        rate_limiters = {}
+        for endpoint_class, rate, concurrency in ((SEARCH_ENDPOINTS, self.app_config.MEDIA_DB_SEARCH_RATE, self.app_config.MEDIA_DB_SEARCH_CONCURRENCY),
+                                                  (BULK_WRITE_ENDPOINTS, self.app_config.MEDIA_DB_WRITE_RATE, self.app_config.MEDIA_DB_WRITE_CONCURRENCY)):
+            if rate:
+                rate_limiters[endpoint_class] = AdaptiveRateLimiter(f"media_db_{endpoint_class}", rate / self.workers_number, max_concurrency=concurrency)
+        return MediaDBService(host=self.app_config.MEDIA_DB_HOST,
+                              port=self.app_config.MEDIA_DB_PORT,
+                              default_batch_size=self.app_config.BATCH_SIZE,
+                              rate_limiters=rate_limiters)
+
+    @cached_property
+    def outbox(self):
+        if not self.app_config.OUTBOX_LOCATION:
+            return None
+        from publisher.outbox import SqliteOutbox
+        return SqliteOutbox(self.process_location(self.app_config.OUTBOX_LOCATION))
+
+    @cached_property
+    def outbox_relay(self):
+        if self.outbox is None:
+            return None
+        from publisher.outbox import OutboxRelay
+        from publisher.service import PublisherService
+        return OutboxRelay(self.outbox, PublisherService(topic_names=[self.app_config.INSIGHTS_TOPIC_NAME]))
+
+    def create_write_spool(self, location_suffix: str = ""):
+        if not self.app_config.WRITE_SPOOL_LOCATION:
+            return None
+        from db.spool import SqliteWriteSpool
+        return SqliteWriteSpool(self.process_location(self.app_config.WRITE_SPOOL_LOCATION + location_suffix))
+
+    @cached_property
+    def shard_filter(self):
+        shard_count = self.app_config.SHARD_COUNT * self.workers_number
+        if shard_count <= 1:
+            return None
+        from logic.sharding import ShardFilter, shard_index_from_hostname
+        replica_index = 0
+        if self.app_config.SHARD_COUNT > 1:
+            replica_index = self.app_config.SHARD_INDEX if self.app_config.SHARD_INDEX is not None else shard_index_from_hostname()
+        # Each process of the replica is a shard of its own
+        return ShardFilter(replica_index * self.workers_number + self.worker_index, shard_count,
+                           virtual_nodes=self.app_config.SHARD_VIRTUAL_NODES, max_page_size=self.app_config.SHARD_MAX_PAGE_SIZE)
+
+    @cached_property
+    def scheduler(self):
+        if not self.app_config.PRIORITY_SCHEDULING:
+            return None
+        from logic.scheduling import PriorityScheduler
+        return PriorityScheduler(weights=self.app_config.PRIORITY_WEIGHTS,
+                                 fresh_upload_hours=self.app_config.PRIORITY_FRESH_UPLOAD_HOURS,
+                                 lookahead=self.app_config.PRIORITY_LOOKAHEAD,
+                                 upload_time_field=self.app_config.PRIORITY_UPLOAD_TIME_FIELD)
+
+    def create_engine_logics(self, engine_details, write_spool_suffix: str = ""):
+        from logic.service import MonthsEngineLogics
+        return MonthsEngineLogics(media_db_service=self.media_service,
+                                  engine_details=engine_details,
+                                  batch_process_size=self.app_config.BATCH_SIZE,
+                                  batch_processing_period_minutes=self.app_config.BATCH_PROCESS_PERIOD_MIN,
+                                  outbox=self.outbox,
+                                  insights_topic_id=self.app_config.INSIGHTS_TOPIC_NAME,
+                                  write_spool=self.create_write_spool(write_spool_suffix),
+                                  shard_filter=self.shard_filter,
+                                  scheduler=self.scheduler)
+
+    @cached_property
+    def engine_logics(self):
+        if not self.app_config.ENGINES_DETAILS:
+            return self.create_engine_logics(self.app_config.ENGINE_DETAILS)
+        from logic.multi_engine import MultiEngineLogics
+        # Each engine has its own spool, its acknowledgements commit the engine's outbox batches. The engines share
+        # the outbox (and its relay), each recovers the staged batches of its own insights
+        return MultiEngineLogics(media_db_service=self.media_service,
+                                 engines_logics=[self.create_engine_logics(engine_details, f".{engine_details.name}")
+                                                 for engine_details in self.app_config.ENGINES_DETAILS],
+                                 weights=self.app_config.ENGINES_WEIGHTS,
+                                 batch_process_size=self.app_config.BATCH_SIZE,
+                                 batch_processing_period_minutes=self.app_config.BATCH_PROCESS_PERIOD_MIN)
+
+    def register_blob_store(self):
+        if self.app_config.PAYLOAD_BLOB_STORE_LOCATION:
+            from payload.claim_check import LocalBlobStore, register_blob_store
+            register_blob_store(LocalBlobStore(self.app_config.PAYLOAD_BLOB_STORE_LOCATION, ttl_seconds=self.app_config.PAYLOAD_BLOB_TTL_SECONDS))
+
+    def warm_up(self, max_workers: int = 4):
+        """
+        Does the network work of the startup concurrently: resolves the engine and the topics of the relay.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            calls = [executor.submit(self.engine_logics.resolve_engine)]
+            if self.outbox_relay is not None:
+                calls.append(executor.submit(self.outbox_relay.publisher_service.topics.warm_up))
+            for call in calls:
+                call.result()
+
+    def start(self):
+        self.register_blob_store()
+        if self.outbox_relay is not None:
+            self.outbox_relay.start()
+
+    def stop(self, signal_number=None, frame=None):
+        """
+        Drains the worker: the listen loop returns after the current batch. Usable as a signal handler.
+        """
+        self.stopped = True
+        if "engine_logics" in self.__dict__:
+            self.engine_logics.stop()
+
+    def close(self):
+        if "outbox_relay" in self.__dict__ and self.outbox_relay is not None:
+            self.outbox_relay.close(timeout=30)
+
+
+def run(worker_index: int = 0, workers_number: int = 1):
+    """
+    Runs the engine loop in this process until SIGTERM.
+    """
+    from config import app_config
+    from metrics.server import MetricsServer
+    from profiling.profiler import WorkerProfiler
 
-if __name__ == "__main__":
     logger.info(f"Start Main Process for worker {app_config.ENGINE_DETAILS.name}")
+    worker = Worker(app_config, worker_index, workers_number)
+    signal.signal(signal.SIGTERM, worker.stop)
+    metrics_server = None
+    profiler = WorkerProfiler(app_config.PROFILING_OUTPUT_DIRECTORY,
+                              sampling_interval_seconds=app_config.PROFILING_SAMPLING_INTERVAL_SECONDS,
+                              snapshot_period_seconds=app_config.PROFILING_SNAPSHOT_PERIOD_SECONDS,
+                              top_allocations=app_config.PROFILING_TOP_ALLOCATIONS)
     try:
-        pass
-        # month_engine_logics.listen()
+        if app_config.PROFILING_SIGNAL:
+            profiler.install_signal_handler(app_config.PROFILING_SIGNAL)
+        if app_config.PROFILING_ENABLED:
+            profiler.start()
+        if app_config.METRICS_PORT is not None:
+            # Each process of the supervisor serves its metrics on the next port
+            metrics_server = MetricsServer(app_config.METRICS_PORT + worker_index, host=app_config.METRICS_HOST)
+            metrics_server.start()
+        worker.start()
+        worker.warm_up()
+        if not worker.stopped:
+            worker.engine_logics.listen()
     except Exception as err:
-        logger.error(traceback.format_exc())
\ No newline at end of file
+        logger.error(traceback.format_exc())
+    finally:
+        worker.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        profiler.stop()
+
+
+def supervise():
+    """
+    Pre-forks WORKERS_NUMBER processes that run the engine loop, restarts them when they exit and drains them on SIGTERM.
+    """
+    from config import app_config
+    from concurrency.supervisor import WorkerSupervisor
+
+    workers_number = app_config.WORKERS_NUMBER or os.cpu_count() or 1
+    forwarded_signals = [signal.Signals[app_config.PROFILING_SIGNAL]] if app_config.PROFILING_SIGNAL else []
+    supervisor = WorkerSupervisor(target=partial(run, workers_number=workers_number),
+                                  workers_number=workers_number,
+                                  restart_backoff_seconds=app_config.WORKERS_RESTART_BACKOFF_SECONDS,
+                                  max_restart_backoff_seconds=app_config.WORKERS_MAX_RESTART_BACKOFF_SECONDS,
+                                  stop_timeout_seconds=app_config.WORKERS_STOP_TIMEOUT_SECONDS,
+                                  forwarded_signals=forwarded_signals)
+    logger.info(f"Start supervisor of {workers_number} workers")
+    supervisor.run()
+
+
+def backfill(args):
+    """
+    Processes the media of a file of media IDs or of a Media DB search (all the media, or of a user or a date range),
+    with checkpoints, see logic.backfill.
+    """
+    from config import app_config
+    from logic.backfill import BackfillCheckpoint, BackfillRunner, MediaIdsFileSource, MediaSearchSource
+
+    worker = Worker(app_config)
+    if args.media_ids_file:
+        source = MediaIdsFileSource(args.media_ids_file)
+    else:
+        source = MediaSearchSource(worker.media_service, owner_id=args.owner_id, created_after=args.created_after,
+                                   created_before=args.created_before, page_size=args.chunk_size)
+    engine_logics = worker.create_engine_logics(app_config.ENGINE_DETAILS)
+    runner = BackfillRunner(engine_logics, source,
+                            checkpoint=BackfillCheckpoint(args.checkpoint) if args.checkpoint else None,
+                            chunk_size=args.chunk_size,
+                            max_workers=args.workers,
+                            max_media_per_second=args.max_media_per_second)
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: runner.stop())
+    try:
+        worker.start()
+        processed_number = runner.run()
+        logger.info(f"Backfill done, {processed_number} media were processed")
+    finally:
+        worker.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Shkedia insights worker")
+    subparsers = parser.add_subparsers(dest="mode")
+    subparsers.add_parser("run", help="Run the engine loop in this process (the default)")
+    subparsers.add_parser("supervise", help="Run the engine loop in WORKERS_NUMBER processes")
+    backfill_parser = subparsers.add_parser("backfill", help="Process a range of media, e.g. after an engine change")
+    backfill_source = backfill_parser.add_mutually_exclusive_group()
+    backfill_source.add_argument("--media-ids-file", help="A file of media IDs, one per line. All the media (or the filtered ones) if not set")
+    backfill_source.add_argument("--owner-id", help="Only the media of this user")
+    backfill_parser.add_argument("--created-after", help="Only the media created from this ISO timestamp")
+    backfill_parser.add_argument("--created-before", help="Only the media created before this ISO timestamp")
+    backfill_parser.add_argument("--checkpoint", help="The progress file. An interrupted backfill resumes from it")
+    backfill_parser.add_argument("--chunk-size", type=int, default=500, help="The media of each bulk write")
+    backfill_parser.add_argument("--workers", type=int, default=8, help="The threads of the extraction")
+    backfill_parser.add_argument("--max-media-per-second", type=float, default=200, help="The rate limit, to protect the Media DB. 0 for no limit")
+    args = parser.parse_args(arguments)
+    if args.mode == "supervise":
+        supervise()
+    elif args.mode == "backfill":
+        if args.media_ids_file and (args.created_after or args.created_before):
+            parser.error("--created-after and --created-before filter a search, not a media IDs file")
+        backfill(args)
+    else:
+        run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    labels = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class CounterChild:
+    __slots__ = ("lock", "value")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class HistogramChild:
+    __slots__ = ("lock", "buckets", "bucket_counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        # The last count is the +Inf bucket
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    """
+    A metric family: the children by their label values.
+    Resolve the child once (labels()) where the labels are known in advance, to keep the hot path to one lock.
+    """
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def create_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *label_values):
+        label_values = tuple(str(value) for value in label_values)
+        child = self.children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects the labels {self.label_names}, got {label_values}")
+            with self.lock:
+                child = self.children.setdefault(label_values, self.create_child())
+        return child
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        :return: The samples of the metric: (name suffix, formatted labels, value).
+        """
+        with self.lock:
+            children = list(self.children.items())
+        return [("", format_labels(self.label_names, label_values), child.value) for label_values, child in children]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines += [f"{self.name}{suffix}{labels} {format_value(value)}" for suffix, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def create_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def create_child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self.lock:
+            children = list(self.children.items())
+        samples = []
+        for label_values, child in children:
+            with child.lock:
+                bucket_counts, total, count = list(child.bucket_counts), child.sum, child.count
+            cumulative_count = 0
+            for bucket, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative_count += bucket_count
+                samples.append(("_bucket", format_labels(self.label_names, label_values, f'le="{format_value(bucket)}"'), cumulative_count))
+            samples.append(("_sum", format_labels(self.label_names, label_values), total))
+            samples.append(("_count", format_labels(self.label_names, label_values), count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of the worker, rendered in the Prometheus text exposition format (see metrics.server).
+
+    The modules declare their metrics at import time. Declaring a metric that already exists returns it,
+    so a module can be imported (or reloaded) more than once.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def __get_or_create__(self, metric_class, name: str, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.metric_type}")
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.__get_or_create__(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self.__get_or_create__(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.__get_or_create__(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,61 @@
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .registry import MetricsRegistry, metrics_registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry on GET /metrics, from a daemon thread.
+    The metrics are rendered only when scraped, so the server costs nothing between scrapes.
+
+    :param port: The port to listen on. 0 picks a free port (see port after start).
+    :param host: The interface to listen on.
+    :param registry: The registry to serve.
+    """
+
+    def __init__(self, port: int, host: str = "0.0.0.0", registry: MetricsRegistry = metrics_registry) -> None:
+        self.registry = registry
+        self.http_server = ThreadingHTTPServer((host, port), self.__create_handler__())
+        self.http_server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.http_server.server_address[1]
+
+    def __create_handler__(self):
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return MetricsHandler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.http_server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        logger.info(f"Serving metrics on port {self.port}")
+
+    def close(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,202 @@
+import os
+import time
+import zlib
+import base64
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import Any, Dict
+from urllib.parse import urlparse, unquote
+from uuid import uuid4
+
+PAYLOAD_MARKER = "__payload__"
+COMPRESSED_ENCODING = "zlib+base64"
+CLAIM_CHECK_ENCODING = "claim-check"
+ENCODED_PAYLOAD_PREFIX = f'{{"{PAYLOAD_MARKER}":' # How json.dumps starts the encoded payloads
+CLAIM_CHECK_PREFIX = f'{ENCODED_PAYLOAD_PREFIX} "{CLAIM_CHECK_ENCODING}"' # How json.dumps starts the offloaded payloads
+
+
+class LocalBlobStore:
+    """
+    Stores the offloaded payloads as files under a root directory (e.g. the mounted /temp),
+    which must be shared by the publishers and the consumers.
+
+    :param root_directory: The directory of the blobs.
+    :param ttl_seconds: When set, blobs older than this are deleted (checked by put, at most every tenth of the TTL).
+                        Must be longer than the time a message can wait in the queues.
+    """
+    scheme = "file"
+
+    def __init__(self, root_directory: str, ttl_seconds: float | None = None) -> None:
+        self.root_directory = os.path.realpath(root_directory)
+        self.ttl_seconds = ttl_seconds
+        self.last_cleanup_time = time.monotonic()
+        os.makedirs(self.root_directory, exist_ok=True)
+
+    def put(self, data: bytes) -> str:
+        """
+        :return: The URI of the stored blob.
+        """
+        if self.ttl_seconds is not None and time.monotonic() - self.last_cleanup_time >= self.ttl_seconds/10:
+            self.last_cleanup_time = time.monotonic()
+            self.delete_expired()
+        location = os.path.join(self.root_directory, f"{uuid4()}.blob")
+        temporary_location = location + ".tmp"
+        with open(temporary_location, "wb") as blob_file:
+            blob_file.write(data)
+        # Rename is atomic, so a consumer never reads a partially written blob
+        os.replace(temporary_location, location)
+        return f"{self.scheme}://{location}"
+
+    def __location__(self, uri: str) -> str:
+        location = os.path.realpath(unquote(urlparse(uri).path))
+        if os.path.commonpath([location, self.root_directory]) != self.root_directory:
+            raise ValueError(f"Blob {uri} is not in the store's directory")
+        return location
+
+    def owns(self, uri: str) -> bool:
+        try:
+            self.__location__(uri)
+            return True
+        except ValueError:
+            return False
+
+    def get(self, uri: str) -> bytes:
+        with open(self.__location__(uri), "rb") as blob_file:
+            return blob_file.read()
+
+    def delete(self, uri: str):
+        try:
+            os.remove(self.__location__(uri))
+        except FileNotFoundError:
+            logger.debug(f"Blob {uri} was already deleted")
+
+    def delete_expired(self, now: float | None = None) -> int:
+        """
+        Deletes the blobs older than the TTL.
+
+        :return: The number of deleted blobs.
+        """
+        if self.ttl_seconds is None:
+            return 0
+        now = now if now else time.time()
+        deleted = 0
+        with os.scandir(self.root_directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and now - entry.stat().st_mtime > self.ttl_seconds:
+                        os.remove(entry.path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        if deleted:
+            logger.info(f"Deleted {deleted} expired blobs from {self.root_directory}")
+        return deleted
+
+
+blob_stores: Dict[str, list] = {}
+
+
+def register_blob_store(blob_store):
+    """
+    Registers a store the consumers can read the offloaded payloads from.
+    PayloadCodec registers its store, so only consumers that don't publish need to call it.
+    """
+    registered_stores = blob_stores.setdefault(blob_store.scheme, [])
+    if blob_store not in registered_stores:
+        registered_stores.append(blob_store)
+
+
+def get_blob_store(uri: str):
+    for blob_store in blob_stores.get(urlparse(uri).scheme, []):
+        if blob_store.owns(uri):
+            return blob_store
+    raise ValueError(f"No blob store is registered for {uri}")
+
+
+class PayloadCodec:
+    """
+    Compresses the published payloads above a threshold, and offloads them to a blob store above a second
+    threshold, publishing only a reference (the claim-check pattern). decode_payload reverses it.
+
+    :param compression_threshold_bytes: Payloads larger than this are compressed.
+    :param offload_threshold_bytes: Payloads still larger than this (after compression) are offloaded.
+    :param blob_store: The store of the offloaded payloads. Without a store, payloads are never offloaded.
+    :param compression_level: The zlib compression level.
+    """
+
+    def __init__(self,
+                 compression_threshold_bytes: int = 16*1024,
+                 offload_threshold_bytes: int = 48*1024,
+                 blob_store: LocalBlobStore | None = None,
+                 compression_level: int = 6) -> None:
+        self.compression_threshold_bytes = compression_threshold_bytes
+        self.offload_threshold_bytes = offload_threshold_bytes
+        self.blob_store = blob_store
+        self.compression_level = compression_level
+        if blob_store is not None:
+            register_blob_store(blob_store)
+
+    def encode(self, payload: str) -> str:
+        payload_bytes = payload.encode()
+        if len(payload_bytes) <= self.compression_threshold_bytes:
+            return payload
+        compressed_payload = zlib.compress(payload_bytes, self.compression_level)
+        encoded_payload = base64.b64encode(compressed_payload).decode()
+        if len(encoded_payload) <= self.offload_threshold_bytes or self.blob_store is None:
+            if len(encoded_payload) > self.offload_threshold_bytes:
+                logger.warning(f"Payload of {len(payload_bytes)} bytes is above the offload threshold, but no blob store was supplied")
+            return json.dumps({PAYLOAD_MARKER: COMPRESSED_ENCODING, "data": encoded_payload})
+        uri = self.blob_store.put(compressed_payload)
+        logger.debug(f"Offloaded payload of {len(payload_bytes)} bytes to {uri}")
+        return json.dumps({PAYLOAD_MARKER: CLAIM_CHECK_ENCODING, "uri": uri, "size": len(payload_bytes)})
+
+
+def is_encoded_payload(decoded_message: Any) -> bool:
+    return isinstance(decoded_message, dict) and PAYLOAD_MARKER in decoded_message
+
+
+def decode_payload(decoded_message: dict) -> str:
+    """
+    Returns the original payload of a message encoded by PayloadCodec.
+
+    :param decoded_message: The message, after JSON decoding.
+    :return: The original payload.
+    """
+    encoding = decoded_message[PAYLOAD_MARKER]
+    if encoding == COMPRESSED_ENCODING:
+        return zlib.decompress(base64.b64decode(decoded_message["data"])).decode()
+    if encoding == CLAIM_CHECK_ENCODING:
+        uri = decoded_message["uri"]
+        return zlib.decompress(get_blob_store(uri).get(uri)).decode()
+    raise ValueError(f"Unknown payload encoding {encoding}")
+
+
+def unwrap_payload(message: str) -> str:
+    """
+    Returns the original payload of a message, which may be encoded by PayloadCodec, without decoding
+    the messages that are not encoded.
+    """
+    # PayloadCodec writes the marker first, so a plain message is never parsed here
+    if not message.startswith(ENCODED_PAYLOAD_PREFIX):
+        return message
+    return decode_payload(json.loads(message))
+
+
+def is_offloaded_message(message: Any) -> bool:
+    """
+    Whether a (not decoded) message is a reference to an offloaded payload, without parsing it.
+    """
+    return isinstance(message, str) and message.startswith(CLAIM_CHECK_PREFIX)
+
+
+def delete_payload(decoded_message: Any):
+    """
+    Deletes the blob of an offloaded message. Does nothing for the other messages.
+
+    :param decoded_message: The message, after JSON decoding.
+    """
+    if is_encoded_payload(decoded_message) and decoded_message[PAYLOAD_MARKER] == CLAIM_CHECK_ENCODING:
+        uri = decoded_message["uri"]
+        get_blob_store(uri).delete(uri)
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import tracemalloc
+import logging
+logger = logging.getLogger(__name__)
+
+from collections import Counter
+from typing import Dict
+
+from .timers import stage_timers_snapshot
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler: samples the stacks of all the threads every interval_seconds from a background
+    thread and counts them in the folded format of flame graphs (thread;file:function;... count).
+    The sampled code is not instrumented, so the overhead is only the sampling thread.
+
+    :param interval_seconds: The time between samples.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01) -> None:
+        self.interval_seconds = interval_seconds
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def sample(self):
+        sampler_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded_stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            frames.append(thread_names.get(thread_id, str(thread_id)))
+            folded_stacks.append(";".join(reversed(frames)))
+        with self.lock:
+            self.stacks.update(folded_stacks)
+            self.samples += 1
+
+    def __sample_loop__(self):
+        while not self.stop_event.wait(self.interval_seconds):
+            self.sample()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__sample_loop__, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def take_stacks(self) -> Counter:
+        """
+        :return: The stacks sampled since the last call.
+        """
+        with self.lock:
+            stacks, self.stacks = self.stacks, Counter()
+            self.samples = 0
+        return stacks
+
+
+class WorkerProfiler:
+    """
+    On-demand profiling of the worker. While it runs, it writes a snapshot to output_directory every
+    snapshot_period_seconds and when it stops:
+      - <time>-<pid>-stacks.folded: the sampled stacks (e.g. flamegraph.pl or speedscope can read them)
+      - <time>-<pid>-tracemalloc.txt: the top_allocations lines that allocated most (when top_allocations > 0)
+      - <time>-<pid>-stages.json: the wall and CPU time of each stage of the listen loops (see profiling.timers)
+
+    Start it from the configuration, or install_signal_handler and toggle it with a signal (kill -USR1 <pid>)
+    on a running worker.
+
+    :param output_directory: Where to write the snapshots (e.g. the mounted /temp).
+    :param sampling_interval_seconds: The time between stack samples.
+    :param snapshot_period_seconds: The time between snapshots while profiling.
+    :param top_allocations: The number of allocation sites in the tracemalloc dump. 0 disables tracemalloc.
+    """
+
+    def __init__(self,
+                 output_directory: str,
+                 sampling_interval_seconds: float = 0.01,
+                 snapshot_period_seconds: float = 60,
+                 top_allocations: int = 25) -> None:
+        self.output_directory = output_directory
+        self.snapshot_period_seconds = snapshot_period_seconds
+        self.top_allocations = top_allocations
+        self.sampling_profiler = SamplingProfiler(sampling_interval_seconds)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.snapshot_thread = None
+        self.started_tracemalloc = False
+
+    @property
+    def running(self) -> bool:
+        return self.snapshot_thread is not None and self.snapshot_thread.is_alive()
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            os.makedirs(self.output_directory, exist_ok=True)
+            if self.top_allocations > 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+            self.stop_event.clear()
+            self.sampling_profiler.start()
+            self.snapshot_thread = threading.Thread(target=self.__snapshot_loop__, name="profiler-snapshots", daemon=True)
+            self.snapshot_thread.start()
+        logger.info(f"Started profiling to {self.output_directory}")
+
+    def stop(self):
+        """
+        Stops profiling and writes the last snapshot.
+        """
+        with self.lock:
+            if not self.running:
+                return
+            self.stop_event.set()
+            self.snapshot_thread.join()
+            self.sampling_profiler.stop()
+            self.write_snapshot()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+        logger.info("Stopped profiling")
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def __snapshot_loop__(self):
+        while not self.stop_event.wait(self.snapshot_period_seconds):
+            try:
+                self.write_snapshot()
+            except OSError:
+                logger.exception(f"Failed to write a profiling snapshot to {self.output_directory}")
+
+    def write_snapshot(self) -> Dict[str, str]:
+        """
+        :return: The written files by kind.
+        """
+        file_prefix = os.path.join(self.output_directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+        written_files = {}
+
+        stacks = self.sampling_profiler.take_stacks()
+        written_files["stacks"] = file_prefix + "-stacks.folded"
+        with open(written_files["stacks"], "w") as stacks_file:
+            stacks_file.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+        if tracemalloc.is_tracing() and self.top_allocations > 0:
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            written_files["tracemalloc"] = file_prefix + "-tracemalloc.txt"
+            with open(written_files["tracemalloc"], "w") as tracemalloc_file:
+                current_size, peak_size = tracemalloc.get_traced_memory()
+                tracemalloc_file.write(f"Traced memory: current={current_size} peak={peak_size}\n")
+                tracemalloc_file.writelines(f"{statistic}\n" for statistic in statistics[:self.top_allocations])
+
+        written_files["stages"] = file_prefix + "-stages.json"
+        with open(written_files["stages"], "w") as stages_file:
+            json.dump(stage_timers_snapshot(), stages_file, indent=2)
+
+        logger.info(f"Wrote profiling snapshot {file_prefix}")
+        return written_files
+
+    def install_signal_handler(self, signal_name: str = "SIGUSR1"):
+        """
+        Toggles the profiler on the signal. Must be called from the main thread.
+        """
+        def handle_signal(signal_number, frame):
+            # The handler runs on the main thread between bytecodes, so the (blocking) toggle runs on its own thread
+            threading.Thread(target=self.toggle, name="profiler-toggle", daemon=True).start()
+
+        signal.signal(getattr(signal, signal_name), handle_signal)
+        logger.info(f"Send {signal_name} to process {os.getpid()} to toggle profiling")
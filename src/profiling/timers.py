@@ -0,0 +1,102 @@
+import time
+import threading
+from typing import Dict
+
+from metrics.registry import metrics_registry
+
+stage_seconds = metrics_registry.histogram("shkedia_worker_stage_seconds", "Wall time of each stage of the listen loops", ("loop", "stage"))
+stage_cpu_seconds = metrics_registry.counter("shkedia_worker_stage_cpu_seconds_total", "CPU time of the listen loop thread in each stage", ("loop", "stage"))
+
+
+class StageTimer:
+    """
+    The totals of the wall and CPU (of the measuring threads) time of one stage. Each measurement is a
+    StageMeasurement of its own, so the threads that time the same stage concurrently don't share start times.
+    """
+    __slots__ = ("calls", "wall_seconds", "cpu_seconds", "lock", "wall_histogram", "cpu_counter")
+
+    def __init__(self, loop_name: str, stage_name: str) -> None:
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.lock = threading.Lock()
+        self.wall_histogram = stage_seconds.labels(loop_name, stage_name)
+        self.cpu_counter = stage_cpu_seconds.labels(loop_name, stage_name)
+
+    def add(self, wall_seconds: float, cpu_seconds: float):
+        with self.lock:
+            self.calls += 1
+            self.wall_seconds += wall_seconds
+            self.cpu_seconds += cpu_seconds
+        self.wall_histogram.observe(wall_seconds)
+        self.cpu_counter.inc(cpu_seconds)
+
+    def totals(self) -> dict:
+        with self.lock:
+            return {"calls": self.calls, "wall_seconds": self.wall_seconds, "cpu_seconds": self.cpu_seconds}
+
+
+class StageMeasurement:
+    """
+    Measures one call of a stage, as a context manager, and adds it to the totals of its StageTimer.
+    """
+    __slots__ = ("timer", "wall_start", "cpu_start")
+
+    def __init__(self, timer: StageTimer) -> None:
+        self.timer = timer
+        self.wall_start = 0.0
+        self.cpu_start = 0.0
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(time.perf_counter() - self.wall_start, time.thread_time() - self.cpu_start)
+        return False
+
+
+class StageTimers:
+    """
+    The stage timers of a listen loop, e.g. with timers.stage("receive"): ...
+    The totals are exported as metrics and written by the profiler's dumps (see profiling.profiler).
+    """
+
+    def __init__(self, loop_name: str) -> None:
+        self.loop_name = loop_name
+        self.lock = threading.Lock()
+        self.timers: Dict[str, StageTimer] = {}
+
+    def stage(self, stage_name: str) -> StageMeasurement:
+        timer = self.timers.get(stage_name)
+        if timer is None:
+            with self.lock:
+                timer = self.timers.setdefault(stage_name, StageTimer(self.loop_name, stage_name))
+        return StageMeasurement(timer)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            timers = dict(self.timers)
+        return {stage_name: timer.totals() for stage_name, timer in timers.items()}
+
+
+loops_lock = threading.Lock()
+loops_stage_timers: Dict[str, StageTimers] = {}
+
+
+def get_stage_timers(loop_name: str) -> StageTimers:
+    """
+    :return: The (shared) stage timers of the loop.
+    """
+    with loops_lock:
+        timers = loops_stage_timers.get(loop_name)
+        if timers is None:
+            timers = loops_stage_timers[loop_name] = StageTimers(loop_name)
+    return timers
+
+
+def stage_timers_snapshot() -> Dict[str, Dict[str, dict]]:
+    with loops_lock:
+        loops = dict(loops_stage_timers)
+    return {loop_name: timers.snapshot() for loop_name, timers in loops.items()}
@@ -0,0 +1,184 @@
+import time
+import zlib
+import queue
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from enum import Enum
+from concurrent.futures import Future
+from typing import List
+
+from .service import PublisherService
+
+
+class OverflowPolicy(str, Enum):
+    BLOCK = "block"
+    DROP = "drop"
+
+
+class PublisherMetrics:
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def record_publish(self, latency_seconds: float, succeeded: bool):
+        with self.lock:
+            if succeeded:
+                self.published += 1
+            else:
+                self.failed += 1
+            self.latency_seconds_total += latency_seconds
+            self.latency_seconds_max = max(self.latency_seconds_max, latency_seconds)
+
+    def record_drop(self, count: int = 1):
+        with self.lock:
+            self.dropped += count
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            publish_count = self.published + self.failed
+            return {"published": self.published,
+                    "failed": self.failed,
+                    "dropped": self.dropped,
+                    "latency_seconds_avg": self.latency_seconds_total/publish_count if publish_count else 0.0,
+                    "latency_seconds_max": self.latency_seconds_max}
+
+
+class BackgroundPublisher:
+    """
+    Publishes messages through a PublisherService on background threads, so the caller doesn't wait for SNS.
+
+    Each message is routed to a worker by its FIFO MessageGroupId, so the messages of a group keep their order.
+    The workers have their own queues, but max_queue_size bounds the messages waiting in all of them together.
+
+    :param publisher_service: The service used to publish.
+    :param max_queue_size: The maximum number of messages waiting to be published, across all the workers.
+    :param max_workers: The number of parallel publishers.
+    :param overflow_policy: What to do when the queue is full: block the caller or drop the message.
+    :param block_timeout_seconds: With the block policy, how long to wait for space before raising queue.Full.
+    """
+
+    def __init__(self,
+                 publisher_service: PublisherService,
+                 max_queue_size: int = 1000,
+                 max_workers: int = 2,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+                 block_timeout_seconds: float | None = None) -> None:
+        self.publisher_service = publisher_service
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.block_timeout_seconds = block_timeout_seconds
+        self.metrics = PublisherMetrics()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.aborted = False
+        self.pending_puts = 0
+        self.capacity = threading.Semaphore(max_queue_size)
+        self.queues: List[queue.Queue] = [queue.Queue() for _ in range(max_workers)]
+        self.workers = [threading.Thread(target=self.__work__, args=(worker_queue,), name=f"background-publisher-{index}", daemon=True)
+                        for index, worker_queue in enumerate(self.queues)]
+        for worker in self.workers:
+            worker.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(worker_queue.qsize() for worker_queue in self.queues)
+
+    def metrics_snapshot(self) -> dict:
+        return {**self.metrics.snapshot(), "queue_depth": self.queue_depth}
+
+    def publish(self, topic_id, message, message_id, grouping_key=None) -> Future | None:
+        """
+        Queues a message to publish.
+
+        :return: A future that is done when the message is published, or None if the message was dropped.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The background publisher is closed")
+            # close() waits for the puts in progress, so a message is never queued after the drain
+            self.pending_puts += 1
+        try:
+            message_group_id = self.publisher_service.message_group_id(message, grouping_key)
+            worker_queue = self.queues[zlib.crc32(message_group_id.encode()) % len(self.queues)]
+            if self.overflow_policy == OverflowPolicy.DROP:
+                has_capacity = self.capacity.acquire(blocking=False)
+            else:
+                has_capacity = self.capacity.acquire(timeout=self.block_timeout_seconds)
+            if not has_capacity:
+                self.metrics.record_drop()
+                logger.warning(f"Publish queue is full. Dropped message {message_id}")
+                if self.overflow_policy == OverflowPolicy.DROP:
+                    return None
+                raise queue.Full()
+            future = Future()
+            with self.condition:
+                if self.aborted:
+                    # Only if close() stopped waiting for this put at its deadline
+                    future.set_exception(TimeoutError("The publisher was closed before the message was published"))
+                    self.metrics.record_drop()
+                    return future
+                worker_queue.put_nowait((future, topic_id, message, message_id, grouping_key))
+            return future
+        finally:
+            with self.condition:
+                self.pending_puts -= 1
+                self.condition.notify_all()
+
+    def __work__(self, worker_queue: queue.Queue):
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                return
+            self.capacity.release()
+            future, topic_id, message, message_id, grouping_key = item
+            if self.aborted:
+                future.set_exception(TimeoutError("The publisher was closed before the message was published"))
+                self.metrics.record_drop()
+                continue
+            start_time = time.perf_counter()
+            try:
+                future.set_result(self.publisher_service.publish(topic_id, message, message_id, grouping_key))
+                self.metrics.record_publish(time.perf_counter()-start_time, succeeded=True)
+            except Exception as err:
+                future.set_exception(err)
+                self.metrics.record_publish(time.perf_counter()-start_time, succeeded=False)
+
+    def close(self, deadline_seconds: float = 30) -> int:
+        """
+        Stops accepting messages and publishes the queued ones until the deadline.
+        The messages still queued at the deadline are failed with TimeoutError.
+
+        :return: The number of queued messages that were not published.
+        """
+        deadline = time.monotonic() + deadline_seconds
+        with self.condition:
+            self.closed = True
+            self.condition.wait_for(lambda: self.pending_puts == 0, timeout=max(deadline - time.monotonic(), 0))
+        for worker_queue in self.queues:
+            worker_queue.put_nowait(None)
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        dropped_before = self.metrics.dropped
+        with self.condition:
+            self.aborted = True
+        for worker_queue in self.queues:
+            while True:
+                try:
+                    item = worker_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    self.capacity.release()
+                    item[0].set_exception(TimeoutError("The publisher was closed before the message was published"))
+                    self.metrics.record_drop()
+            worker_queue.put_nowait(None)
+        undelivered = self.metrics.dropped - dropped_before
+        if undelivered:
+            logger.warning(f"Closed the background publisher with {undelivered} unpublished messages")
+        return undelivered
@@ -0,0 +1,148 @@
+import time
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, List, Tuple
+
+from botocore.exceptions import ClientError
+
+from concurrency.dispatcher import GroupOrderedDispatcher
+from .sns_wrapper import SnsWrapper
+from .grouping import DEFAULT_MESSAGE_GROUP_ID
+
+MAX_BATCH_SIZE = 10 # See https://docs.aws.amazon.com/sns/latest/api/API_PublishBatch.html
+MAX_BATCH_BYTES = 256*1024 # The total size of the messages of a batch, above it SNS fails with BatchRequestTooLong
+
+
+class BatchPublisher:
+    """
+    Buffers the published messages per topic and sends them with PublishBatch.
+
+    A topic's buffer is flushed when it holds max_batch_size messages, before it would exceed max_batch_bytes,
+    when its oldest message waited linger_seconds, or on flush/close. The batches of a topic are sent one after the other (to keep the FIFO order),
+    the batches of different topics are sent in parallel.
+
+    :param sns_wrapper: The SNS wrapper used to send the batches.
+    :param max_batch_size: The maximum number of messages in a batch (up to 10).
+    :param max_batch_bytes: The maximum total size of the messages of a batch (up to 256 KiB).
+    :param linger_seconds: The maximum time a message waits for its batch to fill.
+    :param max_workers: The number of batches sent in parallel.
+    """
+
+    def __init__(self,
+                 sns_wrapper: SnsWrapper,
+                 max_batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_bytes: int = MAX_BATCH_BYTES,
+                 linger_seconds: float = 0.01,
+                 max_workers: int = 4) -> None:
+        if not 1 <= max_batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"max_batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        if not 1 <= max_batch_bytes <= MAX_BATCH_BYTES:
+            raise ValueError(f"max_batch_bytes must be between 1 and {MAX_BATCH_BYTES}")
+        self.sns_wrapper = sns_wrapper
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.linger_seconds = linger_seconds
+        self.condition = threading.Condition()
+        self.buffers: Dict[str, List[Tuple[dict, Future]]] = {}
+        self.buffers_start_time: Dict[str, float] = {}
+        self.buffers_bytes: Dict[str, int] = {}
+        self.closed = False
+        self.dispatcher = GroupOrderedDispatcher(max_workers=max_workers, thread_name_prefix="batch-publisher-sender")
+        self.flusher = threading.Thread(target=self.__flush_loop__, name="batch-publisher", daemon=True)
+        self.flusher.start()
+
+    def publish(self, topic_arn: str, message: str, message_id: str, message_group_id: str = DEFAULT_MESSAGE_GROUP_ID,
+                attributes: dict | None = None) -> Future:
+        """
+        Adds a message to the topic's buffer.
+
+        :param topic_arn: The ARN of the topic to publish to.
+        :param message: The message to publish.
+        :param message_id: The deduplication ID of the message.
+        :param message_group_id: The FIFO group of the message.
+        :param attributes: Optional message attributes, in the SNS format.
+        :return: A future of the SNS MessageId. It raises ClientError if the message failed.
+        """
+        future = Future()
+        message_bytes = len(message.encode())
+        if attributes:
+            # The attributes count towards the size limit too
+            message_bytes += sum(len(name) + len(str(value.get("StringValue", value.get("BinaryValue", "")))) for name, value in attributes.items())
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The batch publisher is closed")
+            if topic_arn in self.buffers and self.buffers_bytes[topic_arn] + message_bytes > self.max_batch_bytes:
+                self.__flush_topic__(topic_arn)
+            buffer = self.buffers.setdefault(topic_arn, [])
+            if not buffer:
+                self.buffers_start_time[topic_arn] = time.monotonic()
+                self.buffers_bytes[topic_arn] = 0
+            buffer.append((self.sns_wrapper.create_batch_entry(str(len(buffer)), message, message_id, message_group_id, attributes), future))
+            self.buffers_bytes[topic_arn] += message_bytes
+            if len(buffer) >= self.max_batch_size or self.buffers_bytes[topic_arn] >= self.max_batch_bytes:
+                self.__flush_topic__(topic_arn)
+            else:
+                self.condition.notify()
+        return future
+
+    def flush(self):
+        """
+        Sends all the buffered messages without waiting for the linger time.
+        """
+        with self.condition:
+            for topic_arn in list(self.buffers):
+                self.__flush_topic__(topic_arn)
+
+    def close(self, timeout: float | None = None):
+        """
+        Flushes the buffers and waits until all the batches are sent.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            for topic_arn in list(self.buffers):
+                self.__flush_topic__(topic_arn)
+            self.closed = True
+            self.condition.notify()
+        self.flusher.join(timeout)
+        self.dispatcher.shutdown(wait=True, timeout=timeout)
+
+    def __flush_loop__(self):
+        with self.condition:
+            while not self.closed:
+                now = time.monotonic()
+                for topic_arn, start_time in list(self.buffers_start_time.items()):
+                    if now - start_time >= self.linger_seconds:
+                        self.__flush_topic__(topic_arn)
+                wait_time = None
+                if self.buffers_start_time:
+                    wait_time = max(min(self.buffers_start_time.values()) + self.linger_seconds - now, 0)
+                self.condition.wait(wait_time)
+
+    def __flush_topic__(self, topic_arn):
+        # Must be called with the condition's lock held
+        batch = self.buffers.pop(topic_arn)
+        self.buffers_start_time.pop(topic_arn)
+        self.buffers_bytes.pop(topic_arn)
+        self.dispatcher.submit(topic_arn, partial(self.__send_batch__, topic_arn, batch))
+
+    def __send_batch__(self, topic_arn, batch):
+        try:
+            response = self.sns_wrapper.publish_message_batch(topic_arn, [entry for entry, _ in batch])
+        except Exception as err:
+            for _, future in batch:
+                future.set_exception(err)
+            return
+        for entry_result in response.get("Successful", []):
+            batch[int(entry_result["Id"])][1].set_result(entry_result["MessageId"])
+        for entry_result in response.get("Failed", []):
+            error = ClientError({"Error": {"Code": entry_result["Code"], "Message": entry_result.get("Message", "")}}, "PublishBatch")
+            batch[int(entry_result["Id"])][1].set_exception(error)
+        for entry, future in batch:
+            if not future.done():
+                logger.warning(f"Entry {entry['Id']} is missing from the PublishBatch response of topic {topic_arn}")
+                future.set_exception(ClientError({"Error": {"Code": "MissingBatchEntry", "Message": "The entry is missing from the response"}}, "PublishBatch"))
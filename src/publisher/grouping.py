@@ -0,0 +1,24 @@
+import zlib
+
+DEFAULT_MESSAGE_GROUP_ID = "some_id"
+MAX_MESSAGE_GROUP_ID_LENGTH = 128
+
+
+def create_message_group_id(grouping_key=None, shard_count: int | None = None) -> str:
+    """
+    Maps a grouping key (e.g. media_id or user id) to the FIFO MessageGroupId of a message.
+    Messages with the same key keep their order, messages with different keys can be consumed in parallel.
+
+    :param grouping_key: The entity the message belongs to. Without a key, all the messages go to one group.
+    :param shard_count: When set, the keys are hashed into this number of groups instead of a group per key.
+    :return: The MessageGroupId.
+    """
+    if grouping_key is None:
+        return DEFAULT_MESSAGE_GROUP_ID
+    grouping_key = str(grouping_key)
+    if shard_count:
+        # crc32 is stable between processes, unlike hash()
+        return f"shard-{zlib.crc32(grouping_key.encode()) % shard_count}"
+    if len(grouping_key) > MAX_MESSAGE_GROUP_ID_LENGTH:
+        return f"key-{zlib.crc32(grouping_key.encode()):08x}-{grouping_key[:MAX_MESSAGE_GROUP_ID_LENGTH-13]}"
+    return grouping_key
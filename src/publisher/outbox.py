@@ -0,0 +1,204 @@
+import time
+import sqlite3
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import Dict, List, NamedTuple
+from uuid import uuid4
+
+from .service import PublisherService
+
+STAGED_STATUS = "STAGED"
+READY_STATUS = "READY"
+
+
+class OutboxEvent(NamedTuple):
+    event_id: str
+    topic_id: str
+    payload: str
+    grouping_key: str | None = None
+    sequence: int | None = None
+
+
+class SqliteOutbox:
+    """
+    Durable local outbox of the events to publish (the transactional outbox pattern).
+
+    The events of a DB write are staged before the write and committed only after it succeeded, so an event is
+    never published for a failed write. A staged batch that was neither committed nor discarded (the worker
+    stopped in the middle) is returned by staged_batches, so the write can be confirmed and the batch committed.
+
+    :param database_location: The SQLite file. Must be on a persistent volume for the events to survive a restart.
+    """
+
+    def __init__(self, database_location: str) -> None:
+        self.database_location = database_location
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_location, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS outbox_events (
+                                       sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       event_id TEXT NOT NULL UNIQUE,
+                                       batch_id TEXT NOT NULL,
+                                       topic_id TEXT NOT NULL,
+                                       payload TEXT NOT NULL,
+                                       grouping_key TEXT,
+                                       status TEXT NOT NULL,
+                                       created_at REAL NOT NULL,
+                                       attempts INTEGER NOT NULL DEFAULT 0)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_events_status ON outbox_events (status, sequence)")
+        self.connection.commit()
+
+    def stage(self, events: List[OutboxEvent]) -> str:
+        """
+        Stores the events of a write that is about to be sent, in one transaction.
+        Staging an event again (same event_id) replaces it.
+
+        :return: The ID of the batch, to commit or discard it.
+        """
+        batch_id = str(uuid4())
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany("""INSERT OR REPLACE INTO outbox_events (event_id, batch_id, topic_id, payload, grouping_key, status, created_at)
+                                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                                        [(event.event_id, batch_id, event.topic_id, event.payload, event.grouping_key, STAGED_STATUS, now)
+                                         for event in events])
+        return batch_id
+
+    def commit(self, batch_id: str):
+        """
+        Marks the events of the batch as ready to publish. Call it after the write succeeded.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE outbox_events SET status=? WHERE batch_id=? AND status=?", (READY_STATUS, batch_id, STAGED_STATUS))
+
+    def discard(self, batch_id: str):
+        """
+        Deletes the events of the batch. Call it after the write failed.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM outbox_events WHERE batch_id=? AND status=?", (batch_id, STAGED_STATUS))
+
+    def staged_batches(self) -> Dict[str, List[OutboxEvent]]:
+        """
+        :return: The events of the batches that were staged and not committed or discarded yet, by batch ID.
+        """
+        with self.lock:
+            rows = self.connection.execute("""SELECT batch_id, event_id, topic_id, payload, grouping_key, sequence FROM outbox_events
+                                              WHERE status=? ORDER BY sequence""", (STAGED_STATUS,)).fetchall()
+        batches = {}
+        for batch_id, *event_fields in rows:
+            batches.setdefault(batch_id, []).append(OutboxEvent(*event_fields))
+        return batches
+
+    def fetch_ready(self, limit: int) -> List[OutboxEvent]:
+        """
+        :return: The oldest events that are ready to publish, in the order they were staged.
+        """
+        with self.lock:
+            rows = self.connection.execute("""SELECT event_id, topic_id, payload, grouping_key, sequence FROM outbox_events
+                                              WHERE status=? ORDER BY sequence LIMIT ?""", (READY_STATUS, limit)).fetchall()
+        return [OutboxEvent(*row) for row in rows]
+
+    def delete(self, sequences: List[int]):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM outbox_events WHERE sequence=?", [(sequence,) for sequence in sequences])
+
+    def record_attempt(self, sequence: int):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE outbox_events SET attempts=attempts+1 WHERE sequence=?", (sequence,))
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox_events WHERE status=?", (READY_STATUS,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class OutboxRelay:
+    """
+    Publishes the ready events of an outbox through a PublisherService on a background thread, in batches.
+
+    The events are published in the order they were staged. A batch stops at the first failure, so a later event
+    is never published before an earlier one; the failed event is retried on the next poll.
+    An event is deleted from the outbox only after it was published (at-least-once delivery; the event_id is
+    the SNS deduplication ID, so a retried event is deduplicated by the FIFO topic).
+
+    :param outbox: The outbox to drain.
+    :param publisher_service: The service used to publish.
+    :param batch_size: The number of events read from the outbox at a time.
+    :param poll_interval_seconds: How long to wait when the outbox is empty (or after a failure).
+    """
+
+    def __init__(self,
+                 outbox: SqliteOutbox,
+                 publisher_service: PublisherService,
+                 batch_size: int = 100,
+                 poll_interval_seconds: float = 1.0) -> None:
+        self.outbox = outbox
+        self.publisher_service = publisher_service
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.wake_up_event = threading.Event()
+        self.stopped = False
+        self.published = 0
+        self.failed = 0
+        self.thread = None
+
+    def relay_once(self) -> int:
+        """
+        Publishes one batch of ready events.
+
+        :return: The number of published events. -1 if the batch stopped at a failure.
+        """
+        events = self.outbox.fetch_ready(self.batch_size)
+        published_sequences = []
+        try:
+            for event in events:
+                try:
+                    self.publisher_service.publish_payload(event.topic_id, event.payload, event.event_id, event.grouping_key)
+                except Exception as err:
+                    self.failed += 1
+                    self.outbox.record_attempt(event.sequence)
+                    logger.warning(f"Failed to relay event {event.event_id}: {err}")
+                    return -1
+                published_sequences.append(event.sequence)
+        finally:
+            if published_sequences:
+                self.outbox.delete(published_sequences)
+                self.published += len(published_sequences)
+        return len(published_sequences)
+
+    def wake_up(self):
+        """
+        Makes the relay poll the outbox now (e.g. right after a batch was committed).
+        """
+        self.wake_up_event.set()
+
+    def __relay_loop__(self):
+        while not self.stopped:
+            try:
+                published = self.relay_once()
+            except Exception:
+                logger.exception("Outbox relay failed")
+                published = -1
+            if published == self.batch_size:
+                continue
+            self.wake_up_event.wait(self.poll_interval_seconds)
+            self.wake_up_event.clear()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.__relay_loop__, name="outbox-relay", daemon=True)
+        self.thread.start()
+
+    def close(self, timeout: float | None = None):
+        """
+        Stops the relay. The events that were not published stay in the outbox for the next run.
+        """
+        self.stopped = True
+        self.wake_up_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -1,28 +1,141 @@
+import time
+import threading
 import traceback
 import logging
 logger = logging.getLogger(__name__)
 
-import boto3
+from concurrent.futures import Future
+from botocore.exceptions import ClientError
 from .sns_wrapper import SnsWrapper
+from .batcher import BatchPublisher
+from .grouping import create_message_group_id
+from .topics import TopicRegistry
+from payload.claim_check import PayloadCodec
+from payload.codecs import codec_registry, content_type_attributes, JSON_CODEC
+from metrics.registry import metrics_registry
 from typing import List
 
+published_messages = metrics_registry.counter("shkedia_worker_published_messages_total", "Messages published (or buffered for a batch) by topic and result", ("topic", "result"))
+publish_seconds = metrics_registry.histogram("shkedia_worker_publish_seconds", "Latency of the direct SNS publishes by topic", ("topic",))
+
 class PublisherService:
     def __init__(self,
                  topic_names: List[str],
-                 
+                 sns_resource = None,
+                 batch_linger_seconds: float | None = None,
+                 batch_max_workers: int = 4,
+                 grouping_field: str | None = None,
+                 group_shard_count: int | None = None,
+                 payload_codec: PayloadCodec | None = None,
+                 topics_cache_location: str | None = None,
+                 warm_start: bool = False,
+                 message_codec: str = JSON_CODEC,
                  ) -> None:
-        self.sns_service = SnsWrapper(boto3.resource("sns"))
+        self.sns_resource = sns_resource
+        self.__sns_service = None
+        self.__batch_publisher = None
+        self.lock = threading.RLock()
         self.topic_names = topic_names
-        self.topics = {}
-        for topic_id in self.topic_names:
-            self.topics[topic_id] = self.sns_service.create_topic(topic_id)
+        self.batch_linger_seconds = batch_linger_seconds
+        self.batch_max_workers = batch_max_workers
+        self.grouping_field = grouping_field
+        self.group_shard_count = group_shard_count
+        self.payload_codec = payload_codec
+        # The consumers pick the decoder by the content_type attribute, see payload.codecs
+        self.message_codec = codec_registry.get(message_codec)
+        self.message_attributes = content_type_attributes(self.message_codec)
+        # The topics are resolved on first use, see TopicRegistry
+        self.topics = TopicRegistry(topic_names, lambda: self.sns_service, cache_location=topics_cache_location)
+        if warm_start:
+            self.topics.warm_up()
+
+    @property
+    def sns_service(self) -> SnsWrapper:
+        if self.__sns_service is None:
+            with self.lock:
+                if self.__sns_service is None:
+                    if self.sns_resource is None:
+                        import boto3
+                        self.sns_resource = boto3.resource("sns")
+                    self.__sns_service = SnsWrapper(self.sns_resource)
+        return self.__sns_service
+
+    @property
+    def batch_publisher(self) -> BatchPublisher | None:
+        if self.batch_linger_seconds is None:
+            return None
+        if self.__batch_publisher is None:
+            with self.lock:
+                if self.__batch_publisher is None:
+                    self.__batch_publisher = BatchPublisher(self.sns_service,
+                                                            linger_seconds=self.batch_linger_seconds,
+                                                            max_workers=self.batch_max_workers)
+        return self.__batch_publisher
 
+    def message_group_id(self, message, grouping_key=None) -> str:
+        """
+        Returns the FIFO MessageGroupId of the message: by the explicit grouping key, or by the message's
+        grouping_field (e.g. media_id), sharded into group_shard_count groups when it is set.
+        """
+        if grouping_key is None and self.grouping_field is not None:
+            grouping_key = getattr(message, self.grouping_field)
+        return create_message_group_id(grouping_key, self.group_shard_count)
 
-    def publish(self, topic_id, message, message_id):
+    def serialize(self, message) -> str:
+        payload = self.message_codec.encode(message)
+        if self.payload_codec is not None:
+            payload = self.payload_codec.encode(payload)
+        return payload
+
+    def publish(self, topic_id, message, message_id, grouping_key=None):
         #TODO: Check how to parse message
         try:
-            self.sns_service.publish_message(self.topics[topic_id],message.model_dump_json(),message_id)
+            payload = self.serialize(message)
+            message_group_id = self.message_group_id(message, grouping_key)
+            return self.__publish_message__(topic_id, payload, message_id, message_group_id, self.message_attributes)
         except Exception as err:
             traceback.print_exc()
             logger.error(err)
-            raise err
\ No newline at end of file
+            raise err
+
+    def publish_payload(self, topic_id, payload: str, message_id, grouping_key=None):
+        """
+        Publishes an already serialized JSON message (e.g. one stored in the outbox).
+        The payload codec is still applied, the message codec is not.
+
+        :return: The SNS MessageId.
+        """
+        if self.payload_codec is not None:
+            payload = self.payload_codec.encode(payload)
+        return self.__publish_message__(topic_id, payload, message_id, create_message_group_id(grouping_key, self.group_shard_count))
+
+    def __publish_message__(self, topic_id, payload, message_id, message_group_id, attributes=None):
+        try:
+            publish_start = time.perf_counter()
+            sns_message_id = self.sns_service.publish_message(self.topics[topic_id],payload,message_id,message_group_id,attributes)
+            publish_seconds.labels(topic_id).observe(time.perf_counter() - publish_start)
+            published_messages.labels(topic_id, "published").inc()
+            return sns_message_id
+        except ClientError as err:
+            published_messages.labels(topic_id, "failed").inc()
+            if err.response["Error"]["Code"] == "NotFound":
+                # Don't re-create it here: a re-created topic has no subscribers, so the message would be lost
+                logger.warning(f"Topic {topic_id} was deleted. Dropping its cached ARN")
+                self.topics.invalidate(topic_id)
+            raise err
+
+    def publish_batched(self, topic_id, message, message_id, grouping_key=None) -> Future:
+        """
+        Buffers the message and publishes it with PublishBatch (see BatchPublisher).
+
+        :return: A future of the SNS MessageId.
+        """
+        if self.batch_publisher is None:
+            raise ValueError("Batch publishing is disabled. Set batch_linger_seconds to enable it")
+        published_messages.labels(topic_id, "batched").inc()
+        return self.batch_publisher.publish(self.topics.resolve_arn(topic_id), self.serialize(message), message_id,
+                                            self.message_group_id(message, grouping_key), self.message_attributes)
+
+    def close(self):
+        if self.__batch_publisher is not None:
+            self.__batch_publisher.close()
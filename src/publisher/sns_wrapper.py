@@ -13,11 +13,15 @@ messages.
 import json
 import logging
 import time
-import boto3
 from botocore.exceptions import ClientError
+from .grouping import DEFAULT_MESSAGE_GROUP_ID
 
 logger = logging.getLogger(__name__)
 
+FIFO_TOPIC_ATTRIBUTES = {
+    "FifoTopic": str(True),
+    "ContentBasedDeduplication": str(True),
+}
 
 
 class SnsWrapper:
@@ -40,10 +44,7 @@ class SnsWrapper:
         :return: The newly created topic.
         """
         try:
-            topic = self.sns_resource.create_topic(Name=name,Attributes={
-                    "FifoTopic": str(True),
-                    "ContentBasedDeduplication": str(True),
-                },)
+            topic = self.sns_resource.create_topic(Name=name,Attributes=FIFO_TOPIC_ATTRIBUTES)
             logger.info("Created topic %s with ARN %s.", name, topic.arn)
         except ClientError:
             logger.exception("Couldn't create topic %s.", name)
@@ -53,6 +54,22 @@ class SnsWrapper:
 
     # snippet-end:[python.example_code.sns.CreateTopic]
 
+    def create_topic_arn(self, name):
+        """
+        Creates a notification topic through the client, which is thread safe (unlike the resource).
+
+        :param name: The name of the topic to create.
+        :return: The ARN of the topic.
+        """
+        try:
+            response = self.sns_resource.meta.client.create_topic(Name=name,Attributes=FIFO_TOPIC_ATTRIBUTES)
+            logger.info("Created topic %s with ARN %s.", name, response["TopicArn"])
+        except ClientError:
+            logger.exception("Couldn't create topic %s.", name)
+            raise
+        else:
+            return response["TopicArn"]
+
     # snippet-start:[python.example_code.sns.ListTopics]
     def list_topics(self):
         """
@@ -117,6 +134,63 @@ class SnsWrapper:
 
     # snippet-end:[python.example_code.sns.Subscribe]
 
+    def subscribe_arn(self, topic_arn, protocol, endpoint):
+        """
+        Subscribes an endpoint to the topic through the client, which is thread safe (unlike the resource).
+
+        :param topic_arn: The ARN of the topic to subscribe to.
+        :param protocol: The protocol of the endpoint, such as 'sqs'.
+        :param endpoint: The endpoint that receives messages, such as a queue ARN.
+        :return: The ARN of the subscription.
+        """
+        try:
+            response = self.sns_resource.meta.client.subscribe(
+                TopicArn=topic_arn, Protocol=protocol, Endpoint=endpoint, ReturnSubscriptionArn=True
+            )
+            logger.info("Subscribed %s %s to topic %s.", protocol, endpoint, topic_arn)
+        except ClientError:
+            logger.exception(
+                "Couldn't subscribe %s %s to topic %s.", protocol, endpoint, topic_arn
+            )
+            raise
+        else:
+            return response["SubscriptionArn"]
+
+    def unsubscribe_arn(self, subscription_arn):
+        """
+        Deletes a subscription through the client, which is thread safe (unlike the resource).
+        """
+        try:
+            self.sns_resource.meta.client.unsubscribe(SubscriptionArn=subscription_arn)
+            logger.info("Deleted subscription %s.", subscription_arn)
+        except ClientError:
+            logger.exception("Couldn't delete subscription %s.", subscription_arn)
+            raise
+
+    def list_topic_subscriptions(self, topic_arn, endpoint):
+        """
+        Lists the confirmed subscriptions of an endpoint to a topic, read from the ListSubscriptionsByTopic pages
+        without an extra request per subscription.
+
+        :param topic_arn: The ARN of the topic.
+        :param endpoint: The endpoint of the subscriptions, such as a queue ARN.
+        :return: The ARNs of the subscriptions. Empty if the topic doesn't exist.
+        """
+        try:
+            subscription_arns = []
+            paginator = self.sns_resource.meta.client.get_paginator("list_subscriptions_by_topic")
+            for page in paginator.paginate(TopicArn=topic_arn):
+                for subscription in page["Subscriptions"]:
+                    if subscription["Endpoint"] == endpoint and subscription["SubscriptionArn"] != "PendingConfirmation":
+                        subscription_arns.append(subscription["SubscriptionArn"])
+        except ClientError as err:
+            if err.response["Error"]["Code"] == "NotFound":
+                return []
+            logger.exception("Couldn't get subscriptions of %s to topic %s.", endpoint, topic_arn)
+            raise
+        else:
+            return subscription_arns
+
     # snippet-start:[python.example_code.sns.ListSubscriptions]
     def list_subscriptions(self, topic=None):
         """
@@ -208,7 +282,7 @@ class SnsWrapper:
 
     # snippet-start:[python.example_code.sns.Publish_MessageAttributes]
     @staticmethod
-    def publish_message(topic, message, message_id):
+    def publish_message(topic, message, message_id, message_group_id=DEFAULT_MESSAGE_GROUP_ID, attributes=None):
         """
         Publishes a message, with attributes, to a topic. Subscriptions can be filtered
         based on message attributes so that a subscription receives messages only
@@ -216,18 +290,14 @@ class SnsWrapper:
 
         :param topic: The topic to publish to.
         :param message: The message to publish.
-        :param attributes: The key-value attributes to attach to the message. Values
-                           must be either `str` or `bytes`.
+        :param message_id: The deduplication ID of the message.
+        :param message_group_id: The FIFO group of the message. Messages are ordered within their group.
+        :param attributes: Optional message attributes, in the SNS format (see create_message_attributes).
         :return: The ID of the message.
         """
         try:
-            # att_dict = {}
-            # for key, value in attributes.items():
-            #     if isinstance(value, str):
-            #         att_dict[key] = {"DataType": "String", "StringValue": value}
-            #     elif isinstance(value, bytes):
-            #         att_dict[key] = {"DataType": "Binary", "BinaryValue": value}
-            response = topic.publish(Message=message,MessageDeduplicationId=message_id,MessageGroupId="some_id")
+            publish_kwargs = {"MessageAttributes": attributes} if attributes else {}
+            response = topic.publish(Message=message,MessageDeduplicationId=message_id,MessageGroupId=message_group_id,**publish_kwargs)
             message_id = response["MessageId"]
             logger.info(
                 "Published message with attributes %s to topic %s.",
@@ -242,6 +312,58 @@ class SnsWrapper:
 
     # snippet-end:[python.example_code.sns.Publish_MessageAttributes]
 
+    @staticmethod
+    def create_message_attributes(attributes):
+        """
+        Converts a dictionary of string or bytes values into SNS message attributes.
+        """
+        att_dict = {}
+        for key, value in attributes.items():
+            if isinstance(value, str):
+                att_dict[key] = {"DataType": "String", "StringValue": value}
+            elif isinstance(value, bytes):
+                att_dict[key] = {"DataType": "Binary", "BinaryValue": value}
+        return att_dict
+
+    @staticmethod
+    def create_batch_entry(entry_id, message, message_id, message_group_id=DEFAULT_MESSAGE_GROUP_ID, attributes=None):
+        """
+        Creates an entry of a PublishBatch request.
+
+        :param entry_id: The ID of the entry, unique in the batch.
+        :param message: The message to publish.
+        :param message_id: The deduplication ID of the message.
+        :param message_group_id: The FIFO group of the message.
+        :param attributes: Optional message attributes, in the SNS format.
+        :return: The entry.
+        """
+        entry = {"Id": entry_id, "Message": message, "MessageDeduplicationId": message_id, "MessageGroupId": message_group_id}
+        if attributes:
+            entry["MessageAttributes"] = attributes
+        return entry
+
+    def publish_message_batch(self, topic_arn, entries):
+        """
+        Publishes up to 10 messages to a topic in a single request.
+
+        :param topic_arn: The ARN of the topic to publish to.
+        :param entries: The entries of the request (see create_batch_entry).
+        :return: The response, with the Successful (Id, MessageId) and Failed (Id, Code, Message) entries.
+        """
+        try:
+            response = self.sns_resource.meta.client.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+            logger.info(
+                "Published batch of %s messages to topic %s (%s failed).",
+                len(entries),
+                topic_arn,
+                len(response.get("Failed", [])),
+            )
+        except ClientError:
+            logger.exception("Couldn't publish batch to topic %s.", topic_arn)
+            raise
+        else:
+            return response
+
     # snippet-start:[python.example_code.sns.Publish_MessageStructure]
     @staticmethod
     def publish_multi_message(
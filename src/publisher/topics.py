@@ -0,0 +1,116 @@
+import os
+import json
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from .sns_wrapper import SnsWrapper
+
+
+class TopicRegistry(Mapping):
+    """
+    Maps the topic names to their Boto3 Topic resources, resolving (creating) each topic on first use.
+
+    The resolved ARNs are cached in memory and, when cache_location is set, in a JSON file, so a restarted
+    worker doesn't call SNS for topics it already resolved.
+
+    :param topic_names: The names of the topics.
+    :param sns_wrapper_getter: Returns the SNS wrapper. Called only when a topic is used.
+    :param cache_location: Optional path of the ARN cache file.
+    """
+
+    def __init__(self,
+                 topic_names: List[str],
+                 sns_wrapper_getter: Callable[[], SnsWrapper],
+                 cache_location: str | None = None) -> None:
+        self.topic_names = list(topic_names)
+        self.sns_wrapper_getter = sns_wrapper_getter
+        self.cache_location = cache_location
+        self.lock = threading.Lock()
+        self.topic_locks: Dict[str, threading.Lock] = {topic_name: threading.Lock() for topic_name in self.topic_names}
+        self.topic_arns: Dict[str, str] = self.__load_cache__()
+        self.topic_objects = {}
+
+    def __load_cache__(self) -> Dict[str, str]:
+        if self.cache_location is None or not os.path.exists(self.cache_location):
+            return {}
+        try:
+            with open(self.cache_location) as cache_file:
+                cached_arns = json.load(cache_file)
+            return {topic_name: topic_arn for topic_name, topic_arn in cached_arns.items() if topic_name in self.topic_locks}
+        except (OSError, ValueError):
+            logger.warning(f"Failed to load the topics cache {self.cache_location}. Resolving the topics again")
+            return {}
+
+    def __save_cache__(self):
+        if self.cache_location is None:
+            return
+        with self.lock:
+            cached_arns = dict(self.topic_arns)
+        temporary_location = self.cache_location + ".tmp"
+        try:
+            with open(temporary_location, "w") as cache_file:
+                json.dump(cached_arns, cache_file)
+            os.replace(temporary_location, self.cache_location)
+        except OSError:
+            logger.warning(f"Failed to save the topics cache {self.cache_location}")
+
+    def resolve_arn(self, topic_name: str) -> str:
+        if topic_name not in self.topic_locks:
+            raise KeyError(topic_name)
+        topic_arn = self.topic_arns.get(topic_name)
+        if topic_arn is not None:
+            return topic_arn
+        with self.topic_locks[topic_name]:
+            # Another thread may have resolved it while we waited
+            topic_arn = self.topic_arns.get(topic_name)
+            if topic_arn is None:
+                topic_arn = self.sns_wrapper_getter().create_topic_arn(topic_name)
+                with self.lock:
+                    self.topic_arns[topic_name] = topic_arn
+                self.__save_cache__()
+        return topic_arn
+
+    def invalidate(self, topic_name: str):
+        """
+        Forgets the cached ARN of the topic (e.g. after the topic was deleted), so it is resolved again.
+        """
+        with self.lock:
+            self.topic_arns.pop(topic_name, None)
+            self.topic_objects.pop(topic_name, None)
+        self.__save_cache__()
+
+    def warm_up(self, max_workers: int = 8):
+        """
+        Resolves all the topics that are not resolved yet, in parallel.
+        """
+        unresolved_topics = [topic_name for topic_name in self.topic_names if topic_name not in self.topic_arns]
+        if not unresolved_topics:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self.resolve_arn, unresolved_topics))
+        logger.info(f"Resolved {len(unresolved_topics)} topics")
+
+    def __getitem__(self, topic_name: str):
+        topic = self.topic_objects.get(topic_name)
+        if topic is None:
+            topic_arn = self.resolve_arn(topic_name)
+            # Building the resource object doesn't call SNS
+            topic = self.sns_wrapper_getter().sns_resource.Topic(topic_arn)
+            with self.lock:
+                self.topic_objects[topic_name] = topic
+        return topic
+
+    def __contains__(self, topic_name) -> bool:
+        # Mapping's default would resolve the topic
+        return topic_name in self.topic_locks
+
+    def __iter__(self):
+        return iter(self.topic_names)
+
+    def __len__(self) -> int:
+        return len(self.topic_names)
@@ -0,0 +1,74 @@
+import pytest
+import time
+import threading
+
+from concurrency.dispatcher import GroupOrderedDispatcher
+
+def test_ordering_within_group():
+    # Setup
+    dispatcher = GroupOrderedDispatcher(max_workers=4)
+    processed = {"a": [], "b": []}
+    def create_task(group_id, index):
+        def task():
+            time.sleep(0.001*(5-index%5))
+            processed[group_id].append(index)
+        return task
+
+    # RUN
+    for index in range(20):
+        for group_id in processed:
+            dispatcher.submit(group_id, create_task(group_id, index))
+    dispatcher.shutdown(wait=True)
+
+    assert processed["a"] == list(range(20))
+    assert processed["b"] == list(range(20))
+
+def test_groups_run_in_parallel():
+    # Setup
+    dispatcher = GroupOrderedDispatcher(max_workers=4)
+    barrier = threading.Barrier(4, timeout=2)
+
+    # RUN
+    for group_id in range(4):
+        dispatcher.submit(str(group_id), barrier.wait)
+    dispatcher.shutdown(wait=True)
+
+    dispatcher.raise_errors()
+
+def test_failure_cancels_group_tasks():
+    # Setup
+    dispatcher = GroupOrderedDispatcher(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+    cancelled = []
+    def failing_task():
+        started.set()
+        release.wait(2)
+        raise Exception("Check Nack")
+
+    # RUN
+    dispatcher.submit("a", failing_task)
+    started.wait(2)
+    dispatcher.submit("a", lambda: None, cancel_task=lambda: cancelled.append(1))
+    release.set()
+    dispatcher.shutdown(wait=True)
+
+    assert cancelled == [1]
+    assert dispatcher.pending_tasks == 0
+    with pytest.raises(Exception, match="Check Nack"):
+        dispatcher.raise_errors()
+
+def test_backpressure():
+    # Setup
+    dispatcher = GroupOrderedDispatcher(max_workers=1, max_pending_tasks=2)
+    release = threading.Event()
+
+    # RUN
+    dispatcher.submit("a", lambda: release.wait(2))
+    dispatcher.submit("b", lambda: None)
+    saturated = not dispatcher.wait_for_capacity(timeout=0.05)
+    release.set()
+
+    assert saturated
+    assert dispatcher.wait_for_capacity(timeout=2)
+    dispatcher.shutdown(wait=True)
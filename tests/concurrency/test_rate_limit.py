@@ -0,0 +1,100 @@
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from concurrency.rate_limit import TokenBucket, AdaptiveRateLimiter, parse_retry_after
+
+def test_token_bucket_limits_the_rate():
+    # Setup
+    token_bucket = TokenBucket(rate=100, capacity=10)
+
+    # RUN
+    start = time.monotonic()
+    for _ in range(30):
+        token_bucket.acquire()
+    duration = time.monotonic() - start
+
+    # The burst of 10 is immediate, the next 20 take 0.2s
+    assert 0.15 < duration < 1
+
+def test_token_bucket_try_acquire():
+    # Setup
+    token_bucket = TokenBucket(rate=10, capacity=2)
+
+    # RUN
+    results = [token_bucket.try_acquire() for _ in range(3)]
+
+    assert results[:2] == [0, 0]
+    assert 0 < results[2] <= 0.1
+    assert not token_bucket.acquire(timeout=0.01)
+    # A request larger than the capacity waits for a full bucket
+    assert token_bucket.acquire(5, timeout=1)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+def test_throttling_decreases_the_rate_and_pauses():
+    # Setup
+    rate_limiter = AdaptiveRateLimiter("test_throttling", max_rate=100, decrease_cooldown_seconds=10)
+
+    # RUN
+    rate_limiter.on_response(429, "0.2")
+    rate_limiter.on_response(429)
+    start = time.monotonic()
+    with rate_limiter.limit():
+        pass
+    duration = time.monotonic() - start
+
+    # The concurrent throttling responses decrease the rate once
+    assert rate_limiter.rate == 50
+    assert 0.15 < duration < 1
+
+def test_rate_recovers_after_throttling():
+    # Setup
+    rate_limiter = AdaptiveRateLimiter("test_recovery", max_rate=100, min_rate=10, recovery_seconds=0.2, decrease_cooldown_seconds=0)
+
+    # RUN
+    for _ in range(5):
+        rate_limiter.on_response(503)
+    decreased_rate = rate_limiter.rate
+    time.sleep(0.1)
+    rate_limiter.on_response(200)
+    partly_recovered_rate = rate_limiter.rate
+    time.sleep(0.2)
+    rate_limiter.on_response(200)
+
+    assert decreased_rate == 10
+    assert 40 < partly_recovered_rate < 100
+    assert rate_limiter.rate == 100
+
+def test_concurrency_cap():
+    # Setup
+    rate_limiter = AdaptiveRateLimiter("test_concurrency", max_rate=1000, max_concurrency=2)
+    in_flight = []
+    max_in_flight = []
+    lock = threading.Lock()
+    def request():
+        with rate_limiter.limit():
+            with lock:
+                in_flight.append(1)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.pop()
+
+    # RUN
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(max_in_flight) == 2
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 25 < parse_retry_after(format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)) <= 30
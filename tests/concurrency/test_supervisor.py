@@ -0,0 +1,69 @@
+import os
+import time
+import signal
+
+from concurrency.supervisor import WorkerSupervisor
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_crashed_workers_are_restarted_with_backoff(tmp_path):
+    # Setup
+    def crashing_worker(worker_index):
+        with open(tmp_path / f"starts_{worker_index}", "a") as starts_file:
+            starts_file.write(f"{time.monotonic()}\n")
+        os._exit(1)
+    supervisor = WorkerSupervisor(crashing_worker, workers_number=2, restart_backoff_seconds=0.1, stop_timeout_seconds=1)
+
+    # RUN
+    supervisor.start()
+    def started_three_times():
+        supervisor.monitor_once()
+        return all((tmp_path / f"starts_{index}").exists() and len((tmp_path / f"starts_{index}").read_text().split()) >= 3 for index in range(2))
+    restarted = wait_for(started_three_times)
+    supervisor.stop()
+
+    assert restarted
+    starts = [float(start) for start in (tmp_path / "starts_0").read_text().split()]
+    # No delay before the first restart, then 0.1s, 0.2s...
+    assert starts[2] - starts[1] >= 0.1
+    assert supervisor.alive_workers() == []
+
+def test_stop_drains_the_workers(tmp_path):
+    # Setup
+    def draining_worker(worker_index):
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: stopping.append(signal_number))
+        (tmp_path / f"ready_{worker_index}").touch()
+        while not stopping:
+            time.sleep(0.01)
+        (tmp_path / f"drained_{worker_index}").touch()
+    supervisor = WorkerSupervisor(draining_worker, workers_number=2, stop_timeout_seconds=5)
+
+    # RUN
+    supervisor.start()
+    assert wait_for(lambda: all((tmp_path / f"ready_{index}").exists() for index in range(2)))
+    processes = supervisor.alive_workers()
+    supervisor.stop()
+
+    assert all((tmp_path / f"drained_{index}").exists() for index in range(2))
+    assert [process.exitcode for process in processes] == [0, 0]
+
+def test_stuck_workers_are_killed(tmp_path):
+    # Setup
+    def stuck_worker(worker_index):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        (tmp_path / "ready").touch()
+        time.sleep(60)
+    supervisor = WorkerSupervisor(stuck_worker, workers_number=1, stop_timeout_seconds=0.2)
+
+    # RUN
+    supervisor.start()
+    assert wait_for(lambda: (tmp_path / "ready").exists())
+    process = supervisor.alive_workers()[0]
+    supervisor.stop()
+
+    assert process.exitcode == -signal.SIGKILL
@@ -1,3 +1,68 @@
 import sys, os
 
-sys.path.append(os.getcwd() + "/src")
\ No newline at end of file
+sys.path.append(os.getcwd() + "/src")
+
+try:
+    import project_shkedia_models
+except ImportError:
+    # The models package is installed from the private index. Without it, the fields of the models that the
+    # worker uses are stubbed, so the logics (logic.service, db.service) can run against the fake Media DB
+    from datetime import datetime
+    from enum import Enum
+    from types import ModuleType
+    from typing import Any, List
+    from uuid import UUID, uuid4
+    from pydantic import BaseModel, ConfigDict, Field
+
+    class Model(BaseModel):
+        model_config = ConfigDict(extra="allow")
+
+    class SearchResult(Model):
+        results: List[Any] = []
+        total_results_number: int = 0
+
+    class MediaStorage(Model):
+        media_id: UUID | str
+
+    class InsightEngineObjectEnum(str, Enum):
+        InsightEngine = "InsightEngine"
+
+    class InsightEngine(Model):
+        id: UUID | str = Field(default_factory=uuid4)
+        name: str
+
+    class InsightStatusEnum(str, Enum):
+        PENDING = "PENDING"
+        APPROVED = "APPROVED"
+
+    class Insight(Model):
+        id: UUID | str = Field(default_factory=uuid4)
+        insight_engine_id: UUID | str
+        media_id: UUID | str
+        job_id: UUID | str | None = None
+        name: Any = None
+        status: InsightStatusEnum = InsightStatusEnum.PENDING
+
+    class InsightJobStatus(str, Enum):
+        PENDING = "PENDING"
+        DONE = "DONE"
+
+    class InsightJob(Model):
+        id: UUID | str = Field(default_factory=uuid4)
+        insight_engine_id: UUID | str
+        media_id: UUID | str
+        status: InsightJobStatus = InsightJobStatus.PENDING
+        start_time: datetime = Field(default_factory=datetime.now)
+        end_time: datetime | None = None
+
+    project_shkedia_models = ModuleType("project_shkedia_models")
+    for module_name, module_models in (("search", (SearchResult,)),
+                                       ("media", (MediaStorage,)),
+                                       ("insights", (InsightEngineObjectEnum, InsightEngine, InsightStatusEnum, Insight)),
+                                       ("jobs", (InsightJobStatus, InsightJob))):
+        module = ModuleType(f"project_shkedia_models.{module_name}")
+        for model in module_models:
+            setattr(module, model.__name__, model)
+        setattr(project_shkedia_models, module_name, module)
+        sys.modules[module.__name__] = module
+    sys.modules["project_shkedia_models"] = project_shkedia_models
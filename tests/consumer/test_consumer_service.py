@@ -1,34 +1,59 @@
 import pytest
 import time
-import boto3
+import json
+from uuid import uuid4
 
 from unittest.mock import MagicMock
 
 from consumer.service import ConsumerService, SqsMessageBody
 from publisher.sns_wrapper import SnsWrapper
+from consumer.dedup import MessageDeduplicationCache
+from concurrency.dispatcher import GroupOrderedDispatcher
+from fakes.broker import FakeBroker
 
 @pytest.fixture(scope="module")
-def sns_wrapper_fixture():
-    sns_wrapper = SnsWrapper(boto3.resource('sns'))
+def broker_fixture():
+    broker = FakeBroker()
+
+    yield broker
+
+@pytest.fixture(scope="module")
+def sns_wrapper_fixture(broker_fixture):
+    sns_wrapper = SnsWrapper(broker_fixture.sns_resource())
 
     yield sns_wrapper
 
 @pytest.fixture(scope="module")
-def consumer_service_fixture(sns_wrapper_fixture):
-    consumer_service = ConsumerService(queue_name="test_queue",listening_time_seconds=5, sns_wrapper=sns_wrapper_fixture)
+def consumer_service_fixture(broker_fixture, sns_wrapper_fixture):
+    consumer_service = ConsumerService(queue_name="test_queue",listening_time_seconds=5, sns_wrapper=sns_wrapper_fixture,
+                                       sqs_resource=broker_fixture.sqs_resource())
 
     yield consumer_service
 
-def test_queue_bindings(consumer_service_fixture):
+def publish_test_messages(consumer_service, sns_wrapper, messages_number):
+    consumer_service.bind_topics(["test_topic_1.fifo","test_topic_2.fifo"])
+    topics = [sns_wrapper.create_topic("test_topic_1.fifo"), sns_wrapper.create_topic("test_topic_2.fifo")]
+    for i in range(messages_number):
+        sns_wrapper.publish_message(topics[i % 2], f'{{"name": "MediaNumber{i}"}}', str(uuid4()))
+
+def test_queue_bindings(consumer_service_fixture, sns_wrapper_fixture):
 
     # RUN
     consumer_service_fixture.bind_topics(["test_topic_1.fifo","test_topic_2.fifo"])
 
+    topic_arns = [subscription.attributes["TopicArn"] for subscription in sns_wrapper_fixture.list_subscriptions()]
+    consumer_service_fixture.queue.reload()
+    assert len(topic_arns) == 2
+    assert len(consumer_service_fixture.queue.attributes["Policy"]) > 0
+
 def test_queue_unbindings(consumer_service_fixture):
 
     # RUN
     consumer_service_fixture.unbind_topics(["test_topic_1.fifo","test_topic_2.fifo"])
 
+    consumer_service_fixture.queue.reload()
+    assert "Policy" not in consumer_service_fixture.queue.attributes
+
 def test_message_consume(consumer_service_fixture):
     # SETUP
     
@@ -45,8 +70,9 @@ def test_message_consume(consumer_service_fixture):
     if len(messages) == 0:
         assert 5-test_duration>-0.5
 
-def test_messages_listen_nominal_ack(consumer_service_fixture):
+def test_messages_listen_nominal_ack(consumer_service_fixture, sns_wrapper_fixture):
     # Setup
+    publish_test_messages(consumer_service_fixture, sns_wrapper_fixture, 30)
     message_counter = 0
     done = False
     def callback(messages):
@@ -65,16 +91,115 @@ def test_messages_listen_nominal_ack(consumer_service_fixture):
     assert message_counter > 20
     assert done == True
 
-def test_messages_listen_nominal_nack(consumer_service_fixture):
+def test_messages_listen_nominal_nack(consumer_service_fixture, sns_wrapper_fixture):
     # Setup
+    publish_test_messages(consumer_service_fixture, sns_wrapper_fixture, 10)
+    consumer_service_fixture.queue.reload()
+    messages_number = consumer_service_fixture.queue.attributes["ApproximateNumberOfMessages"]
     message_counter = 0
     done = False
     def callback(messages):
         raise Exception("Check Nack")
 
     # Test
+    consumer_service_fixture.callbacks = []
     consumer_service_fixture.add_messages_callback(callback)
     consumer_service_fixture.listen()
 
-    #TODO: Think what to assert
+    # The nacked messages are visible again
+    consumer_service_fixture.queue.reload()
+    assert consumer_service_fixture.queue.attributes["ApproximateNumberOfMessages"] == messages_number
+
+
+def create_sns_envelope(message_id, message):
+    return json.dumps({"Type": "Notification",
+                       "MessageId": message_id,
+                       "SequenceNumber": 1,
+                       "TopicArn": "arn:aws:sns:us-east-1:000000000000:test_topic_1.fifo",
+                       "Message": message,
+                       "Timestamp": "2024-01-01T00:00:00.000Z",
+                       "UnsubscribeURL": "https://sns.us-east-1.amazonaws.com/"})
+
+def test_redelivered_message_is_acked_and_skipped():
+    # Setup
+    broker = FakeBroker()
+    consumer_service = ConsumerService(queue_name="test_dedup_queue", listening_time_seconds=0,
+                                       deduplication_cache=MessageDeduplicationCache(max_size=10),
+                                       sqs_resource=broker.sqs_resource())
+    received_bodies = []
+    consumer_service.add_messages_callback(received_bodies.extend)
+    envelope = create_sns_envelope(str(uuid4()), '{"name": "MediaNumber1"}')
+
+    # RUN
+    consumer_service.queue.send_message(MessageBody=envelope)
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
+    # SNS delivers at least once: the same notification arrives again
+    consumer_service.queue.send_message(MessageBody=envelope)
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
+
+    assert len(received_bodies) == 1
+    assert broker.calls["DeleteMessageBatch"] == 2
+    assert consumer_service.queue.attributes["ApproximateNumberOfMessages"] == "0"
+    assert consumer_service.queue.attributes["ApproximateNumberOfMessagesNotVisible"] == "0"
+
+def test_message_that_failed_to_ack_is_processed_again():
+    # Setup
+    broker = FakeBroker()
+    consumer_service = ConsumerService(queue_name="test_dedup_queue", listening_time_seconds=0, message_ownership_time_seconds=0,
+                                       deduplication_cache=MessageDeduplicationCache(max_size=10),
+                                       sqs_resource=broker.sqs_resource())
+    received_bodies = []
+    consumer_service.add_messages_callback(received_bodies.extend)
+    consumer_service.queue.send_message(MessageBody=create_sns_envelope(str(uuid4()), '{"name": "MediaNumber1"}'))
+
+    # RUN
+    broker.fault_injector.fail_next("DeleteMessageBatch")
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
+
+    assert len(received_bodies) == 2
+    assert received_bodies[0].MessageId == received_bodies[1].MessageId
+
+def test_messages_listen_with_dispatcher():
+    # Setup
+    broker = FakeBroker()
+    broker.sqs_resource().create_queue(QueueName="test_dispatcher_queue.fifo", Attributes={"FifoQueue": "True"})
+    consumer_service = ConsumerService(queue_name="test_dispatcher_queue.fifo", listening_time_seconds=1,
+                                       dispatcher=GroupOrderedDispatcher(max_workers=2),
+                                       sqs_resource=broker.sqs_resource())
+    processed = []
+    def callback(messages_bodies):
+        for message_body in messages_bodies:
+            if message_body.body["group"] == "failing_group":
+                raise Exception("Check Nack")
+            processed.append(message_body.body["index"])
+    consumer_service.add_messages_callback(callback)
+    for index in range(5):
+        for group_id in ["nominal_group", "failing_group"]:
+            consumer_service.queue.send_message(MessageBody=create_sns_envelope(str(uuid4()), json.dumps({"group": group_id, "index": index})),
+                                                MessageGroupId=group_id)
+
+    # RUN
+    consumer_service.listen()
+
+    # The nominal group is processed in order, the failing group is nacked and visible again
+    assert processed == list(range(5))
+    assert consumer_service.queue.attributes["ApproximateNumberOfMessages"] == "5"
+    assert consumer_service.queue.attributes["ApproximateNumberOfMessagesNotVisible"] == "0"
+
+def test_sqs_metrics_are_recorded(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    from consumer.service import sqs_messages, sqs_request_seconds
+    consumer_service = ConsumerService(queue_name="test_metrics_queue", listening_time_seconds=0, sns_wrapper=sns_wrapper_fixture,
+                                       sqs_resource=broker_fixture.sqs_resource())
+    consumer_service.queue.send_message(MessageBody=create_sns_envelope(str(uuid4()), '{"name": "MediaNumber1"}'))
+    received_before = sqs_messages.labels("receive").value
+    acked_before = sqs_messages.labels("ack").value
+    receive_requests_before = sqs_request_seconds.labels("receive").count
+
+    # RUN
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
 
+    assert sqs_messages.labels("receive").value - received_before == 1
+    assert sqs_messages.labels("ack").value - acked_before == 1
+    assert sqs_request_seconds.labels("receive").count - receive_requests_before == 1
@@ -0,0 +1,66 @@
+import pytest
+import time
+from types import SimpleNamespace
+
+from consumer.dedup import MessageDeduplicationCache, SqliteDeduplicationStore
+
+def create_bodies(*message_ids):
+    return [SimpleNamespace(MessageId=message_id, SequenceNumber=index) for index, message_id in enumerate(message_ids)]
+
+def test_drop_processed_messages():
+    # Setup
+    deduplication_cache = MessageDeduplicationCache(max_size=10, ttl_seconds=60)
+
+    # RUN
+    first_batch = deduplication_cache.filter_new(create_bodies("a", "b", "b"))
+    deduplication_cache.mark_processed(first_batch)
+    second_batch = deduplication_cache.filter_new(create_bodies("a", "c"))
+
+    assert [body.MessageId for body in first_batch] == ["a", "b"]
+    assert [body.MessageId for body in second_batch] == ["c"]
+    assert deduplication_cache.hits == 2
+    assert deduplication_cache.hit_rate == pytest.approx(0.4)
+
+def test_unprocessed_messages_are_not_duplicates():
+    # Setup
+    deduplication_cache = MessageDeduplicationCache(max_size=10, ttl_seconds=60)
+
+    # RUN
+    deduplication_cache.filter_new(create_bodies("a"))
+
+    assert not deduplication_cache.is_duplicate(create_bodies("a")[0])
+
+def test_ttl_and_size_eviction():
+    # Setup
+    deduplication_cache = MessageDeduplicationCache(max_size=2, ttl_seconds=0.05)
+
+    # RUN
+    deduplication_cache.mark_processed(create_bodies("a", "b", "c"))
+    assert deduplication_cache.stats()["size"] == 2
+    assert deduplication_cache.is_duplicate(create_bodies("c")[0])
+    assert not deduplication_cache.is_duplicate(create_bodies("a")[0])
+    time.sleep(0.1)
+
+    assert not deduplication_cache.is_duplicate(create_bodies("c")[0])
+
+def test_sequence_number_key():
+    # Setup
+    deduplication_cache = MessageDeduplicationCache(key_field="SequenceNumber")
+
+    # RUN
+    deduplication_cache.mark_processed(create_bodies("a"))
+
+    assert deduplication_cache.is_duplicate(create_bodies("other_id")[0])
+
+def test_persistent_backing_store(tmp_path):
+    # Setup
+    database_location = str(tmp_path / "deduplication.db")
+    deduplication_cache = MessageDeduplicationCache(backing_store=SqliteDeduplicationStore(database_location))
+    deduplication_cache.mark_processed(create_bodies("a"))
+    deduplication_cache.backing_store.close()
+
+    # RUN
+    restarted_cache = MessageDeduplicationCache(backing_store=SqliteDeduplicationStore(database_location))
+
+    assert restarted_cache.is_duplicate(create_bodies("a")[0])
+    assert not restarted_cache.is_duplicate(create_bodies("b")[0])
@@ -0,0 +1,66 @@
+import pytest
+import json
+from datetime import datetime
+from uuid import uuid4
+
+from consumer.messages import SqsMessageBody, LazySqsMessageBody, parse_message_body, topic_name_from_arn
+
+def create_envelope(message, topic_name="test_topic_1.fifo"):
+    return json.dumps({
+        "Type": "Notification",
+        "MessageId": str(uuid4()),
+        "SequenceNumber": "10000000000000012000",
+        "TopicArn": f"arn:aws:sns:eu-west-1:123456789012:{topic_name}",
+        "Message": message,
+        "Timestamp": datetime.now().isoformat(),
+        "UnsubscribeURL": "https://sns.eu-west-1.amazonaws.com/?Action=Unsubscribe",
+    })
+
+def test_parse_message_body_eager():
+    # Setup
+    raw_body = create_envelope(json.dumps({"media_id": "1234", "name": "test"}))
+
+    # RUN
+    message_body = parse_message_body(raw_body)
+
+    assert isinstance(message_body, SqsMessageBody)
+    assert message_body.topic_name == "test_topic_1.fifo"
+    assert message_body.body == {"media_id": "1234", "name": "test"}
+    assert message_body.body is message_body.body
+
+def test_parse_message_body_plain_text():
+    # Setup
+    raw_body = create_envelope("not a json")
+
+    # RUN
+    message_body = parse_message_body(raw_body)
+
+    assert message_body.body == "not a json"
+
+def test_parse_message_body_lazy_validation():
+    # Setup
+    raw_body = json.loads(create_envelope(json.dumps({"media_id": "1234"})))
+    raw_body.pop("UnsubscribeURL")
+
+    # RUN
+    message_body = parse_message_body(json.dumps(raw_body), lazy_validation=True)
+
+    assert isinstance(message_body, LazySqsMessageBody)
+    assert message_body.raw["MessageId"] == raw_body["MessageId"]
+    with pytest.raises(ValueError):
+        message_body.body
+
+def test_lazy_message_body_fields():
+    # Setup
+    raw_body = create_envelope(json.dumps({"media_id": "1234"}), topic_name="test_topic_2.fifo")
+
+    # RUN
+    message_body = parse_message_body(raw_body, lazy_validation=True)
+
+    assert message_body.SequenceNumber == 10000000000000012000
+    assert message_body.topic_name == "test_topic_2.fifo"
+    assert message_body.body["media_id"] == "1234"
+
+def test_topic_name_from_invalid_arn():
+    with pytest.raises(ValueError):
+        topic_name_from_arn("test_topic_1.fifo")
@@ -0,0 +1,101 @@
+import pytest
+import json
+
+from consumer.service import ConsumerService
+from publisher.sns_wrapper import SnsWrapper
+from fakes.broker import FakeBroker
+
+@pytest.fixture
+def broker_fixture():
+    broker = FakeBroker()
+
+    yield broker
+
+@pytest.fixture
+def consumer_service_fixture(broker_fixture):
+    consumer_service = ConsumerService(queue_name="test_queue", listening_time_seconds=1,
+                                       sns_wrapper=SnsWrapper(broker_fixture.sns_resource()),
+                                       sqs_resource=broker_fixture.sqs_resource())
+
+    yield consumer_service
+
+def policy_topic_names(consumer_service):
+    consumer_service.queue.reload()
+    policy = consumer_service.queue.attributes.get("Policy")
+    if not policy:
+        return set()
+    return {statement["Condition"]["ArnLike"]["aws:SourceArn"].rsplit(":", 1)[-1] for statement in json.loads(policy)["Statement"]}
+
+def subscribed_topic_names(broker):
+    return {subscription["TopicArn"].rsplit(":", 1)[-1] for subscription in broker.subscriptions.values()}
+
+def test_reconcile_topics_single_policy_write(consumer_service_fixture, broker_fixture):
+    # Setup
+    topic_names = [f"test_topic_{i}.fifo" for i in range(20)]
+    broker_fixture.calls.clear()
+
+    # RUN
+    result = consumer_service_fixture.reconcile_topics(topic_names)
+
+    assert len(result["subscribed"]) == 20
+    assert result["policy_updated"]
+    assert broker_fixture.calls["SetQueueAttributes"] == 1
+    assert broker_fixture.calls["GetQueueAttributes"] == 1
+    assert broker_fixture.calls["ListSubscriptions"] == 0
+    assert subscribed_topic_names(broker_fixture) == set(topic_names)
+    assert policy_topic_names(consumer_service_fixture) == set(topic_names)
+
+def test_reconcile_topics_prune(consumer_service_fixture, broker_fixture):
+    # Setup
+    consumer_service_fixture.reconcile_topics(["test_topic_1.fifo", "test_topic_2.fifo", "test_topic_3.fifo"])
+
+    # RUN
+    result = consumer_service_fixture.reconcile_topics(["test_topic_2.fifo", "test_topic_4.fifo"])
+    unchanged_result = consumer_service_fixture.reconcile_topics(["test_topic_2.fifo", "test_topic_4.fifo"])
+
+    assert len(result["subscribed"]) == 1
+    assert len(result["unsubscribed"]) == 2
+    assert subscribed_topic_names(broker_fixture) == {"test_topic_2.fifo", "test_topic_4.fifo"}
+    assert policy_topic_names(consumer_service_fixture) == {"test_topic_2.fifo", "test_topic_4.fifo"}
+    assert unchanged_result == {"subscribed": [], "unsubscribed": [], "policy_updated": False}
+
+def test_bind_keeps_and_unbind_removes_topics(consumer_service_fixture, broker_fixture):
+    # RUN
+    consumer_service_fixture.bind_topics(["test_topic_1.fifo"])
+    consumer_service_fixture.bind_topics(["test_topic_2.fifo"])
+    bound_topics = policy_topic_names(consumer_service_fixture)
+    consumer_service_fixture.unbind_topics(["test_topic_1.fifo", "test_topic_2.fifo"])
+
+    assert bound_topics == {"test_topic_1.fifo", "test_topic_2.fifo"}
+    assert policy_topic_names(consumer_service_fixture) == set()
+    assert subscribed_topic_names(broker_fixture) == set()
+
+def test_reconcile_reads_the_current_policy(consumer_service_fixture, broker_fixture):
+    # Setup
+    consumer_service_fixture.reconcile_topics(["test_topic_1.fifo"])
+    other_consumer_service = ConsumerService(queue_name="test_queue", listening_time_seconds=1,
+                                             sns_wrapper=SnsWrapper(broker_fixture.sns_resource()),
+                                             sqs_resource=broker_fixture.sqs_resource())
+    other_consumer_service.reconcile_topics(["test_topic_2.fifo"])
+
+    # RUN
+    result = consumer_service_fixture.reconcile_topics(["test_topic_3.fifo"])
+
+    # The topic bound by the other instance is found through the policy, and pruned
+    assert sorted(topic_arn.rsplit(":", 1)[-1] for topic_arn in result["unsubscribed"]) == ["test_topic_2.fifo"]
+    assert subscribed_topic_names(broker_fixture) == {"test_topic_3.fifo"}
+    assert policy_topic_names(consumer_service_fixture) == {"test_topic_3.fifo"}
+
+def test_subscriptions_listed_per_topic(consumer_service_fixture, broker_fixture):
+    # Setup
+    other_queue_arn = broker_fixture.sqs_resource().create_queue(QueueName="other_queue").attributes["QueueArn"]
+    sns_wrapper = SnsWrapper(broker_fixture.sns_resource())
+    for i in range(10):
+        sns_wrapper.subscribe_arn(sns_wrapper.create_topic_arn(f"other_topic_{i}.fifo"), "sqs", other_queue_arn)
+    broker_fixture.calls.clear()
+
+    # RUN
+    consumer_service_fixture.reconcile_topics(["test_topic_1.fifo", "test_topic_2.fifo"])
+
+    assert broker_fixture.calls["ListSubscriptions"] == 0
+    assert broker_fixture.calls["ListSubscriptionsByTopic"] == 2
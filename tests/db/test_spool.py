@@ -0,0 +1,130 @@
+import pytest
+from uuid import uuid4, UUID
+
+from pydantic import BaseModel, Field
+
+from db.spool import SqliteWriteSpool, SpooledMediaDBWriter, INSIGHTS_KIND, JOBS_KIND
+
+class SpooledInsight(BaseModel):
+    id: UUID = Field(default_factory=uuid4)
+    job_id: str
+    name: str
+
+class SpooledJob(BaseModel):
+    id: str
+    status: str
+
+class FakeMediaDB:
+    def __init__(self) -> None:
+        self.available = True
+        self.requests = []
+
+    def put_insights_json(self, json):
+        return self.__request__(INSIGHTS_KIND, json)
+
+    def update_jobs_json(self, json):
+        return self.__request__(JOBS_KIND, json)
+
+    def __request__(self, kind, json):
+        if not self.available:
+            raise ConnectionError("Media DB is down")
+        self.requests.append((kind, json))
+        return len(json)
+
+@pytest.fixture
+def spool_fixture(tmp_path):
+    spool = SqliteWriteSpool(str(tmp_path / "spool.db"))
+
+    yield spool
+
+    spool.close()
+
+def test_writes_are_spooled_during_outage(spool_fixture):
+    # Setup
+    media_db = FakeMediaDB()
+    acked_tags = []
+    writer = SpooledMediaDBWriter(media_db, spool_fixture, on_ack=lambda entries: acked_tags.extend(entry.tag for entry in entries))
+    media_db.available = False
+
+    # RUN
+    assert writer.put_insights([SpooledInsight(job_id="1", name="2024-01")], tag="batch_1") == 0
+    assert writer.update_jobs([SpooledJob(id="1", status="DONE")]) == 0
+
+    assert spool_fixture.pending_count() == 2
+    assert writer.pending_job_ids == {"1"}
+    assert not writer.available
+    # Not retried before the retry interval passed
+    writer.put_insights([SpooledInsight(job_id="2", name="2024-02")], tag="batch_2")
+    assert media_db.requests == []
+    assert acked_tags == []
+
+    media_db.available = True
+    acked_entries = writer.replay(force=True)
+
+    assert len(acked_entries) == 3
+    assert acked_tags == ["batch_1", None, "batch_2"]
+    assert [kind for kind, _ in media_db.requests] == [INSIGHTS_KIND, JOBS_KIND, INSIGHTS_KIND]
+    assert spool_fixture.pending_count() == 0
+    assert writer.pending_job_ids == set()
+
+def test_replay_merges_consecutive_writes(spool_fixture):
+    # Setup
+    media_db = FakeMediaDB()
+    writer = SpooledMediaDBWriter(media_db, spool_fixture, max_request_items=5)
+    media_db.available = False
+    for i in range(4):
+        writer.put_insights([SpooledInsight(job_id=str(i), name="a"), SpooledInsight(job_id=str(i), name="b")])
+    writer.update_jobs([SpooledJob(id=str(i), status="DONE") for i in range(4)])
+
+    # RUN
+    media_db.available = True
+    writer.replay(force=True)
+
+    assert [(kind, len(items)) for kind, items in media_db.requests] == [(INSIGHTS_KIND, 4), (INSIGHTS_KIND, 4), (JOBS_KIND, 4)]
+
+def test_compact_keeps_the_last_job_status(spool_fixture):
+    # Setup
+    spool_fixture.append(JOBS_KIND, [{"id": "1", "status": "RUNNING"}, {"id": "2", "status": "DONE"}])
+    insights_sequence = spool_fixture.append(INSIGHTS_KIND, [{"job_id": "1"}], tag="batch_1")
+    spool_fixture.append(JOBS_KIND, [{"id": "1", "status": "DONE"}])
+
+    # RUN
+    assert spool_fixture.compact() == 1
+
+    pending_entries = spool_fixture.pending()
+    assert [entry.sequence for entry in pending_entries][0] == insights_sequence
+    assert sorted(pending_entries[1].items, key=lambda job: job["id"]) == [{"id": "1", "status": "DONE"}, {"id": "2", "status": "DONE"}]
+
+def test_spool_survives_restart(tmp_path):
+    # Setup
+    database_location = str(tmp_path / "spool.db")
+    media_db = FakeMediaDB()
+    media_db.available = False
+    spool = SqliteWriteSpool(database_location)
+    SpooledMediaDBWriter(media_db, spool).update_jobs([SpooledJob(id="1", status="DONE")])
+    spool.close()
+
+    # RUN
+    restarted_spool = SqliteWriteSpool(database_location)
+    writer = SpooledMediaDBWriter(media_db, restarted_spool)
+
+    assert writer.pending_job_ids == {"1"}
+    media_db.available = True
+    assert len(writer.replay()) == 1
+    assert media_db.requests == [(JOBS_KIND, [{"id": "1", "status": "DONE"}])]
+    restarted_spool.close()
+
+def test_replay_stops_at_first_failure(spool_fixture):
+    # Setup
+    media_db = FakeMediaDB()
+    writer = SpooledMediaDBWriter(media_db, spool_fixture)
+    spool_fixture.append(INSIGHTS_KIND, [{"job_id": "1"}])
+    spool_fixture.append(JOBS_KIND, [{"id": "1", "status": "DONE"}])
+    media_db.update_jobs_json = lambda json: None
+
+    # RUN
+    acked_entries = writer.replay()
+
+    assert [entry.kind for entry in acked_entries] == [INSIGHTS_KIND]
+    assert [entry.kind for entry in spool_fixture.pending()] == [JOBS_KIND]
+    assert not writer.available
@@ -0,0 +1,123 @@
+import pytest
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from fakes.broker import FakeBroker, FaultInjector
+
+@pytest.fixture
+def broker_fixture():
+    broker = FakeBroker()
+
+    yield broker
+
+def bind_queue(broker, queue, topic):
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow",
+                                                                          "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+
+def test_delivery_requires_queue_policy(broker_fixture):
+    # Setup
+    sns, sqs = broker_fixture.sns_resource(), broker_fixture.sqs_resource()
+    topic = sns.create_topic(Name="test_topic.fifo", Attributes={"FifoTopic": "True", "ContentBasedDeduplication": "True"})
+    queue = sqs.create_queue(QueueName="test_queue")
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+
+    # RUN
+    topic.publish(Message="dropped", MessageGroupId="a")
+    bind_queue(broker_fixture, queue, topic)
+    topic.publish(Message="delivered", MessageGroupId="a")
+    topic.publish(Message="delivered", MessageGroupId="a")
+    messages = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0)
+
+    assert len(messages) == 1
+    assert json.loads(messages[0].body)["Message"] == "delivered"
+    assert json.loads(messages[0].body)["SequenceNumber"]
+
+def test_fifo_group_locking_and_visibility(broker_fixture):
+    # Setup
+    sqs = broker_fixture.sqs_resource()
+    queue = sqs.create_queue(QueueName="test_queue.fifo", Attributes={"FifoQueue": "True", "VisibilityTimeout": "60"})
+    for index in range(3):
+        queue.send_message(MessageBody=f"a{index}", MessageGroupId="a")
+    queue.send_message(MessageBody="b0", MessageGroupId="b")
+
+    # RUN
+    first_batch = queue.receive_messages(MaxNumberOfMessages=2, WaitTimeSeconds=0, AttributeNames=["MessageGroupId"])
+    second_batch = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0)
+    queue.change_message_visibility_batch(Entries=[{"Id": str(ind), "ReceiptHandle": message.receipt_handle, "VisibilityTimeout": 0}
+                                                   for ind, message in enumerate(first_batch)])
+    third_batch = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0)
+    response = queue.delete_messages(Entries=[{"Id": str(ind), "ReceiptHandle": message.receipt_handle}
+                                              for ind, message in enumerate(first_batch + third_batch)])
+
+    assert [message.body for message in first_batch] == ["a0", "a1"]
+    assert first_batch[0].attributes == {"MessageGroupId": "a"}
+    assert [message.body for message in second_batch] == ["b0"]
+    assert [message.body for message in third_batch] == ["a0", "a1", "a2"]
+    assert len(response["Successful"]) == 3
+    assert len(response["Failed"]) == 2
+
+def test_long_polling(broker_fixture):
+    # Setup
+    queue = broker_fixture.sqs_resource().create_queue(QueueName="test_queue")
+
+    # RUN
+    test_start = time.perf_counter()
+    messages = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0.2)
+    test_duration = time.perf_counter() - test_start
+
+    assert messages == []
+    assert test_duration >= 0.2
+
+def test_batch_limit(broker_fixture):
+    # Setup
+    queue = broker_fixture.sqs_resource().create_queue(QueueName="test_queue")
+
+    # RUN
+    with pytest.raises(ClientError):
+        queue.delete_messages(Entries=[{"Id": str(ind), "ReceiptHandle": "handle"} for ind in range(11)])
+
+def test_fault_injection():
+    # Setup
+    fault_injector = FaultInjector(latency_seconds={"CreateQueue": 0.05})
+    broker = FakeBroker(fault_injector=fault_injector)
+    fault_injector.fail_next("CreateQueue", error_code="ThrottlingException")
+
+    # RUN
+    with pytest.raises(ClientError) as error:
+        broker.sqs_resource().create_queue(QueueName="test_queue")
+    test_start = time.perf_counter()
+    broker.sqs_resource().create_queue(QueueName="test_queue")
+    test_duration = time.perf_counter() - test_start
+
+    assert error.value.response["Error"]["Code"] == "ThrottlingException"
+    assert test_duration >= 0.05
+    assert broker.calls["CreateQueue"] == 2
+
+def test_queue_attributes_cached_until_reload(broker_fixture):
+    # Setup
+    queue = broker_fixture.sqs_resource().create_queue(QueueName="test_queue")
+
+    # RUN
+    attributes_before = queue.attributes
+    queue.send_message(MessageBody="message")
+    cached_attributes = queue.attributes
+    queue.reload()
+
+    assert attributes_before["ApproximateNumberOfMessages"] == "0"
+    assert cached_attributes["ApproximateNumberOfMessages"] == "0"
+    assert queue.attributes["ApproximateNumberOfMessages"] == "1"
+    assert broker_fixture.calls["GetQueueAttributes"] == 2
+
+def test_calls_counted_from_threads(broker_fixture):
+    # Setup
+    queue = broker_fixture.sqs_resource().create_queue(QueueName="test_queue")
+
+    # RUN
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: queue.reload(), range(2000)))
+
+    assert broker_fixture.calls["GetQueueAttributes"] == 2000
@@ -0,0 +1,82 @@
+import pytest
+from collections import Counter
+from uuid import uuid4, UUID
+
+from pydantic import BaseModel, Field
+
+from fakes.dataset import generate_dataset, MmapDataset, NO_JOB, PENDING_JOB, DONE_JOB
+from fakes.media_db import DatasetMediaDBService
+
+class DatasetJob(BaseModel):
+    id: UUID = Field(default_factory=uuid4)
+    media_id: str
+    status: str = "PENDING"
+
+@pytest.fixture
+def dataset_fixture(tmp_path):
+    location = str(tmp_path / "library.bin")
+    generate_dataset(location, 2000, users_number=100, user_skew=1.2, missing_metadata_rate=0.1,
+                     pending_jobs_rate=0.1, done_jobs_rate=0.5, random_seed=7, chunk_size=300)
+    dataset = MmapDataset(location, insight_engine_id="engine_1")
+
+    yield dataset
+
+    dataset.close()
+
+def test_records_follow_the_distributions(dataset_fixture):
+    # RUN
+    media_records = list(dataset_fixture.iter_media_records())
+    job_statuses = dataset_fixture.job_statuses()
+
+    assert len(media_records) == len(dataset_fixture) == 2000
+    assert 100 < sum(1 for media_record in media_records if media_record["created_on"] is None) < 300
+    owners = Counter(media_record["owner_id"] for media_record in media_records)
+    # Uniform owners would give the top 10 users 10% of the media
+    assert sum(count for _, count in owners.most_common(10)) > 0.4 * len(media_records)
+    assert 100 < job_statuses.count(PENDING_JOB) < 300
+    assert job_statuses.count(NO_JOB) + job_statuses.count(PENDING_JOB) + job_statuses.count(DONE_JOB) == 2000
+
+def test_records_are_found_by_id(dataset_fixture):
+    # RUN
+    media_record = dataset_fixture.media_record(1234)
+
+    assert dataset_fixture.media_index(media_record["media_id"]) == 1234
+    assert dataset_fixture.job_index(dataset_fixture.job_id(1234)) == 1234
+    assert dataset_fixture.media_index(dataset_fixture.job_id(1234)) is None
+    assert dataset_fixture.media_index(str(uuid4())) is None
+    with pytest.raises(IndexError):
+        dataset_fixture.media_record(2000)
+
+def test_truncated_dataset_is_rejected(tmp_path):
+    # Setup
+    location = str(tmp_path / "library.bin")
+    generate_dataset(location, 10, random_seed=1)
+    with open(location, "r+b") as dataset_file:
+        dataset_file.truncate(100)
+
+    # RUN
+    with pytest.raises(ValueError):
+        MmapDataset(location)
+
+def test_media_db_over_dataset(dataset_fixture):
+    # Setup
+    media_db = DatasetMediaDBService(engine={"id": "engine_1", "name": "months"}, dataset=dataset_fixture, default_batch_size=50)
+    job_statuses = dataset_fixture.job_statuses()
+    media_without_jobs_number = job_statuses.count(NO_JOB)
+    backlog_number = job_statuses.count(PENDING_JOB)
+
+    # RUN
+    media_to_analyze = media_db.get_media_to_analyze("months")
+    media_db.put_jobs([DatasetJob(media_id=media_record["media_id"]) for media_record in media_to_analyze.results])
+    processed_number = 0
+    while True:
+        pending_jobs = media_db.get_pending_jobs("engine_1")
+        if not pending_jobs.results:
+            break
+        media_ids = [job["media_id"] for job in pending_jobs.results]
+        assert len(media_db.get_media_by_ids(media_ids).results) == len(media_ids)
+        processed_number += media_db.update_jobs_json([dict(job, status="DONE") for job in pending_jobs.results])
+
+    assert len(media_to_analyze.results) == 50
+    assert media_db.get_media_to_analyze("months").total_results_number == media_without_jobs_number - 50
+    assert processed_number == backlog_number + 50
@@ -0,0 +1,51 @@
+import pytest
+from uuid import uuid4, UUID
+
+from pydantic import BaseModel, Field
+
+from fakes.broker import FaultInjector
+from fakes.media_db import FakeMediaDBService
+
+class FakeJob(BaseModel):
+    id: UUID = Field(default_factory=uuid4)
+    media_id: str
+    status: str = "PENDING"
+
+@pytest.fixture
+def media_db_fixture():
+    media_db = FakeMediaDBService(engine={"id": "engine_1", "name": "months"},
+                                  media_records=[{"media_id": f"media_{i}", "name": f"image_{i}.jpg"} for i in range(5)],
+                                  default_batch_size=2)
+
+    yield media_db
+
+def test_jobs_lifecycle(media_db_fixture):
+    # RUN
+    media_to_analyze = media_db_fixture.get_media_to_analyze("months")
+    job_list = [FakeJob(media_id=media_record["media_id"]) for media_record in media_to_analyze.results]
+    media_db_fixture.put_jobs(job_list)
+    pending_jobs = media_db_fixture.get_pending_jobs("engine_1", batch_size=10)
+
+    assert [media_record["media_id"] for media_record in media_to_analyze.results] == ["media_0", "media_1"]
+    assert media_db_fixture.get_media_to_analyze("months").total_results_number == 3
+    assert [job["media_id"] for job in pending_jobs.results] == ["media_0", "media_1"]
+
+    media_db_fixture.update_jobs([job.model_copy(update={"status": "DONE"}) for job in job_list[:1]])
+
+    assert [job["media_id"] for job in media_db_fixture.get_pending_jobs("engine_1").results] == ["media_1"]
+    assert media_db_fixture.search_engine("months").results == [{"id": "engine_1", "name": "months"}]
+    assert media_db_fixture.get_media_by_ids(["media_4", "missing"]).results == [{"media_id": "media_4", "name": "image_4.jpg"}]
+
+def test_outage_raises_connection_error(media_db_fixture):
+    # Setup
+    media_db_fixture.fault_injector = FaultInjector()
+    media_db_fixture.fault_injector.fail_next("put_insights")
+
+    # RUN
+    with pytest.raises(ConnectionError):
+        media_db_fixture.put_insights_json([{"name": "2024-01"}])
+    media_db_fixture.available = False
+    with pytest.raises(ConnectionError):
+        media_db_fixture.get_pending_jobs("engine_1")
+
+    assert media_db_fixture.insights == []
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+from project_shkedia_models import insights
+from fakes.media_db import FakeMediaDBService
+from logic.backfill import BackfillCheckpoint, BackfillRunner, MediaIdsFileSource, MediaSearchSource
+from logic.records import MediaRecord
+from logic.service import MonthsEngineLogics
+
+MEDIA_NUMBER = 25
+
+class RecordingEngineLogics:
+    """
+    Stands in for MonthsEngineLogics: records the processed media, and fails on a media ID.
+    """
+    def __init__(self, media_db_service, failing_media_id=None) -> None:
+        self.media_db_service = media_db_service
+        self.failing_media_id = failing_media_id
+        self.processed_media_ids = []
+        self.chunks_sizes = []
+
+    def fetch_media(self, media_ids):
+        media_to_process = self.media_db_service.get_media_by_ids(media_ids_list=list(media_ids))
+        return {media_record.media_id: media_record for media_record in map(MediaRecord.from_dict, media_to_process.results)}
+
+    def process_media(self, media_records, executor=None):
+        media_ids = [media_record.media_id for media_record in media_records]
+        if self.failing_media_id in media_ids:
+            raise ConnectionError("Media DB is unavailable")
+        self.chunks_sizes.append(len(media_ids))
+        self.processed_media_ids += media_ids
+        return len(media_ids)
+
+class RejectingMediaDB(FakeMediaDBService):
+    """
+    Rejects the insights writes (a non 200 response) of the media IDs in rejected_media_ids.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.rejected_media_ids = set()
+
+    def put_insights_json(self, json):
+        if any(insight["media_id"] in self.rejected_media_ids for insight in json):
+            return None
+        return super().put_insights_json(json)
+
+class LabelingEngineLogics(MonthsEngineLogics):
+    def __extract_insights_logics__(self, job_id, media_item):
+        return [insights.Insight(insight_engine_id=self.engine.id, media_id=media_item.media_id, name=media_item.name, job_id=job_id)]
+
+@pytest.fixture
+def media_db_fixture():
+    return FakeMediaDBService(engine={"name": "months"},
+                              media_records=[{"media_id": f"media_{i:02d}", "owner_id": f"user_{i % 2}", "name": f"IMG_{i}.jpg",
+                                              "created_on": f"2024-01-{i + 1:02d}T00:00:00"} for i in range(MEDIA_NUMBER)])
+
+def test_backfill_resumes_from_the_checkpoint(media_db_fixture, tmp_path):
+    # Setup
+    media_ids_location = tmp_path / "media_ids.txt"
+    media_ids_location.write_text("\n".join(["media_00", "", "unknown_media"] + [f"media_{i:02d}" for i in range(1, MEDIA_NUMBER)]))
+    source = MediaIdsFileSource(str(media_ids_location))
+    checkpoint = BackfillCheckpoint(str(tmp_path / "backfill.json"))
+    failing_logics = RecordingEngineLogics(media_db_fixture, failing_media_id="media_15")
+
+    # RUN
+    with pytest.raises(ConnectionError):
+        BackfillRunner(failing_logics, source, checkpoint, chunk_size=5).run()
+    resumed_logics = RecordingEngineLogics(media_db_fixture)
+    processed_number = BackfillRunner(resumed_logics, source, checkpoint, chunk_size=5).run()
+
+    assert failing_logics.processed_media_ids == [f"media_{i:02d}" for i in range(14)]
+    assert resumed_logics.processed_media_ids == [f"media_{i:02d}" for i in range(14, MEDIA_NUMBER)]
+    assert processed_number == MEDIA_NUMBER
+    with pytest.raises(ValueError):
+        checkpoint.load("file:/another/backfill.txt")
+
+def test_backfill_of_a_search(media_db_fixture):
+    # Setup
+    source = MediaSearchSource(media_db_fixture, owner_id="user_1", created_after="2024-01-05", page_size=4)
+    engine_logics = RecordingEngineLogics(media_db_fixture)
+
+    # RUN
+    items = list(source.items(after_cursor=2))
+    processed_number = BackfillRunner(engine_logics, source, chunk_size=3, max_media_per_second=1000).run()
+
+    expected_media_ids = [f"media_{i:02d}" for i in range(5, MEDIA_NUMBER, 2)]
+    assert [media_item["media_id"] for _, media_item in items] == expected_media_ids[3:]
+    assert [cursor for cursor, _ in items] == list(range(3, len(expected_media_ids)))
+    assert engine_logics.processed_media_ids == expected_media_ids
+    assert processed_number == len(expected_media_ids)
+    assert engine_logics.chunks_sizes == [3, 3, 3, 1]
+
+def test_rejected_chunk_is_not_checkpointed(tmp_path):
+    # Setup
+    media_db_service = RejectingMediaDB(engine={"id": "engine_1", "name": "months"},
+                                        media_records=[{"media_id": f"media_{i:02d}", "name": f"IMG_{i}.jpg"} for i in range(6)])
+    media_db_service.rejected_media_ids = {"media_04"}
+    media_ids_location = tmp_path / "media_ids.txt"
+    media_ids_location.write_text("\n".join(f"media_{i:02d}" for i in range(6)))
+    source = MediaIdsFileSource(str(media_ids_location))
+    checkpoint = BackfillCheckpoint(str(tmp_path / "backfill.json"))
+    engine_logics = LabelingEngineLogics(media_db_service, SimpleNamespace(name="months"))
+
+    # RUN
+    with pytest.raises(RuntimeError):
+        BackfillRunner(engine_logics, source, checkpoint, chunk_size=3).run()
+    failed_progress = checkpoint.load(source.description())
+    failed_jobs_media_ids = sorted(job["media_id"] for job in media_db_service.jobs.values())
+    media_db_service.rejected_media_ids = set()
+    processed_number = BackfillRunner(engine_logics, source, checkpoint, chunk_size=3).run()
+
+    assert failed_progress == {"source": source.description(), "cursor": 2, "processed": 3}
+    assert failed_jobs_media_ids == ["media_00", "media_01", "media_02"]
+    assert processed_number == 6
+    assert sorted(insight["media_id"] for insight in media_db_service.insights) == [f"media_{i:02d}" for i in range(6)]
+    assert len(media_db_service.jobs) == 6
@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from project_shkedia_models import insights
+from db.spool import SqliteWriteSpool
+from fakes.media_db import FakeMediaDBService, FakeSearchResult
+from logic.multi_engine import MultiEngineLogics
+from logic.records import JobRecord
+from logic.service import MonthsEngineLogics
+from publisher.outbox import SqliteOutbox
+
+class CountingMediaDB(FakeMediaDBService):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.requested_media_ids = []
+
+    def get_media_by_ids(self, media_ids_list):
+        self.requested_media_ids.append(list(media_ids_list))
+        return super().get_media_by_ids(media_ids_list)
+
+class EnginesMediaDB(FakeMediaDBService):
+    """
+    Hosts several engines, and rejects the insights writes (a non 200 response) while reject_insights is set.
+    """
+    def __init__(self, engines_names, *args, **kwargs) -> None:
+        super().__init__({"name": None}, *args, **kwargs)
+        self.engines = {engine_name: {"id": str(uuid4()), "name": engine_name} for engine_name in engines_names}
+        self.reject_insights = False
+
+    def search_engine(self, engine_name, batch_size=None):
+        results = [self.engines[engine_name]] if engine_name in self.engines else []
+        return FakeSearchResult(results, len(results))
+
+    def put_insights_json(self, json):
+        if self.reject_insights:
+            return None
+        return super().put_insights_json(json)
+
+class LabelingEngineLogics(MonthsEngineLogics):
+    def __extract_insights_logics__(self, job_id, media_item):
+        return [insights.Insight(insight_engine_id=self.engine.id, media_id=media_item.media_id, name=media_item.name, job_id=job_id)]
+
+class RecordingEngineLogics:
+    """
+    Stands in for MonthsEngineLogics: the engine's pending jobs are one per media ID.
+    """
+    def __init__(self, name: str, media_ids, fail: bool = False) -> None:
+        self.engine_details = SimpleNamespace(name=name)
+        self.media_ids = list(media_ids)
+        self.fail = fail
+        self.batch_sizes = []
+        self.completed = []
+
+    def prepare_batch(self, batch_size=None):
+        if self.fail:
+            raise ConnectionError("Media DB is unavailable")
+        self.batch_sizes.append(batch_size)
+        return [JobRecord.from_dict({"id": f"{self.engine_details.name}_{media_id}", "media_id": media_id})
+                for media_id in self.media_ids[:batch_size]]
+
+    def schedule_batch(self, jobs_to_process, media_by_id, batch_size=None):
+        return jobs_to_process
+
+    def complete_batch(self, jobs_to_process, media_by_id):
+        self.completed += [(job.job_id, media_by_id[job.media_id].name) for job in jobs_to_process]
+        return len(jobs_to_process)
+
+@pytest.fixture
+def media_db_fixture():
+    return CountingMediaDB(engine={"name": "months"},
+                           media_records=[{"media_id": f"media_{i}", "name": f"IMG_{i}.jpg"} for i in range(10)])
+
+def test_media_are_fetched_once_for_all_engines(media_db_fixture):
+    # Setup
+    months_logics = RecordingEngineLogics("months", ["media_1", "media_2", "media_3"])
+    faces_logics = RecordingEngineLogics("faces", ["media_2", "media_3", "media_4"])
+    multi_engine_logics = MultiEngineLogics(media_db_fixture, [months_logics, faces_logics], batch_process_size=6)
+
+    # RUN
+    processed_number = multi_engine_logics.process_batch()
+
+    assert processed_number == 6
+    assert media_db_fixture.requested_media_ids == [["media_1", "media_2", "media_3", "media_4"]]
+    assert months_logics.completed == [("months_media_1", "IMG_1.jpg"), ("months_media_2", "IMG_2.jpg"), ("months_media_3", "IMG_3.jpg")]
+    assert faces_logics.completed == [("faces_media_2", "IMG_2.jpg"), ("faces_media_3", "IMG_3.jpg"), ("faces_media_4", "IMG_4.jpg")]
+
+def test_batch_is_shared_by_weights(media_db_fixture):
+    # Setup
+    months_logics = RecordingEngineLogics("months", [f"media_{i}" for i in range(10)])
+    faces_logics = RecordingEngineLogics("faces", [f"media_{i}" for i in range(10)])
+    multi_engine_logics = MultiEngineLogics(media_db_fixture, [months_logics, faces_logics], weights={"months": 3}, batch_process_size=8)
+
+    # RUN
+    processed_number = multi_engine_logics.process_batch()
+
+    assert multi_engine_logics.batch_sizes() == {"months": 6, "faces": 2}
+    assert processed_number == 8
+    assert len(months_logics.completed) == 6 and len(faces_logics.completed) == 2
+    with pytest.raises(ValueError):
+        MultiEngineLogics(media_db_fixture, [months_logics], weights={"months": 0})
+
+def test_failing_engine_does_not_stop_the_others(media_db_fixture):
+    # Setup
+    months_logics = RecordingEngineLogics("months", ["media_1"])
+    faces_logics = RecordingEngineLogics("faces", ["media_1"], fail=True)
+    multi_engine_logics = MultiEngineLogics(media_db_fixture, [faces_logics, months_logics])
+
+    # RUN
+    processed_number = multi_engine_logics.process_batch()
+
+    assert processed_number == 1
+    assert months_logics.completed == [("months_media_1", "IMG_1.jpg")]
+
+def test_engines_recover_only_their_outbox_batches(tmp_path):
+    # Setup
+    media_db_service = EnginesMediaDB(["months", "faces"], media_records=[{"media_id": f"media_{i}", "name": f"IMG_{i}.jpg"} for i in range(3)])
+    outbox = SqliteOutbox(str(tmp_path / "outbox.db"))
+    months_logics, faces_logics = [LabelingEngineLogics(media_db_service, SimpleNamespace(name=engine_name), outbox=outbox, insights_topic_id="insights_topic.fifo",
+                                                        write_spool=SqliteWriteSpool(str(tmp_path / f"spool.{engine_name}.db")))
+                                   for engine_name in ("months", "faces")]
+    faces_logics.db_writer.retry_interval_seconds = 0
+    jobs_to_process = faces_logics.prepare_batch()
+    media_by_id = faces_logics.fetch_media(job.media_id for job in jobs_to_process)
+
+    # RUN
+    # The faces insights are spooled (and their events staged) during an outage
+    media_db_service.available = False
+    faces_logics.complete_batch(jobs_to_process, media_by_id)
+    media_db_service.available = True
+    # The months engine recovers the outbox while the insights writes are rejected
+    media_db_service.reject_insights = True
+    months_logics.prepare_batch()
+    media_db_service.reject_insights = False
+    faces_logics.prepare_batch()
+
+    assert len(media_db_service.insights) == 3
+    assert len(outbox.fetch_ready(10)) == 3
+    outbox.close()
@@ -0,0 +1,42 @@
+import copy
+import pickle
+from datetime import datetime
+from enum import Enum
+
+import pytest
+
+from logic.records import JobRecord, MediaRecord
+
+class JobStatus(Enum):
+    DONE = "DONE"
+
+def test_job_record_round_trip():
+    # Setup
+    item = {"id": "job_1", "media_id": "media_1", "insight_engine_id": "engine_1", "status": "PENDING",
+            "start_time": "2024-01-01T00:00:00", "end_time": None}
+
+    # RUN
+    job_record = JobRecord.from_dict(item)
+    job_record.status = JobStatus.DONE
+    job_record.end_time = datetime(2024, 1, 2, 3, 4, 5)
+
+    assert job_record.job_id == "job_1"
+    assert job_record.to_json() == {"id": "job_1", "media_id": "media_1", "insight_engine_id": "engine_1", "status": "DONE",
+                                    "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-02T03:04:05"}
+    assert item["status"] == "PENDING"
+
+def test_media_record_reads_item_fields():
+    # Setup
+    item = {"media_id": "media_1", "name": "IMG_1.jpg", "owner_id": "user_1"}
+
+    # RUN
+    media_record = MediaRecord.from_dict(item)
+
+    assert media_record.media_id == "media_1"
+    assert media_record.name == "IMG_1.jpg"
+    assert media_record.created_on is None
+    assert media_record.owner_id == "user_1"
+    with pytest.raises(AttributeError):
+        media_record.width
+    assert copy.copy(media_record).owner_id == "user_1"
+    assert pickle.loads(pickle.dumps(media_record)).media_id == "media_1"
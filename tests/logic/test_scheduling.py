@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fakes.media_db import FakeMediaDBService
+from logic.scheduling import PriorityScheduler, FRESH_UPLOAD, REQUESTED_REPROCESS, BACKFILL, priority_queue_seconds
+
+NOW = datetime.now(timezone.utc)
+
+def create_media(media_id: str, owner_id: str, age: timedelta) -> dict:
+    return {"media_id": media_id, "owner_id": owner_id, "created_on": (NOW - age).isoformat()}
+
+@pytest.fixture
+def media_db_fixture():
+    # A bulk import of old photos by one user, ahead of the fresh uploads of two others
+    media_records = [create_media(f"import_{i}", "importer", timedelta(days=3000)) for i in range(50)]
+    media_records += [create_media(f"fresh_{user}_{i}", user, timedelta(minutes=5)) for user in ("alice", "bob") for i in range(5)]
+    return FakeMediaDBService(engine={"name": "months"}, media_records=media_records)
+
+def test_fresh_uploads_go_first(media_db_fixture):
+    # Setup
+    scheduler = PriorityScheduler(weights={FRESH_UPLOAD: 4, BACKFILL: 1}, lookahead=10)
+
+    # RUN
+    window = media_db_fixture.get_media_to_analyze("months", batch_size=scheduler.window_size(6)).results
+    batch = scheduler.select(window, 6, lambda media_item: media_item, "media_without_jobs")
+
+    media_ids = [media_item["media_id"] for media_item in batch]
+    # 4 fresh for each backfill item, alternating between the users
+    assert sum(media_id.startswith("fresh") for media_id in media_ids) == 5
+    assert sum(media_id.startswith("import") for media_id in media_ids) == 1
+    assert [media_id.split("_")[1] for media_id in media_ids if media_id.startswith("fresh")] == ["alice", "bob", "alice", "bob", "alice"]
+
+def test_backfill_is_not_starved():
+    # Setup
+    scheduler = PriorityScheduler(weights={FRESH_UPLOAD: 3, BACKFILL: 1})
+    window = [create_media(f"fresh_{i}", "alice", timedelta(minutes=1)) for i in range(30)]
+    window += [create_media(f"old_{i}", "bob", timedelta(days=400)) for i in range(30)]
+
+    # RUN
+    batch = scheduler.select(window, 20, lambda media_item: media_item, "media_without_jobs")
+
+    assert sum(media_item["media_id"].startswith("old") for media_item in batch) == 5
+    assert len(batch) == 20
+
+def test_reprocess_requests():
+    # Setup
+    scheduler = PriorityScheduler()
+    media_item = create_media("media_1", "alice", timedelta(days=400))
+    job_created_time = (NOW - timedelta(minutes=10)).replace(tzinfo=None).isoformat()
+
+    # RUN
+    scheduler.request_reprocessing(["media_1"])
+    requested_class = scheduler.classify(media_item)
+    processed_class = scheduler.job_processed(media_item, job_created_time)
+
+    assert requested_class == processed_class == REQUESTED_REPROCESS
+    assert scheduler.classify(media_item) == BACKFILL
+    assert priority_queue_seconds.labels(REQUESTED_REPROCESS).count >= 1
+    with pytest.raises(ValueError):
+        PriorityScheduler(weights={"urgent": 1})
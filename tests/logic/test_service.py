@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from project_shkedia_models import insights, jobs
+from db.spool import SqliteWriteSpool
+from fakes.media_db import FakeMediaDBService
+from logic.records import MediaRecord
+from logic.scheduling import PriorityScheduler, FRESH_UPLOAD
+from logic.service import MonthsEngineLogics
+from logic.sharding import ShardFilter
+from publisher.outbox import SqliteOutbox, OutboxEvent
+
+ENGINE_ID = str(uuid4())
+INSIGHTS_TOPIC = "insights_topic.fifo"
+
+class LabelingEngineLogics(MonthsEngineLogics):
+    """
+    MonthsEngineLogics with an extraction: the insight of a media is its name.
+    """
+    def __extract_insights_logics__(self, job_id, media_item: MediaRecord):
+        return [insights.Insight(insight_engine_id=self.engine.id,
+                                 media_id=media_item.media_id,
+                                 name=media_item.name,
+                                 job_id=job_id,
+                                 status=insights.InsightStatusEnum.APPROVED)]
+
+def create_media(media_id: str, owner_id: str = "owner", age: timedelta = timedelta(days=1000)) -> dict:
+    return {"media_id": media_id, "name": f"{media_id}.jpg", "owner_id": owner_id, "created_on": (datetime.now(timezone.utc) - age).isoformat()}
+
+def create_logics(media_db_service, **kwargs) -> LabelingEngineLogics:
+    return LabelingEngineLogics(media_db_service=media_db_service,
+                                engine_details=SimpleNamespace(name="months"),
+                                **dict({"batch_process_size": 100}, **kwargs))
+
+def inserted_names(media_db_service):
+    return sorted(insight["name"] for insight in media_db_service.insights)
+
+@pytest.fixture
+def media_db_fixture():
+    return FakeMediaDBService(engine={"id": ENGINE_ID, "name": "months"},
+                              media_records=[create_media(f"media_{i}") for i in range(5)])
+
+@pytest.fixture
+def outbox_fixture(tmp_path):
+    outbox = SqliteOutbox(str(tmp_path / "outbox.db"))
+
+    yield outbox
+
+    outbox.close()
+
+def test_batch_creates_and_processes_jobs(media_db_fixture):
+    # Setup
+    engine_logics = create_logics(media_db_fixture)
+
+    # RUN
+    processed_number = engine_logics.process_batch()
+    next_processed_number = engine_logics.process_batch()
+
+    assert processed_number == 5 and next_processed_number == 0
+    assert inserted_names(media_db_fixture) == [f"media_{i}.jpg" for i in range(5)]
+    assert {job["status"] for job in media_db_fixture.jobs.values()} == {jobs.InsightJobStatus.DONE.value}
+    assert len(media_db_fixture.jobs) == 5 and not media_db_fixture.pending_jobs
+    assert {insight["job_id"] for insight in media_db_fixture.insights} == set(media_db_fixture.jobs)
+
+def test_events_are_ready_after_the_insights_write(media_db_fixture, outbox_fixture):
+    # Setup
+    engine_logics = create_logics(media_db_fixture, outbox=outbox_fixture, insights_topic_id=INSIGHTS_TOPIC)
+
+    # RUN
+    engine_logics.process_batch()
+
+    ready_events = outbox_fixture.fetch_ready(10)
+    assert sorted(event.event_id for event in ready_events) == sorted(insight["id"] for insight in media_db_fixture.insights)
+    assert {event.topic_id for event in ready_events} == {INSIGHTS_TOPIC}
+    assert outbox_fixture.staged_batches() == {}
+
+def test_staged_batch_is_recovered(media_db_fixture, outbox_fixture):
+    # Setup
+    engine_logics = create_logics(media_db_fixture, outbox=outbox_fixture, insights_topic_id=INSIGHTS_TOPIC)
+    # The worker stopped between staging the events and the write
+    insight = insights.Insight(insight_engine_id=ENGINE_ID, media_id="media_0", name="media_0.jpg", job_id=str(uuid4()))
+    outbox_fixture.stage([OutboxEvent(event_id=str(insight.id), topic_id=INSIGHTS_TOPIC, payload=insight.model_dump_json(), grouping_key="media_0")])
+
+    # RUN
+    engine_logics.prepare_batch()
+
+    assert str(insight.id) in {inserted_insight["id"] for inserted_insight in media_db_fixture.insights}
+    assert [event.event_id for event in outbox_fixture.fetch_ready(10)] == [str(insight.id)]
+    assert outbox_fixture.staged_batches() == {}
+
+def test_spooled_writes_are_replayed_after_an_outage(media_db_fixture, outbox_fixture, tmp_path):
+    # Setup
+    engine_logics = create_logics(media_db_fixture, outbox=outbox_fixture, insights_topic_id=INSIGHTS_TOPIC,
+                                  write_spool=SqliteWriteSpool(str(tmp_path / "spool.db")))
+    engine_logics.db_writer.retry_interval_seconds = 0
+    jobs_to_process = engine_logics.prepare_batch()
+    media_by_id = engine_logics.fetch_media(job.media_id for job in jobs_to_process)
+
+    # RUN
+    media_db_fixture.available = False
+    processed_number = engine_logics.complete_batch(jobs_to_process, media_by_id)
+    outage_insights = list(media_db_fixture.insights)
+    outage_ready_events = outbox_fixture.fetch_ready(10)
+    media_db_fixture.available = True
+    next_jobs = engine_logics.prepare_batch()
+
+    assert processed_number == 5
+    assert outage_insights == [] and outage_ready_events == []
+    assert inserted_names(media_db_fixture) == [f"media_{i}.jpg" for i in range(5)]
+    assert len(outbox_fixture.fetch_ready(10)) == 5
+    assert next_jobs == [] and not media_db_fixture.pending_jobs
+    assert engine_logics.db_writer.spool.pending_count() == 0
+
+def test_shards_split_the_media():
+    # Setup
+    media_db_service = FakeMediaDBService(engine={"id": ENGINE_ID, "name": "months"},
+                                          media_records=[create_media(f"media_{i}") for i in range(40)])
+    shards_logics = [create_logics(media_db_service, shard_filter=ShardFilter(shard_index, 2)) for shard_index in range(2)]
+
+    # RUN
+    shards_media = []
+    for engine_logics in shards_logics:
+        inserted_number = len(media_db_service.insights)
+        engine_logics.process_batch()
+        shards_media.append({insight["media_id"] for insight in media_db_service.insights[inserted_number:]})
+
+    assert len(media_db_service.insights) == 40 and set.union(*shards_media) == set(media_db_service.media)
+    for engine_logics, shard_media in zip(shards_logics, shards_media):
+        assert shard_media and all(engine_logics.shard_filter.owns(media_id) for media_id in shard_media)
+
+def test_fresh_uploads_behind_a_backlog_are_scheduled_first():
+    # Setup
+    # A historical import: old pending jobs, and more old media without jobs ahead of the fresh uploads
+    media_records = [create_media(f"import_{i}", "importer") for i in range(200)]
+    media_records += [create_media(f"fresh_{i}", "alice", timedelta(minutes=5)) for i in range(3)]
+    media_db_service = FakeMediaDBService(engine={"id": ENGINE_ID, "name": "months"}, media_records=media_records)
+    media_db_service.put_jobs([jobs.InsightJob(insight_engine_id=ENGINE_ID, media_id=f"import_{i}", start_time=datetime.now() - timedelta(days=30))
+                               for i in range(100)])
+    engine_logics = create_logics(media_db_service, batch_process_size=4,
+                                  scheduler=PriorityScheduler(weights={FRESH_UPLOAD: 10}, lookahead=2))
+
+    # RUN
+    processed_number = engine_logics.process_batch()
+
+    assert processed_number == 4
+    assert sum(name.startswith("fresh") for name in inserted_names(media_db_service)) == 3
+
+def test_process_media_writes_done_jobs(media_db_fixture):
+    # Setup
+    engine_logics = create_logics(media_db_fixture)
+    media_records = list(engine_logics.fetch_media(["media_0", "media_1", "media_2"]).values())
+
+    # RUN
+    processed_number = engine_logics.process_media(media_records)
+
+    assert processed_number == 3
+    assert inserted_names(media_db_fixture) == ["media_0.jpg", "media_1.jpg", "media_2.jpg"]
+    assert len(media_db_fixture.jobs) == 3 and not media_db_fixture.pending_jobs
+    assert {job["status"] for job in media_db_fixture.jobs.values()} == {jobs.InsightJobStatus.DONE.value}
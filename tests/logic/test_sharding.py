@@ -0,0 +1,72 @@
+import pytest
+
+from fakes.media_db import FakeMediaDBService
+from logic.sharding import ConsistentHashRing, ShardFilter, shard_index_from_hostname, shard_backlog
+
+MEDIA_NUMBER = 2000
+
+@pytest.fixture
+def media_db_fixture():
+    return FakeMediaDBService(engine={"name": "months"},
+                              media_records=[{"media_id": f"media_{i}", "name": f"IMG_{i}.jpg"} for i in range(MEDIA_NUMBER)])
+
+def test_shards_split_the_media_between_replicas(media_db_fixture):
+    # Setup
+    shard_filters = [ShardFilter(shard_index, 4) for shard_index in range(4)]
+
+    # RUN
+    search_result = media_db_fixture.get_media_to_analyze("months", batch_size=MEDIA_NUMBER)
+    shards_items = [shard_filter.filter(search_result.results, "media_without_jobs", search_result.total_results_number)
+                    for shard_filter in shard_filters]
+
+    shards_media_ids = [{item["media_id"] for item in items} for items in shards_items]
+    assert sum(len(media_ids) for media_ids in shards_media_ids) == MEDIA_NUMBER
+    assert set().union(*shards_media_ids) == set(media_db_fixture.media)
+    for media_ids in shards_media_ids:
+        assert MEDIA_NUMBER / 4 * 0.7 < len(media_ids) < MEDIA_NUMBER / 4 * 1.3
+    assert shard_backlog.labels("0", "media_without_jobs").value == len(shards_media_ids[0])
+
+def test_adding_a_shard_moves_few_media():
+    # Setup
+    media_ids = [f"media_{i}" for i in range(MEDIA_NUMBER)]
+    four_shards, five_shards = ConsistentHashRing(4), ConsistentHashRing(5)
+
+    # RUN
+    moved_number = sum(four_shards.shard_of(media_id) != five_shards.shard_of(media_id) for media_id in media_ids)
+
+    # About 1/5 move to the new shard, none move between the old shards
+    assert moved_number < MEDIA_NUMBER * 0.3
+    assert all(five_shards.shard_of(media_id) in (four_shards.shard_of(media_id), 4) for media_id in media_ids)
+
+def test_rebalance_calls_the_hooks():
+    # Setup
+    shard_filter = ShardFilter(1, 2)
+    rebalances = []
+    shard_filter.add_rebalance_hook(lambda previous_shard, shard: rebalances.append((previous_shard, shard)))
+
+    # RUN
+    shard_filter.rebalance(1, 2)
+    shard_filter.rebalance(3, 4)
+
+    assert rebalances == [((1, 2), (3, 4))]
+    assert shard_filter.page_size(100) == 400
+    with pytest.raises(ValueError):
+        shard_filter.rebalance(4, 4)
+
+def test_page_size_is_capped(media_db_fixture):
+    # Setup
+    shard_filter = ShardFilter(0, 64, max_page_size=500)
+
+    # RUN
+    page = media_db_fixture.get_media_to_analyze("months", shard_filter.page_size(100)).results
+    media_items = shard_filter.filter(page, "media_without_jobs")
+
+    assert len(page) == 500
+    assert 0 < len(media_items) < 100
+    assert shard_filter.page_size(1000) == 1000
+    assert ShardFilter(0, 64, max_page_size=None).page_size(100) == 6400
+
+def test_shard_index_from_hostname():
+    assert shard_index_from_hostname("months-worker-3") == 3
+    with pytest.raises(ValueError):
+        shard_index_from_hostname("months-worker")
@@ -0,0 +1,70 @@
+import pytest
+import requests
+
+from metrics.registry import MetricsRegistry
+from metrics.server import MetricsServer
+
+@pytest.fixture
+def registry_fixture():
+    registry = MetricsRegistry()
+
+    yield registry
+
+def test_counter_and_gauge_render(registry_fixture):
+    # Setup
+    requests_counter = registry_fixture.counter("test_requests_total", "Test requests", ("operation",))
+    queue_gauge = registry_fixture.gauge("test_queue_size", "Test queue size")
+
+    # RUN
+    requests_counter.labels("receive").inc(3)
+    requests_counter.labels("ack").inc()
+    queue_gauge.set(7)
+
+    rendered = registry_fixture.render()
+    assert "# TYPE test_requests_total counter" in rendered
+    assert 'test_requests_total{operation="receive"} 3' in rendered
+    assert 'test_requests_total{operation="ack"} 1' in rendered
+    assert "test_queue_size 7" in rendered
+
+def test_histogram_buckets_are_cumulative(registry_fixture):
+    # Setup
+    latency = registry_fixture.histogram("test_latency_seconds", "Test latency", buckets=(0.1, 1.0))
+
+    # RUN
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value)
+
+    rendered = registry_fixture.render()
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in rendered
+    assert 'test_latency_seconds_bucket{le="1"} 3' in rendered
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in rendered
+    assert "test_latency_seconds_count 4" in rendered
+    assert "test_latency_seconds_sum 5.65" in rendered
+
+def test_metrics_are_declared_once(registry_fixture):
+    # RUN
+    counter = registry_fixture.counter("test_total", "Test")
+
+    assert registry_fixture.counter("test_total", "Test") is counter
+    with pytest.raises(ValueError):
+        registry_fixture.gauge("test_total", "Test")
+    with pytest.raises(ValueError):
+        registry_fixture.counter("test_labeled_total", "Test", ("operation",)).labels("a", "b")
+
+def test_server_serves_metrics(registry_fixture):
+    # Setup
+    registry_fixture.counter("test_served_total", "Test").inc()
+    metrics_server = MetricsServer(0, host="127.0.0.1", registry=registry_fixture)
+    metrics_server.start()
+
+    # RUN
+    try:
+        response = requests.get(f"http://127.0.0.1:{metrics_server.port}/metrics", timeout=5)
+        missing_response = requests.get(f"http://127.0.0.1:{metrics_server.port}/other", timeout=5)
+    finally:
+        metrics_server.close()
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "test_served_total 1" in response.text
+    assert missing_response.status_code == 404
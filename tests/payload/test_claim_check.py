@@ -0,0 +1,154 @@
+import os
+import time
+import pytest
+import json
+import random
+import string
+from uuid import uuid4
+from types import SimpleNamespace
+from pydantic import BaseModel
+
+from payload.claim_check import PayloadCodec, LocalBlobStore, register_blob_store, blob_stores, decode_payload, PAYLOAD_MARKER
+from consumer.messages import parse_messages
+from consumer.service import ConsumerService
+from publisher.service import PublisherService
+from fakes.broker import FakeBroker
+
+class InsightsMessageClass(BaseModel):
+    media_id: str
+    insights: list
+
+def create_payload(size):
+    return json.dumps({"data": "a"*size})
+
+@pytest.fixture
+def unregistered_blob_store_fixture(tmp_path):
+    blob_store = LocalBlobStore(str(tmp_path / "payloads"), ttl_seconds=60)
+
+    yield blob_store
+
+    blob_stores.clear()
+
+@pytest.fixture
+def blob_store_fixture(tmp_path):
+    blob_store = LocalBlobStore(str(tmp_path / "payloads"))
+    register_blob_store(blob_store)
+
+    yield blob_store
+
+    blob_stores.clear()
+
+def test_small_payload_unchanged():
+    # Setup
+    payload_codec = PayloadCodec(compression_threshold_bytes=100)
+
+    # RUN
+    encoded_payload = payload_codec.encode(create_payload(10))
+
+    assert encoded_payload == create_payload(10)
+
+def test_compressed_payload():
+    # Setup
+    payload_codec = PayloadCodec(compression_threshold_bytes=100)
+
+    # RUN
+    encoded_payload = payload_codec.encode(create_payload(10000))
+
+    assert len(encoded_payload) < 1000
+    assert decode_payload(json.loads(encoded_payload)) == create_payload(10000)
+
+def test_offloaded_payload(blob_store_fixture):
+    # Setup
+    payload_codec = PayloadCodec(compression_threshold_bytes=100, offload_threshold_bytes=1000, blob_store=blob_store_fixture)
+    random_payload = json.dumps({"data": "".join(random.choices(string.ascii_letters, k=5000))})
+
+    # RUN
+    encoded_payload = json.loads(payload_codec.encode(random_payload))
+
+    assert encoded_payload[PAYLOAD_MARKER] == "claim-check"
+    assert decode_payload(encoded_payload) == random_payload
+
+def test_blob_outside_store_is_rejected(blob_store_fixture):
+    # RUN
+    with pytest.raises(ValueError):
+        decode_payload({PAYLOAD_MARKER: "claim-check", "uri": "file:///etc/passwd"})
+
+def test_consumer_resolves_offloaded_payload(blob_store_fixture):
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource(),
+                                         payload_codec=PayloadCodec(compression_threshold_bytes=100, offload_threshold_bytes=1000, blob_store=blob_store_fixture))
+    queue = broker.sqs_resource().create_queue(QueueName="test_queue")
+    topic = publisher_service.topics["test_topic_1.fifo"]
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+    message = InsightsMessageClass(media_id=str(uuid4()), insights=["".join(random.choices(string.ascii_letters, k=10)) for _ in range(1000)])
+
+    # RUN
+    publisher_service.publish("test_topic_1.fifo", message, message.media_id)
+    messages_bodies = parse_messages(queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0))
+
+    assert len(messages_bodies[0].Message) < 1000
+    assert messages_bodies[0].body == message.model_dump()
+
+def test_codec_registers_its_store(unregistered_blob_store_fixture):
+    # Setup
+    payload_codec = PayloadCodec(compression_threshold_bytes=100, offload_threshold_bytes=1000, blob_store=unregistered_blob_store_fixture)
+    random_payload = json.dumps({"data": "".join(random.choices(string.ascii_letters, k=5000))})
+
+    # RUN
+    encoded_payload = json.loads(payload_codec.encode(random_payload))
+    PayloadCodec(blob_store=unregistered_blob_store_fixture)
+
+    assert decode_payload(encoded_payload) == random_payload
+    assert blob_stores["file"] == [unregistered_blob_store_fixture]
+
+def test_expired_blobs_are_deleted(unregistered_blob_store_fixture):
+    # Setup
+    uri = unregistered_blob_store_fixture.put(b"payload")
+
+    # RUN
+    fresh_deleted = unregistered_blob_store_fixture.delete_expired()
+    expired_deleted = unregistered_blob_store_fixture.delete_expired(now=time.time()+120)
+
+    assert fresh_deleted == 0
+    assert expired_deleted == 1
+    assert os.listdir(unregistered_blob_store_fixture.root_directory) == []
+
+def test_consumer_deletes_consumed_payload(unregistered_blob_store_fixture):
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource(),
+                                         payload_codec=PayloadCodec(compression_threshold_bytes=100, offload_threshold_bytes=1000, blob_store=unregistered_blob_store_fixture))
+    consumer_service = ConsumerService(queue_name="test_queue", listening_time_seconds=0, sqs_resource=broker.sqs_resource(),
+                                       delete_offloaded_payloads=True)
+    topic = publisher_service.topics["test_topic_1.fifo"]
+    topic.subscribe(Protocol="sqs", Endpoint=consumer_service.queue.attributes["QueueArn"])
+    consumer_service.queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+    received_bodies = []
+    consumer_service.add_messages_callback(lambda messages_bodies: received_bodies.extend(message_body.body for message_body in messages_bodies))
+    message = InsightsMessageClass(media_id=str(uuid4()), insights=["".join(random.choices(string.ascii_letters, k=10)) for _ in range(1000)])
+
+    # RUN
+    publisher_service.publish("test_topic_1.fifo", message, message.media_id)
+    stored_blobs = os.listdir(unregistered_blob_store_fixture.root_directory)
+    consumer_service.__process_messages__(consumer_service.__receive_messages__())
+
+    assert len(stored_blobs) == 1
+    assert received_bodies == [message.model_dump()]
+    assert os.listdir(unregistered_blob_store_fixture.root_directory) == []
+
+def test_only_offloaded_payloads_are_deleted(blob_store_fixture, caplog):
+    # Setup
+    payload_codec = PayloadCodec(compression_threshold_bytes=100, offload_threshold_bytes=1000, blob_store=blob_store_fixture)
+    offloaded_message = payload_codec.encode(json.dumps({"data": "".join(random.choices(string.ascii_letters, k=5000))}))
+    consumer_service = ConsumerService(queue_name="test_queue", delete_offloaded_payloads=True)
+    messages_bodies = [SimpleNamespace(MessageId=str(index), Message=message)
+                       for index, message in enumerate(["plain text", "\x82\xa8media_id", payload_codec.encode(create_payload(10000)), offloaded_message])]
+
+    # RUN
+    consumer_service.__delete_payloads__(messages_bodies)
+    consumer_service.__delete_payloads__([SimpleNamespace(MessageId="4", Message='{"__payload__": "claim-check", "uri": "file:///outside/blob"}')])
+
+    assert os.listdir(blob_store_fixture.root_directory) == []
+    assert [record.message for record in caplog.records if record.levelname == "WARNING"] == ["Failed to delete the offloaded payload of message 4"]
@@ -0,0 +1,88 @@
+import pytest
+import json
+from datetime import datetime
+from uuid import uuid4
+from pydantic import BaseModel
+
+from payload.codecs import codec_registry, JSON_CODEC, ORJSON_CODEC, MSGPACK_CODEC, CONTENT_TYPE_ATTRIBUTE
+from payload.claim_check import PayloadCodec
+from consumer.messages import parse_messages
+from publisher.service import PublisherService
+from fakes.broker import FakeBroker
+
+class CodecMessageClass(BaseModel):
+    media_id: str
+    created: datetime
+    scores: list
+
+def create_message():
+    return CodecMessageClass(media_id=str(uuid4()), created=datetime(2024, 1, 1, 12, 30), scores=[1, 2.5, 3])
+
+def create_bound_publisher(broker, **publisher_kwargs):
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource(), **publisher_kwargs)
+    queue = broker.sqs_resource().create_queue(QueueName="test_queue")
+    topic = publisher_service.topics["test_topic_1.fifo"]
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+    return publisher_service, queue
+
+@pytest.mark.parametrize("codec_name", [JSON_CODEC, ORJSON_CODEC, MSGPACK_CODEC])
+def test_codec_round_trip(codec_name):
+    # Setup
+    codec = codec_registry.get(codec_name)
+    message = create_message()
+
+    # RUN
+    payload = codec.encode(message)
+
+    assert isinstance(payload, str)
+    assert codec.decode(payload) == message.model_dump(mode="json")
+    assert codec.decode_model(payload, CodecMessageClass) == message
+
+def test_unknown_codec():
+    # RUN
+    with pytest.raises(ValueError):
+        codec_registry.get("xml")
+
+@pytest.mark.parametrize("lazy_validation", [False, True])
+def test_consumer_negotiates_codec(lazy_validation):
+    # Setup
+    broker = FakeBroker()
+    publisher_service, queue = create_bound_publisher(broker, message_codec=MSGPACK_CODEC)
+    message = create_message()
+
+    # RUN
+    publisher_service.publish("test_topic_1.fifo", message, message.media_id)
+    messages_bodies = parse_messages(queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0), lazy_validation=lazy_validation)
+
+    assert messages_bodies[0].MessageAttributes[CONTENT_TYPE_ATTRIBUTE]["Value"] == MSGPACK_CODEC
+    assert messages_bodies[0].body == message.model_dump(mode="json")
+    assert messages_bodies[0].body_as(CodecMessageClass) == message
+
+def test_codec_with_compression_and_batching():
+    # Setup
+    broker = FakeBroker()
+    publisher_service, queue = create_bound_publisher(broker, message_codec=ORJSON_CODEC, batch_linger_seconds=0.01,
+                                                      payload_codec=PayloadCodec(compression_threshold_bytes=10))
+    message = create_message()
+
+    # RUN
+    publisher_service.publish_batched("test_topic_1.fifo", message, message.media_id).result(timeout=2)
+    publisher_service.close()
+    messages_bodies = parse_messages(queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0))
+
+    assert messages_bodies[0].Message.startswith('{"__payload__"')
+    assert messages_bodies[0].body_as(CodecMessageClass) == message
+
+def test_default_codec_sends_no_attribute():
+    # Setup
+    broker = FakeBroker()
+    publisher_service, queue = create_bound_publisher(broker)
+    message = create_message()
+
+    # RUN
+    publisher_service.publish("test_topic_1.fifo", message, message.media_id)
+    messages_bodies = parse_messages(queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0))
+
+    assert messages_bodies[0].MessageAttributes is None
+    assert messages_bodies[0].body == json.loads(message.model_dump_json())
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import signal
+import threading
+
+from profiling.profiler import SamplingProfiler, WorkerProfiler
+from profiling.timers import StageTimers, get_stage_timers, stage_timers_snapshot
+
+def busy_wait(seconds):
+    end_time = time.perf_counter() + seconds
+    while time.perf_counter() < end_time:
+        pass
+
+def test_stage_timers_measure_wall_and_cpu():
+    # Setup
+    timers = StageTimers("test_loop")
+
+    # RUN
+    with timers.stage("busy"):
+        busy_wait(0.05)
+    with timers.stage("idle"):
+        time.sleep(0.05)
+    with timers.stage("idle"):
+        time.sleep(0.01)
+
+    snapshot = timers.snapshot()
+    assert snapshot["busy"]["calls"] == 1
+    assert snapshot["busy"]["cpu_seconds"] > 0.03
+    assert snapshot["idle"]["calls"] == 2
+    assert snapshot["idle"]["wall_seconds"] >= 0.06
+    assert snapshot["idle"]["cpu_seconds"] < 0.03
+
+def test_concurrent_measurements_of_a_stage():
+    # Setup
+    timers = StageTimers("test_concurrent_loop")
+    first_started = threading.Event()
+    second_done = threading.Event()
+    def first_measurement():
+        with timers.stage("process"):
+            time.sleep(0.2)
+            first_started.set()
+            second_done.wait()
+    def second_measurement():
+        first_started.wait()
+        with timers.stage("process"):
+            time.sleep(0.05)
+        second_done.set()
+    threads = [threading.Thread(target=first_measurement), threading.Thread(target=second_measurement)]
+
+    # RUN
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = timers.snapshot()
+    assert snapshot["process"]["calls"] == 2
+    assert snapshot["process"]["wall_seconds"] >= 0.3
+
+def test_shared_stage_timers_are_in_the_snapshot():
+    # RUN
+    timers = get_stage_timers("test_shared_loop")
+    with timers.stage("receive"):
+        pass
+
+    assert get_stage_timers("test_shared_loop") is timers
+    assert stage_timers_snapshot()["test_shared_loop"]["receive"]["calls"] >= 1
+
+def test_sampling_profiler_samples_other_threads():
+    # Setup
+    sampling_profiler = SamplingProfiler(interval_seconds=0.005)
+    busy_thread = threading.Thread(target=busy_wait, args=(0.3,), name="busy-thread")
+
+    # RUN
+    sampling_profiler.start()
+    busy_thread.start()
+    busy_thread.join()
+    sampling_profiler.stop()
+
+    stacks = sampling_profiler.take_stacks()
+    assert any(stack.startswith("busy-thread;") and stack.endswith("busy_wait") for stack in stacks)
+    assert not any("sampling-profiler" in stack for stack in stacks)
+    assert sampling_profiler.take_stacks() == {}
+
+def test_profiler_writes_snapshots(tmp_path):
+    # Setup
+    output_directory = str(tmp_path / "profiling")
+    profiler = WorkerProfiler(output_directory, sampling_interval_seconds=0.005, snapshot_period_seconds=60, top_allocations=5)
+    get_stage_timers("test_profiled_loop").stage("extract").__enter__().__exit__(None, None, None)
+
+    # RUN
+    profiler.start()
+    allocations = [bytearray(1024) for _ in range(1000)]
+    busy_wait(0.1)
+    profiler.stop()
+
+    written_files = sorted(os.listdir(output_directory))
+    assert len(written_files) == 3
+    assert any(file_name.endswith("-stacks.folded") for file_name in written_files)
+    tracemalloc_file = [file_name for file_name in written_files if file_name.endswith("-tracemalloc.txt")][0]
+    with open(os.path.join(output_directory, tracemalloc_file)) as dump:
+        assert len(dump.readlines()) == 6
+    stages_file = [file_name for file_name in written_files if file_name.endswith("-stages.json")][0]
+    with open(os.path.join(output_directory, stages_file)) as dump:
+        assert "extract" in json.load(dump)["test_profiled_loop"]
+    assert not profiler.running
+    del allocations
+
+def test_signal_toggles_profiler(tmp_path):
+    # Setup
+    profiler = WorkerProfiler(str(tmp_path), sampling_interval_seconds=0.005, top_allocations=0)
+    previous_handler = signal.getsignal(signal.SIGUSR1)
+    profiler.install_signal_handler("SIGUSR1")
+
+    # RUN
+    try:
+        os.kill(os.getpid(), signal.SIGUSR1)
+        for _ in range(100):
+            if profiler.running:
+                break
+            time.sleep(0.01)
+        assert profiler.running
+        os.kill(os.getpid(), signal.SIGUSR1)
+        for _ in range(100):
+            if not profiler.running and len(os.listdir(tmp_path)) == 2:
+                break
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGUSR1, previous_handler)
+        profiler.stop()
+
+    assert not profiler.running
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,121 @@
+import pytest
+import queue
+import threading
+from uuid import uuid4
+from pydantic import BaseModel
+
+from publisher.background import BackgroundPublisher, OverflowPolicy
+from publisher.service import PublisherService
+from fakes.broker import FakeBroker, FaultInjector
+
+class BackgroundMessageClass(BaseModel):
+    media_id: str
+    name: str
+
+def create_publisher_service(broker):
+    return PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource(), grouping_field="media_id")
+
+def test_publish_in_background():
+    # Setup
+    broker = FakeBroker()
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_workers=4)
+
+    # RUN
+    futures = [background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id=str(i % 5), name="test"), str(uuid4()))
+               for i in range(50)]
+    undelivered = background_publisher.close(deadline_seconds=5)
+
+    assert undelivered == 0
+    assert all(future.result() for future in futures)
+    assert background_publisher.metrics_snapshot()["published"] == 50
+    assert broker.topics["test_topic_1.fifo"].published_messages == 50
+
+def test_drop_overflow_policy():
+    # Setup
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds={"Publish": 0.2}))
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_queue_size=1, max_workers=1,
+                                               overflow_policy=OverflowPolicy.DROP)
+
+    # RUN
+    futures = [background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4()))
+               for _ in range(5)]
+    background_publisher.close(deadline_seconds=5)
+
+    assert None in futures
+    assert background_publisher.metrics.dropped == futures.count(None)
+
+def test_block_overflow_policy_timeout():
+    # Setup
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds={"Publish": 0.2}))
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_queue_size=1, max_workers=1,
+                                               block_timeout_seconds=0.01)
+
+    # RUN
+    with pytest.raises(queue.Full):
+        for _ in range(5):
+            background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4()))
+    background_publisher.close(deadline_seconds=5)
+
+def test_drain_deadline():
+    # Setup
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds={"Publish": 0.1}))
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_workers=1)
+
+    # RUN
+    futures = [background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4()))
+               for _ in range(10)]
+    undelivered = background_publisher.close(deadline_seconds=0.15)
+
+    assert undelivered > 0
+    with pytest.raises(TimeoutError):
+        futures[-1].result(timeout=1)
+
+def test_failures_are_counted():
+    # Setup
+    broker = FakeBroker()
+    broker.fault_injector.fail_next("Publish")
+    background_publisher = BackgroundPublisher(create_publisher_service(broker))
+
+    # RUN
+    future = background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4()))
+    background_publisher.close()
+
+    assert future.exception() is not None
+    assert background_publisher.metrics_snapshot()["failed"] == 1
+
+def test_queue_size_bounds_all_workers():
+    # Setup
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds={"Publish": 0.2}))
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_queue_size=4, max_workers=4,
+                                               overflow_policy=OverflowPolicy.DROP)
+
+    # RUN
+    futures = [background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4()))
+               for _ in range(20)]
+    background_publisher.close(deadline_seconds=5)
+
+    # A single group uses a single worker, which can still queue max_queue_size messages (plus the one it publishes)
+    assert 4 <= len([future for future in futures if future is not None]) <= 5
+
+def test_publish_racing_close_is_never_lost():
+    # Setup
+    broker = FakeBroker()
+    background_publisher = BackgroundPublisher(create_publisher_service(broker), max_workers=2)
+    futures = []
+    def publish_until_closed():
+        while True:
+            try:
+                futures.append(background_publisher.publish("test_topic_1.fifo", BackgroundMessageClass(media_id="1", name="test"), str(uuid4())))
+            except RuntimeError:
+                return
+
+    # RUN
+    publishers = [threading.Thread(target=publish_until_closed) for _ in range(4)]
+    for publisher in publishers:
+        publisher.start()
+    background_publisher.close(deadline_seconds=5)
+    for publisher in publishers:
+        publisher.join()
+
+    # Every accepted message was either published or failed
+    assert all(future.done() for future in futures)
@@ -0,0 +1,113 @@
+import pytest
+import json
+from uuid import uuid4
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+from publisher.batcher import BatchPublisher
+from publisher.sns_wrapper import SnsWrapper
+from fakes.broker import FakeBroker
+
+@pytest.fixture
+def broker_fixture():
+    broker = FakeBroker()
+
+    yield broker
+
+@pytest.fixture
+def sns_wrapper_fixture(broker_fixture):
+    sns_wrapper = SnsWrapper(broker_fixture.sns_resource())
+
+    yield sns_wrapper
+
+def test_flush_on_batch_size(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    topic_arn = sns_wrapper_fixture.create_topic_arn("test_topic_1.fifo")
+    batch_publisher = BatchPublisher(sns_wrapper_fixture, linger_seconds=60)
+
+    # RUN
+    futures = [batch_publisher.publish(topic_arn, f"message{i}", str(uuid4())) for i in range(25)]
+    message_ids = [future.result(timeout=2) for future in futures[:20]]
+    remaining_done = futures[20].done()
+    batch_publisher.close()
+
+    assert len(set(message_ids)) == 20
+    assert not remaining_done
+    assert all(future.done() for future in futures)
+    assert broker_fixture.calls["PublishBatch"] == 3
+
+def test_flush_on_linger(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    topic_arns = [sns_wrapper_fixture.create_topic_arn("test_topic_1.fifo"), sns_wrapper_fixture.create_topic_arn("test_topic_2.fifo")]
+    batch_publisher = BatchPublisher(sns_wrapper_fixture, linger_seconds=0.05)
+
+    # RUN
+    futures = [batch_publisher.publish(topic_arns[i % 2], f"message{i}", str(uuid4())) for i in range(4)]
+    message_ids = [future.result(timeout=2) for future in futures]
+    batch_publisher.close()
+
+    assert all(message_ids)
+    assert broker_fixture.calls["PublishBatch"] == 2
+
+def test_keeps_order_per_topic(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    topic_arn = sns_wrapper_fixture.create_topic_arn("test_topic_1.fifo")
+    queue = broker_fixture.sqs_resource().create_queue(QueueName="test_queue")
+    sns_wrapper_fixture.subscribe_arn(topic_arn, "sqs", queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic_arn}}}]})})
+    batch_publisher = BatchPublisher(sns_wrapper_fixture, max_batch_size=3, linger_seconds=0.01, max_workers=4)
+
+    # RUN
+    for i in range(10):
+        batch_publisher.publish(topic_arn, f"message{i}", str(uuid4()))
+    batch_publisher.close()
+    messages = []
+    for _ in range(2):
+        messages += queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0)
+
+    assert [json.loads(message.body)["Message"] for message in messages] == [f"message{i}" for i in range(10)]
+
+def test_failed_batch_sets_futures_errors(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    topic_arn = sns_wrapper_fixture.create_topic_arn("test_topic_1.fifo")
+    broker_fixture.fault_injector.fail_next("PublishBatch")
+    batch_publisher = BatchPublisher(sns_wrapper_fixture, linger_seconds=0.01)
+
+    # RUN
+    future = batch_publisher.publish(topic_arn, "message", str(uuid4()))
+    batch_publisher.close()
+
+    with pytest.raises(ClientError):
+        future.result()
+    with pytest.raises(RuntimeError):
+        batch_publisher.publish(topic_arn, "message", str(uuid4()))
+
+def test_flush_before_batch_bytes_limit(broker_fixture, sns_wrapper_fixture):
+    # Setup
+    topic_arn = sns_wrapper_fixture.create_topic_arn("test_topic_1.fifo")
+    batch_publisher = BatchPublisher(sns_wrapper_fixture, linger_seconds=60)
+    large_message = "x"*60*1024
+
+    # RUN
+    futures = [batch_publisher.publish(topic_arn, large_message, str(uuid4())) for _ in range(10)]
+    batch_publisher.close()
+
+    # Only 4 such messages fit in 256 KiB
+    assert all(future.result() for future in futures)
+    assert broker_fixture.calls["PublishBatch"] == 3
+
+def test_entries_missing_from_response_fail():
+    # Setup
+    sns_wrapper = MagicMock()
+    sns_wrapper.create_batch_entry = SnsWrapper.create_batch_entry
+    sns_wrapper.publish_message_batch.return_value = {"Successful": [{"Id": "0", "MessageId": "message_id_0"}]}
+    batch_publisher = BatchPublisher(sns_wrapper, linger_seconds=60)
+
+    # RUN
+    futures = [batch_publisher.publish("topic_arn", f"message{i}", str(uuid4())) for i in range(2)]
+    batch_publisher.close()
+
+    assert futures[0].result() == "message_id_0"
+    with pytest.raises(ClientError):
+        futures[1].result(timeout=1)
@@ -0,0 +1,39 @@
+import json
+from uuid import uuid4
+from pydantic import BaseModel
+
+from publisher.grouping import create_message_group_id, DEFAULT_MESSAGE_GROUP_ID
+from publisher.service import PublisherService
+from fakes.broker import FakeBroker
+
+class GroupedMessageClass(BaseModel):
+    media_id: str
+    name: str
+
+def test_create_message_group_id():
+    # RUN
+    shard_ids = {create_message_group_id(str(uuid4()), shard_count=4) for _ in range(200)}
+
+    assert create_message_group_id() == DEFAULT_MESSAGE_GROUP_ID
+    assert create_message_group_id("media_1") == "media_1"
+    assert create_message_group_id("media_1", shard_count=4) == create_message_group_id("media_1", shard_count=4)
+    assert shard_ids == {f"shard-{index}" for index in range(4)}
+    assert len(create_message_group_id("a"*300)) <= 128
+
+def test_publish_groups_by_field():
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource(), grouping_field="media_id")
+    queue = broker.sqs_resource().create_queue(QueueName="test_queue.fifo", Attributes={"FifoQueue": "True"})
+    topic = publisher_service.topics["test_topic_1.fifo"]
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+
+    # RUN
+    for media_id in ["media_1", "media_2", "media_1"]:
+        message = GroupedMessageClass(media_id=media_id, name="test")
+        publisher_service.publish("test_topic_1.fifo", message, str(uuid4()))
+    publisher_service.publish("test_topic_1.fifo", GroupedMessageClass(media_id="media_3", name="test"), str(uuid4()), grouping_key="user_1")
+    messages = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0, AttributeNames=["MessageGroupId"])
+
+    assert [message.attributes["MessageGroupId"] for message in messages] == ["media_1", "media_2", "media_1", "user_1"]
@@ -0,0 +1,88 @@
+import pytest
+import json
+import time
+
+from publisher.outbox import SqliteOutbox, OutboxRelay, OutboxEvent
+from publisher.service import PublisherService
+from fakes.broker import FakeBroker
+
+@pytest.fixture
+def outbox_fixture(tmp_path):
+    outbox = SqliteOutbox(str(tmp_path / "outbox.db"))
+
+    yield outbox
+
+    outbox.close()
+
+def create_events(*event_ids):
+    return [OutboxEvent(event_id=event_id, topic_id="test_topic_1.fifo", payload=json.dumps({"id": event_id}), grouping_key="media_1")
+            for event_id in event_ids]
+
+def bind_test_queue(broker, publisher_service):
+    queue = broker.sqs_resource().create_queue(QueueName="test_queue")
+    topic = publisher_service.topics["test_topic_1.fifo"]
+    topic.subscribe(Protocol="sqs", Endpoint=queue.attributes["QueueArn"])
+    queue.set_attributes(Attributes={"Policy": json.dumps({"Statement": [{"Effect": "Allow", "Condition": {"ArnLike": {"aws:SourceArn": topic.arn}}}]})})
+    return queue
+
+def test_only_committed_events_are_ready(outbox_fixture):
+    # RUN
+    committed_batch = outbox_fixture.stage(create_events("a", "b"))
+    discarded_batch = outbox_fixture.stage(create_events("c"))
+    outbox_fixture.stage(create_events("d"))
+    outbox_fixture.commit(committed_batch)
+    outbox_fixture.discard(discarded_batch)
+
+    assert [event.event_id for event in outbox_fixture.fetch_ready(10)] == ["a", "b"]
+    assert [[event.event_id for event in events] for events in outbox_fixture.staged_batches().values()] == [["d"]]
+
+def test_outbox_survives_restart(tmp_path):
+    # Setup
+    database_location = str(tmp_path / "outbox.db")
+    outbox = SqliteOutbox(database_location)
+    outbox.commit(outbox.stage(create_events("a")))
+    outbox.stage(create_events("b"))
+    outbox.close()
+
+    # RUN
+    restarted_outbox = SqliteOutbox(database_location)
+
+    assert restarted_outbox.pending_count() == 1
+    assert len(restarted_outbox.staged_batches()) == 1
+    restarted_outbox.close()
+
+def test_relay_publishes_in_order(outbox_fixture):
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource())
+    queue = bind_test_queue(broker, publisher_service)
+    outbox_fixture.commit(outbox_fixture.stage(create_events(*[str(i) for i in range(5)])))
+    outbox_relay = OutboxRelay(outbox_fixture, publisher_service, batch_size=2, poll_interval_seconds=0.01)
+
+    # RUN
+    outbox_relay.start()
+    test_start = time.perf_counter()
+    while outbox_fixture.pending_count() > 0 and time.perf_counter() - test_start < 5:
+        time.sleep(0.01)
+    outbox_relay.close(timeout=5)
+    messages = queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0)
+
+    assert outbox_relay.published == 5
+    assert [json.loads(json.loads(message.body)["Message"])["id"] for message in messages] == [str(i) for i in range(5)]
+
+def test_relay_stops_at_failure(outbox_fixture):
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource())
+    outbox_fixture.commit(outbox_fixture.stage(create_events("a", "b", "c")))
+    outbox_relay = OutboxRelay(outbox_fixture, publisher_service)
+    publisher_service.publish_payload("test_topic_1.fifo", "{}", "warm_up")
+    broker.fault_injector.fail_next("Publish")
+
+    # RUN
+    failed_result = outbox_relay.relay_once()
+    retry_result = outbox_relay.relay_once()
+
+    assert failed_result == -1
+    assert retry_result == 3
+    assert outbox_fixture.pending_count() == 0
@@ -5,15 +5,22 @@ import pytest
 from uuid import uuid4
 
 from publisher.service import PublisherService
+from fakes.broker import FakeBroker
 
 @pytest.fixture(scope="module")
-def publisher_service_fixture():
-    publisher_service = PublisherService(topic_names=["test_topic_1.fifo","test_topic_2.fifo"])
+def broker_fixture():
+    broker = FakeBroker()
+
+    yield broker
+
+@pytest.fixture(scope="module")
+def publisher_service_fixture(broker_fixture):
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo","test_topic_2.fifo"], sns_resource=broker_fixture.sns_resource())
 
     yield publisher_service
 
 
-def test_publish_text_message(publisher_service_fixture):
+def test_publish_text_message(publisher_service_fixture, broker_fixture):
     # Setup
 
     class TestMessageClass(BaseModel):
@@ -26,3 +33,23 @@ def test_publish_text_message(publisher_service_fixture):
         topic_id = (list)(publisher_service_fixture.topics.keys())[topic_index]
         value = publisher_service_fixture.publish(topic_id, message, message.media_id)
         logger.info(value)
+
+    assert sum(topic.published_messages for topic in broker_fixture.topics.values()) == 100
+
+def test_publish_batched(broker_fixture):
+    # Setup
+    class TestMessageClass(BaseModel):
+        media_id: str
+        name: str
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo","test_topic_2.fifo"], sns_resource=broker_fixture.sns_resource(),
+                                         batch_linger_seconds=0.01)
+
+    # RUN
+    futures = []
+    for i in range(100):
+        message = TestMessageClass(media_id=str(uuid4()), name=f"MediaNumber{i}")
+        topic_id = (list)(publisher_service.topics.keys())[i % 2]
+        futures.append(publisher_service.publish_batched(topic_id, message, message.media_id))
+    publisher_service.close()
+
+    assert all(future.result() for future in futures)
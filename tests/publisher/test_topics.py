@@ -0,0 +1,85 @@
+import pytest
+import time
+import json
+from uuid import uuid4
+from pydantic import BaseModel
+
+from botocore.exceptions import ClientError
+
+from publisher.service import PublisherService
+from publisher.sns_wrapper import SnsWrapper
+from publisher.topics import TopicRegistry
+from fakes.broker import FakeBroker, FaultInjector
+
+class TopicMessageClass(BaseModel):
+    media_id: str
+
+def test_topics_resolved_on_first_use():
+    # Setup
+    broker = FakeBroker()
+
+    # RUN
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo", "test_topic_2.fifo"], sns_resource=broker.sns_resource())
+    calls_after_init = broker.calls["CreateTopic"]
+    publisher_service.publish("test_topic_1.fifo", TopicMessageClass(media_id="1"), str(uuid4()))
+    publisher_service.publish("test_topic_1.fifo", TopicMessageClass(media_id="2"), str(uuid4()))
+
+    assert calls_after_init == 0
+    assert broker.calls["CreateTopic"] == 1
+    assert "test_topic_2.fifo" in publisher_service.topics
+    assert list(publisher_service.topics.keys()) == ["test_topic_1.fifo", "test_topic_2.fifo"]
+    assert broker.calls["CreateTopic"] == 1
+
+def test_disk_cache_round_trip(tmp_path):
+    # Setup
+    broker = FakeBroker()
+    cache_location = str(tmp_path / "topics.json")
+    TopicRegistry(["test_topic_1.fifo"], lambda: SnsWrapper(broker.sns_resource()), cache_location=cache_location).warm_up()
+    broker.calls.clear()
+
+    # RUN
+    restarted_registry = TopicRegistry(["test_topic_1.fifo", "test_topic_2.fifo"], lambda: SnsWrapper(broker.sns_resource()), cache_location=cache_location)
+    topic_arn = restarted_registry.resolve_arn("test_topic_1.fifo")
+
+    assert topic_arn == broker.topics["test_topic_1.fifo"].arn
+    assert broker.calls["CreateTopic"] == 0
+    with open(cache_location) as cache_file:
+        assert list(json.load(cache_file)) == ["test_topic_1.fifo"]
+
+def test_corrupted_disk_cache(tmp_path):
+    # Setup
+    broker = FakeBroker()
+    cache_location = tmp_path / "topics.json"
+    cache_location.write_text("not a json")
+
+    # RUN
+    registry = TopicRegistry(["test_topic_1.fifo"], lambda: SnsWrapper(broker.sns_resource()), cache_location=str(cache_location))
+
+    assert registry.resolve_arn("test_topic_1.fifo") == broker.topics["test_topic_1.fifo"].arn
+
+def test_warm_up_resolves_concurrently():
+    # Setup
+    broker = FakeBroker(fault_injector=FaultInjector(latency_seconds={"CreateTopic": 0.1}))
+    topic_names = [f"test_topic_{i}.fifo" for i in range(8)]
+
+    # RUN
+    test_start = time.perf_counter()
+    PublisherService(topic_names=topic_names, sns_resource=broker.sns_resource(), warm_start=True)
+    test_duration = time.perf_counter() - test_start
+
+    assert broker.calls["CreateTopic"] == 8
+    assert test_duration < 0.5
+
+def test_deleted_topic_is_not_recreated():
+    # Setup
+    broker = FakeBroker()
+    publisher_service = PublisherService(topic_names=["test_topic_1.fifo"], sns_resource=broker.sns_resource())
+    publisher_service.publish("test_topic_1.fifo", TopicMessageClass(media_id="1"), str(uuid4()))
+    broker.sns_resource().Topic(publisher_service.topics.resolve_arn("test_topic_1.fifo")).delete()
+
+    # RUN
+    with pytest.raises(ClientError):
+        publisher_service.publish("test_topic_1.fifo", TopicMessageClass(media_id="2"), str(uuid4()))
+
+    assert "test_topic_1.fifo" not in broker.topics
+    assert "test_topic_1.fifo" not in publisher_service.topics.topic_arns